@@ -0,0 +1,61 @@
+-- Baseline (SQLite): the SQL Server schema through sqlserver/0002, for local
+-- runs, benchmarks and CI. Dates are ISO-8601 TEXT.
+
+CREATE TABLE IF NOT EXISTS companies (
+    company_number TEXT PRIMARY KEY,
+    company_name TEXT NOT NULL,
+    company_status TEXT,
+    incorporation_date TEXT,
+    company_type TEXT,
+    content_hash INTEGER,
+    first_seen_run_id INTEGER,
+    last_seen_run_id INTEGER,
+    last_seen_at TEXT,
+    created_at TEXT DEFAULT CURRENT_TIMESTAMP
+);
+
+CREATE TABLE IF NOT EXISTS company_addresses (
+    address_id INTEGER PRIMARY KEY AUTOINCREMENT,
+    company_number TEXT NOT NULL REFERENCES companies(company_number),
+    locality TEXT,
+    region TEXT,
+    postal_code TEXT,
+    country TEXT
+);
+
+CREATE TABLE IF NOT EXISTS sic_codes (
+    sic_code TEXT PRIMARY KEY,
+    description TEXT
+);
+
+CREATE TABLE IF NOT EXISTS company_sic (
+    company_number TEXT NOT NULL REFERENCES companies(company_number),
+    sic_code TEXT NOT NULL REFERENCES sic_codes(sic_code),
+    PRIMARY KEY (company_number, sic_code)
+);
+
+CREATE TABLE IF NOT EXISTS company_profiles (
+    company_number TEXT PRIMARY KEY REFERENCES companies(company_number),
+    accounts_next_due TEXT,
+    accounts_last_made_up_to TEXT,
+    accounts_overdue INTEGER,
+    previous_names TEXT,
+    sic_codes TEXT,
+    fetched_at TEXT DEFAULT CURRENT_TIMESTAMP
+);
+
+CREATE TABLE IF NOT EXISTS ingestion_log (
+    run_id INTEGER PRIMARY KEY AUTOINCREMENT,
+    run_timestamp TEXT DEFAULT CURRENT_TIMESTAMP,
+    records_inserted INTEGER,
+    source TEXT,
+    status TEXT
+);
+
+CREATE TABLE IF NOT EXISTS ingestion_checkpoint (
+    run_id INTEGER PRIMARY KEY REFERENCES ingestion_log(run_id),
+    cursor_key TEXT NOT NULL,
+    start_index INTEGER NOT NULL,
+    records_committed INTEGER NOT NULL,
+    updated_at TEXT DEFAULT CURRENT_TIMESTAMP
+);
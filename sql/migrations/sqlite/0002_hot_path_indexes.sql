@@ -0,0 +1,22 @@
+-- Covering indexes for the ingest and export hot paths. SQLite has no
+-- INCLUDE, so the selected columns are trailing key columns instead.
+
+-- export_month_companies_csv: incorporation_date range, newest first
+CREATE INDEX IF NOT EXISTS ix_companies_incorporation_date
+    ON companies (incorporation_date DESC, company_number, company_name, company_status);
+
+-- export_month_companies_csv: company_sic filtered on sic_code IN (...)
+CREATE INDEX IF NOT EXISTS ix_company_sic_sic_code
+    ON company_sic (sic_code, company_number);
+
+-- Both exports' join to company_addresses and the writers' per-company delete
+CREATE INDEX IF NOT EXISTS ix_company_addresses_company_number
+    ON company_addresses (company_number, locality, region, postal_code, country);
+
+-- export_new_companies_csv: first_seen_run_id = ?, ordered by incorporation_date
+CREATE INDEX IF NOT EXISTS ix_companies_first_seen_run_id
+    ON companies (first_seen_run_id, incorporation_date DESC, company_name, company_status);
+
+-- Resume and enrichment: companies touched by a run
+CREATE INDEX IF NOT EXISTS ix_companies_last_seen_run_id
+    ON companies (last_seen_run_id);
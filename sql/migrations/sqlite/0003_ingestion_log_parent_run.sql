@@ -0,0 +1,6 @@
+-- Sharded backfills log one child run per shard under a parent run.
+
+ALTER TABLE ingestion_log ADD COLUMN parent_run_id INTEGER REFERENCES ingestion_log(run_id);
+
+CREATE INDEX IF NOT EXISTS ix_ingestion_log_parent_run_id
+    ON ingestion_log (parent_run_id, source, status, records_inserted);
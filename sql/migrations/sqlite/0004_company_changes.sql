@@ -0,0 +1,14 @@
+-- Change log written alongside every company upsert: one row per company
+-- per write, 'new' or 'update' with the comma-separated changed fields.
+
+CREATE TABLE IF NOT EXISTS company_changes (
+    change_id INTEGER PRIMARY KEY AUTOINCREMENT,
+    run_id INTEGER REFERENCES ingestion_log(run_id),
+    company_number TEXT NOT NULL,
+    change_type TEXT NOT NULL,
+    changed_fields TEXT,
+    changed_at TEXT DEFAULT CURRENT_TIMESTAMP
+);
+
+CREATE INDEX IF NOT EXISTS ix_company_changes_run_id
+    ON company_changes (run_id, change_id, company_number, change_type, changed_fields);
@@ -0,0 +1,6 @@
+-- SIC 2007 hierarchy on the reference table: every level (section letter,
+-- division, group, class, subclass) is a row, linked to its parent.
+
+ALTER TABLE sic_codes ADD COLUMN level TEXT;
+ALTER TABLE sic_codes ADD COLUMN parent_code TEXT;
+ALTER TABLE sic_codes ADD COLUMN section TEXT;
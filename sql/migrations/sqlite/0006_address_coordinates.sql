@@ -0,0 +1,14 @@
+-- Registered office coordinates from the postcode centroid index
+-- (python -m src.ingest.postcode_geo geocode), for radius queries.
+
+ALTER TABLE company_addresses ADD COLUMN latitude REAL;
+ALTER TABLE company_addresses ADD COLUMN longitude REAL;
+
+-- companies_near: bounding-box range on latitude, longitude checked in the index
+CREATE INDEX IF NOT EXISTS ix_company_addresses_lat_lon
+    ON company_addresses (latitude, longitude, company_number, postal_code);
+
+-- geocode_addresses: only the rows still waiting for coordinates
+CREATE INDEX IF NOT EXISTS ix_company_addresses_ungeocoded
+    ON company_addresses (address_id, postal_code)
+    WHERE latitude IS NULL;
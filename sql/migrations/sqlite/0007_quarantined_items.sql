@@ -0,0 +1,14 @@
+-- Items rejected by src/validation/page_validation.py, kept whole with the
+-- rules they failed so they can be inspected and replayed.
+
+CREATE TABLE IF NOT EXISTS quarantined_items (
+    quarantine_id INTEGER PRIMARY KEY AUTOINCREMENT,
+    run_id INTEGER REFERENCES ingestion_log(run_id),
+    company_number TEXT,
+    reasons TEXT NOT NULL,
+    payload TEXT NOT NULL,
+    quarantined_at TEXT DEFAULT CURRENT_TIMESTAMP
+);
+
+CREATE INDEX IF NOT EXISTS ix_quarantined_items_run_id
+    ON quarantined_items (run_id, company_number, reasons);
@@ -0,0 +1,5 @@
+-- Export cache data version: latest change among a month's companies
+-- (companies by incorporation_date, then their newest company_changes row).
+
+CREATE INDEX IF NOT EXISTS ix_company_changes_company_number
+    ON company_changes (company_number, change_id, run_id);
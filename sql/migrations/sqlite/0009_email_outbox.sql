@@ -0,0 +1,20 @@
+-- Outgoing email, queued in the run's transaction and delivered afterwards
+-- by src/notifications/outbox.py. One row per recipient and attachment.
+
+CREATE TABLE IF NOT EXISTS email_outbox (
+    message_id INTEGER PRIMARY KEY AUTOINCREMENT,
+    run_id INTEGER REFERENCES ingestion_log(run_id),
+    recipient TEXT NOT NULL,
+    subject TEXT NOT NULL,
+    body TEXT NOT NULL,
+    attachment_path TEXT,
+    status TEXT NOT NULL DEFAULT 'pending',
+    attempts INTEGER NOT NULL DEFAULT 0,
+    next_attempt_at TEXT NOT NULL,
+    last_error TEXT,
+    created_at TEXT DEFAULT CURRENT_TIMESTAMP,
+    sent_at TEXT
+);
+
+CREATE INDEX IF NOT EXISTS ix_email_outbox_due
+    ON email_outbox (status, next_attempt_at, message_id);
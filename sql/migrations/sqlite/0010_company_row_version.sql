@@ -0,0 +1,12 @@
+-- Row version bumped by upsert_companies whenever a company's content_hash
+-- changes, with or without the change log. The export cache stamps a month
+-- with the count, sum and max of its companies' versions.
+
+ALTER TABLE companies ADD COLUMN row_version INTEGER NOT NULL DEFAULT 0;
+
+-- upsert_companies: next version is MAX(row_version) + 1
+CREATE INDEX IF NOT EXISTS ix_companies_row_version
+    ON companies (row_version);
+
+-- The cache no longer reads company_changes by company
+DROP INDEX IF EXISTS ix_company_changes_company_number;
@@ -0,0 +1,10 @@
+-- Run that last changed each company's content (set by upsert_companies
+-- with the row_version bump) and the incorporation_date it had before that
+-- run, so the Parquet export can refresh a run's months, old and new,
+-- without the change log.
+
+ALTER TABLE companies ADD COLUMN changed_run_id INTEGER NULL;
+ALTER TABLE companies ADD COLUMN prev_incorporation_date DATE NULL;
+
+CREATE INDEX IF NOT EXISTS ix_companies_changed_run_id
+    ON companies (changed_run_id);
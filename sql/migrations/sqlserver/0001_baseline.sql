@@ -0,0 +1,76 @@
+-- Baseline: the tables from the original sql/schema.sql, plus company_profiles
+-- and ingestion_checkpoint. Guarded so it can be recorded against a database
+-- that was created by hand from schema.sql.
+
+IF OBJECT_ID('dbo.companies') IS NULL
+CREATE TABLE dbo.companies (
+    company_number VARCHAR(20) PRIMARY KEY,
+    company_name NVARCHAR(255) NOT NULL,
+    company_status VARCHAR(50),
+    incorporation_date DATE,
+    company_type VARCHAR(50),
+    created_at DATETIME2 DEFAULT SYSDATETIME()
+);
+
+IF OBJECT_ID('dbo.company_addresses') IS NULL
+CREATE TABLE dbo.company_addresses (
+    address_id INT IDENTITY(1,1) PRIMARY KEY,
+    company_number VARCHAR(20) NOT NULL,
+    locality NVARCHAR(100),
+    region NVARCHAR(100),
+    postal_code VARCHAR(20),
+    country VARCHAR(50),
+    CONSTRAINT fk_address_company
+        FOREIGN KEY (company_number)
+        REFERENCES dbo.companies(company_number)
+);
+
+IF OBJECT_ID('dbo.sic_codes') IS NULL
+CREATE TABLE dbo.sic_codes (
+    sic_code VARCHAR(10) PRIMARY KEY,
+    description NVARCHAR(255)
+);
+
+IF OBJECT_ID('dbo.company_sic') IS NULL
+CREATE TABLE dbo.company_sic (
+    company_number VARCHAR(20) NOT NULL,
+    sic_code VARCHAR(10) NOT NULL,
+    CONSTRAINT pk_company_sic PRIMARY KEY (company_number, sic_code),
+    CONSTRAINT fk_cs_company FOREIGN KEY (company_number)
+        REFERENCES dbo.companies(company_number),
+    CONSTRAINT fk_cs_sic FOREIGN KEY (sic_code)
+        REFERENCES dbo.sic_codes(sic_code)
+);
+
+IF OBJECT_ID('dbo.company_profiles') IS NULL
+CREATE TABLE dbo.company_profiles (
+    company_number VARCHAR(20) PRIMARY KEY,
+    accounts_next_due DATE,
+    accounts_last_made_up_to DATE,
+    accounts_overdue BIT,
+    previous_names NVARCHAR(MAX),
+    sic_codes VARCHAR(100),
+    fetched_at DATETIME2 DEFAULT SYSUTCDATETIME(),
+    CONSTRAINT fk_profile_company FOREIGN KEY (company_number)
+        REFERENCES dbo.companies(company_number)
+);
+
+IF OBJECT_ID('dbo.ingestion_log') IS NULL
+CREATE TABLE dbo.ingestion_log (
+    run_id INT IDENTITY(1,1) PRIMARY KEY,
+    run_timestamp DATETIME2 DEFAULT SYSDATETIME(),
+    records_inserted INT,
+    source VARCHAR(100),
+    status VARCHAR(20)
+);
+
+IF OBJECT_ID('dbo.ingestion_checkpoint') IS NULL
+CREATE TABLE dbo.ingestion_checkpoint (
+    run_id INT PRIMARY KEY,
+    cursor_key NVARCHAR(200) NOT NULL,
+    start_index INT NOT NULL,
+    records_committed INT NOT NULL,
+    updated_at DATETIME2 DEFAULT SYSUTCDATETIME(),
+    CONSTRAINT fk_checkpoint_run FOREIGN KEY (run_id)
+        REFERENCES dbo.ingestion_log(run_id)
+);
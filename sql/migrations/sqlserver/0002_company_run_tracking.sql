@@ -0,0 +1,14 @@
+-- Columns the writers have been setting all along: the fingerprint used to
+-- skip unchanged companies, and first/last-seen run tracking.
+
+IF COL_LENGTH('dbo.companies', 'content_hash') IS NULL
+    ALTER TABLE dbo.companies ADD content_hash BIGINT NULL;
+
+IF COL_LENGTH('dbo.companies', 'first_seen_run_id') IS NULL
+    ALTER TABLE dbo.companies ADD first_seen_run_id INT NULL;
+
+IF COL_LENGTH('dbo.companies', 'last_seen_run_id') IS NULL
+    ALTER TABLE dbo.companies ADD last_seen_run_id INT NULL;
+
+IF COL_LENGTH('dbo.companies', 'last_seen_at') IS NULL
+    ALTER TABLE dbo.companies ADD last_seen_at DATETIME2 NULL;
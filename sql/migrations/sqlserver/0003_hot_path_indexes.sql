@@ -0,0 +1,37 @@
+-- Covering indexes for the ingest and export hot paths.
+
+-- export_month_companies_csv: incorporation_date range, newest first.
+-- Carries the selected company columns so the range is a single seek.
+IF NOT EXISTS (SELECT 1 FROM sys.indexes WHERE name = 'ix_companies_incorporation_date'
+               AND object_id = OBJECT_ID('dbo.companies'))
+    CREATE INDEX ix_companies_incorporation_date
+        ON dbo.companies (incorporation_date DESC)
+        INCLUDE (company_name, company_status);
+
+-- export_month_companies_csv: company_sic filtered on sic_code IN (...).
+-- The primary key leads with company_number, so it cannot serve this.
+IF NOT EXISTS (SELECT 1 FROM sys.indexes WHERE name = 'ix_company_sic_sic_code'
+               AND object_id = OBJECT_ID('dbo.company_sic'))
+    CREATE INDEX ix_company_sic_sic_code
+        ON dbo.company_sic (sic_code, company_number);
+
+-- Both exports' LEFT JOIN to company_addresses, and the writers' delete of a
+-- batch's existing address rows (previously a scan of the heap-ordered table).
+IF NOT EXISTS (SELECT 1 FROM sys.indexes WHERE name = 'ix_company_addresses_company_number'
+               AND object_id = OBJECT_ID('dbo.company_addresses'))
+    CREATE INDEX ix_company_addresses_company_number
+        ON dbo.company_addresses (company_number)
+        INCLUDE (locality, region, postal_code, country);
+
+-- export_new_companies_csv: first_seen_run_id = ?, ordered by incorporation_date.
+IF NOT EXISTS (SELECT 1 FROM sys.indexes WHERE name = 'ix_companies_first_seen_run_id'
+               AND object_id = OBJECT_ID('dbo.companies'))
+    CREATE INDEX ix_companies_first_seen_run_id
+        ON dbo.companies (first_seen_run_id, incorporation_date DESC)
+        INCLUDE (company_name, company_status);
+
+-- Resume and enrichment: companies touched by a run (last_seen_run_id = ?).
+IF NOT EXISTS (SELECT 1 FROM sys.indexes WHERE name = 'ix_companies_last_seen_run_id'
+               AND object_id = OBJECT_ID('dbo.companies'))
+    CREATE INDEX ix_companies_last_seen_run_id
+        ON dbo.companies (last_seen_run_id);
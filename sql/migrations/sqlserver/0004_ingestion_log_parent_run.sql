@@ -0,0 +1,13 @@
+-- Sharded backfills log one child run per shard under a parent run.
+
+IF COL_LENGTH('dbo.ingestion_log', 'parent_run_id') IS NULL
+    ALTER TABLE dbo.ingestion_log ADD parent_run_id INT NULL
+        CONSTRAINT fk_ingestion_log_parent FOREIGN KEY REFERENCES dbo.ingestion_log(run_id);
+
+GO
+
+IF NOT EXISTS (SELECT 1 FROM sys.indexes WHERE name = 'ix_ingestion_log_parent_run_id'
+               AND object_id = OBJECT_ID('dbo.ingestion_log'))
+    CREATE INDEX ix_ingestion_log_parent_run_id
+        ON dbo.ingestion_log (parent_run_id)
+        INCLUDE (source, status, records_inserted);
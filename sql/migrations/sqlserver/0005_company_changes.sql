@@ -0,0 +1,23 @@
+-- Change log written alongside every company upsert: one row per company
+-- per write, 'new' or 'update' with the comma-separated changed fields.
+
+IF OBJECT_ID('dbo.company_changes') IS NULL
+CREATE TABLE dbo.company_changes (
+    change_id BIGINT IDENTITY(1,1) PRIMARY KEY,
+    run_id INT NULL,
+    company_number VARCHAR(20) NOT NULL,
+    change_type VARCHAR(10) NOT NULL,       -- 'new' | 'update'
+    changed_fields VARCHAR(200) NULL,       -- e.g. 'company_status,address'; NULL for 'new'
+    changed_at DATETIME2 DEFAULT SYSUTCDATETIME(),
+    CONSTRAINT fk_change_run FOREIGN KEY (run_id)
+        REFERENCES dbo.ingestion_log(run_id)
+);
+
+GO
+
+-- Delta export: run_id > ?, in change_id order
+IF NOT EXISTS (SELECT 1 FROM sys.indexes WHERE name = 'ix_company_changes_run_id'
+               AND object_id = OBJECT_ID('dbo.company_changes'))
+    CREATE INDEX ix_company_changes_run_id
+        ON dbo.company_changes (run_id, change_id)
+        INCLUDE (company_number, change_type, changed_fields);
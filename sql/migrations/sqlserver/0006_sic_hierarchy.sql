@@ -0,0 +1,11 @@
+-- SIC 2007 hierarchy on the reference table: every level (section letter,
+-- division, group, class, subclass) is a row, linked to its parent.
+
+IF COL_LENGTH('dbo.sic_codes', 'level') IS NULL
+    ALTER TABLE dbo.sic_codes ADD level VARCHAR(10) NULL;
+
+IF COL_LENGTH('dbo.sic_codes', 'parent_code') IS NULL
+    ALTER TABLE dbo.sic_codes ADD parent_code VARCHAR(10) NULL;
+
+IF COL_LENGTH('dbo.sic_codes', 'section') IS NULL
+    ALTER TABLE dbo.sic_codes ADD section CHAR(1) NULL;
@@ -0,0 +1,24 @@
+-- Registered office coordinates from the postcode centroid index
+-- (python -m src.ingest.postcode_geo geocode), for radius queries.
+
+IF COL_LENGTH('dbo.company_addresses', 'latitude') IS NULL
+    ALTER TABLE dbo.company_addresses ADD latitude FLOAT NULL;
+
+IF COL_LENGTH('dbo.company_addresses', 'longitude') IS NULL
+    ALTER TABLE dbo.company_addresses ADD longitude FLOAT NULL;
+GO
+
+-- companies_near: bounding-box range on latitude, longitude checked in the index
+IF NOT EXISTS (SELECT 1 FROM sys.indexes WHERE name = 'ix_company_addresses_lat_lon'
+               AND object_id = OBJECT_ID('dbo.company_addresses'))
+    CREATE INDEX ix_company_addresses_lat_lon
+        ON dbo.company_addresses (latitude, longitude)
+        INCLUDE (company_number, postal_code);
+
+-- geocode_addresses: only the rows still waiting for coordinates
+IF NOT EXISTS (SELECT 1 FROM sys.indexes WHERE name = 'ix_company_addresses_ungeocoded'
+               AND object_id = OBJECT_ID('dbo.company_addresses'))
+    CREATE INDEX ix_company_addresses_ungeocoded
+        ON dbo.company_addresses (address_id)
+        INCLUDE (postal_code)
+        WHERE latitude IS NULL;
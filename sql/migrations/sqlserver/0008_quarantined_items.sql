@@ -0,0 +1,22 @@
+-- Items rejected by src/validation/page_validation.py, kept whole with the
+-- rules they failed so they can be inspected and replayed.
+
+IF OBJECT_ID('dbo.quarantined_items') IS NULL
+CREATE TABLE dbo.quarantined_items (
+    quarantine_id BIGINT IDENTITY(1,1) PRIMARY KEY,
+    run_id INT NULL,
+    company_number VARCHAR(20) NULL,
+    reasons VARCHAR(400) NOT NULL,          -- e.g. 'bad_date_of_creation,bad_postal_code'
+    payload NVARCHAR(MAX) NOT NULL,         -- the search item as JSON
+    quarantined_at DATETIME2 DEFAULT SYSUTCDATETIME(),
+    CONSTRAINT fk_quarantine_run FOREIGN KEY (run_id)
+        REFERENCES dbo.ingestion_log(run_id)
+);
+
+GO
+
+IF NOT EXISTS (SELECT 1 FROM sys.indexes WHERE name = 'ix_quarantined_items_run_id'
+               AND object_id = OBJECT_ID('dbo.quarantined_items'))
+    CREATE INDEX ix_quarantined_items_run_id
+        ON dbo.quarantined_items (run_id)
+        INCLUDE (company_number, reasons);
@@ -0,0 +1,8 @@
+-- Export cache data version: latest change among a month's companies
+-- (companies by incorporation_date, then their newest company_changes row).
+
+IF NOT EXISTS (SELECT 1 FROM sys.indexes WHERE name = 'ix_company_changes_company_number'
+               AND object_id = OBJECT_ID('dbo.company_changes'))
+    CREATE INDEX ix_company_changes_company_number
+        ON dbo.company_changes (company_number, change_id)
+        INCLUDE (run_id);
@@ -0,0 +1,28 @@
+-- Outgoing email, queued in the run's transaction and delivered afterwards
+-- by src/notifications/outbox.py. One row per recipient and attachment.
+
+IF OBJECT_ID('dbo.email_outbox') IS NULL
+CREATE TABLE dbo.email_outbox (
+    message_id BIGINT IDENTITY(1,1) PRIMARY KEY,
+    run_id INT NULL,
+    recipient NVARCHAR(320) NOT NULL,
+    subject NVARCHAR(400) NOT NULL,
+    body NVARCHAR(MAX) NOT NULL,
+    attachment_path NVARCHAR(500) NULL,
+    status VARCHAR(10) NOT NULL DEFAULT 'pending',  -- 'pending' | 'sending' | 'sent' | 'failed'
+    attempts INT NOT NULL DEFAULT 0,
+    next_attempt_at DATETIME2 NOT NULL,             -- UTC; for 'sending', when the claim lapses
+    last_error NVARCHAR(1000) NULL,
+    created_at DATETIME2 DEFAULT SYSUTCDATETIME(),
+    sent_at DATETIME2 NULL,
+    CONSTRAINT fk_outbox_run FOREIGN KEY (run_id)
+        REFERENCES dbo.ingestion_log(run_id)
+);
+
+GO
+
+IF NOT EXISTS (SELECT 1 FROM sys.indexes WHERE name = 'ix_email_outbox_due'
+               AND object_id = OBJECT_ID('dbo.email_outbox'))
+    CREATE INDEX ix_email_outbox_due
+        ON dbo.email_outbox (status, next_attempt_at)
+        INCLUDE (attempts);
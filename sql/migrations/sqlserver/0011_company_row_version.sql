@@ -0,0 +1,18 @@
+-- Row version bumped by upsert_companies whenever a company's content_hash
+-- changes, with or without the change log. The export cache stamps a month
+-- with the count, sum and max of its companies' versions. Versions come from
+-- a sequence so concurrent writers never wait on each other for one.
+
+IF COL_LENGTH('dbo.companies', 'row_version') IS NULL
+    ALTER TABLE dbo.companies ADD row_version BIGINT NOT NULL
+        CONSTRAINT df_companies_row_version DEFAULT 0;
+GO
+
+IF OBJECT_ID('dbo.company_row_version', 'SO') IS NULL
+    CREATE SEQUENCE dbo.company_row_version AS BIGINT START WITH 1 INCREMENT BY 1;
+GO
+
+-- The cache no longer reads company_changes by company
+IF EXISTS (SELECT 1 FROM sys.indexes WHERE name = 'ix_company_changes_company_number'
+           AND object_id = OBJECT_ID('dbo.company_changes'))
+    DROP INDEX ix_company_changes_company_number ON dbo.company_changes;
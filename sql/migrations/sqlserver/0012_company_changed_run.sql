@@ -0,0 +1,18 @@
+-- Run that last changed each company's content (set by upsert_companies
+-- with the row_version bump) and the incorporation_date it had before that
+-- run, so the Parquet export can refresh a run's months, old and new,
+-- without the change log.
+
+IF COL_LENGTH('dbo.companies', 'changed_run_id') IS NULL
+    ALTER TABLE dbo.companies ADD changed_run_id INT NULL;
+GO
+
+IF COL_LENGTH('dbo.companies', 'prev_incorporation_date') IS NULL
+    ALTER TABLE dbo.companies ADD prev_incorporation_date DATE NULL;
+GO
+
+IF NOT EXISTS (SELECT 1 FROM sys.indexes WHERE name = 'ix_companies_changed_run_id'
+               AND object_id = OBJECT_ID('dbo.companies'))
+    CREATE INDEX ix_companies_changed_run_id
+        ON dbo.companies (changed_run_id)
+        INCLUDE (incorporation_date, prev_incorporation_date);
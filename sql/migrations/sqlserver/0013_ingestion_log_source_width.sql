@@ -0,0 +1,5 @@
+-- Run notes (source) carry the geography and SIC filters and outgrew
+-- VARCHAR(100); start_run now caps them at 400 characters.
+
+IF COL_LENGTH('dbo.ingestion_log', 'source') < 400
+    ALTER TABLE dbo.ingestion_log ALTER COLUMN source VARCHAR(400) NULL;
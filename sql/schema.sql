@@ -1,5 +1,9 @@
 -- Companies House Market Intelligence Schema
 -- Core design
+--
+-- Reference snapshot of the current schema. Databases are created and
+-- upgraded with the versioned scripts in sql/migrations/<backend>/
+-- (python -m src.db.migrate); add a migration for any change here.
 
 CREATE TABLE companies (
     company_number VARCHAR(20) PRIMARY KEY,
@@ -7,9 +11,18 @@ CREATE TABLE companies (
     company_status VARCHAR(50),
     incorporation_date DATE,
     company_type VARCHAR(50),
+    content_hash BIGINT,            -- fingerprint of the written fields, see src/ingest/fingerprints.py
+    first_seen_run_id INT,          -- ingestion_log.run_id that first wrote the company
+    last_seen_run_id INT,
+    last_seen_at DATETIME2,
+    row_version BIGINT NOT NULL DEFAULT 0,  -- from dbo.company_row_version, bumped when content_hash changes
+    changed_run_id INT NULL,                -- run of the last content change
+    prev_incorporation_date DATE NULL,      -- incorporation_date before that run
     created_at DATETIME2 DEFAULT SYSDATETIME()
 );
 
+CREATE SEQUENCE company_row_version AS BIGINT START WITH 1 INCREMENT BY 1;
+
 CREATE TABLE company_addresses (
     address_id INT IDENTITY(1,1) PRIMARY KEY,
     company_number VARCHAR(20) NOT NULL,
@@ -17,6 +30,8 @@ CREATE TABLE company_addresses (
     region NVARCHAR(100),
     postal_code VARCHAR(20),
     country VARCHAR(50),
+    latitude FLOAT,                 -- postcode centroid, see src/ingest/postcode_geo.py
+    longitude FLOAT,
     CONSTRAINT fk_address_company
         FOREIGN KEY (company_number)
         REFERENCES companies(company_number)
@@ -24,7 +39,10 @@ CREATE TABLE company_addresses (
 
 CREATE TABLE sic_codes (
     sic_code VARCHAR(10) PRIMARY KEY,
-    description NVARCHAR(255)
+    description NVARCHAR(255),
+    level VARCHAR(10),              -- section | division | group | class | subclass
+    parent_code VARCHAR(10),
+    section CHAR(1)                 -- loaded by src/ingest/sic_reference.py
 );
 
 CREATE TABLE company_sic (
@@ -37,10 +55,107 @@ CREATE TABLE company_sic (
         REFERENCES sic_codes(sic_code)
 );
 
+CREATE TABLE company_profiles (
+    company_number VARCHAR(20) PRIMARY KEY,
+    accounts_next_due DATE,
+    accounts_last_made_up_to DATE,
+    accounts_overdue BIT,
+    previous_names NVARCHAR(MAX),   -- JSON array from the profile endpoint
+    sic_codes VARCHAR(100),         -- full comma-separated SIC list
+    fetched_at DATETIME2 DEFAULT SYSUTCDATETIME(),
+    CONSTRAINT fk_profile_company FOREIGN KEY (company_number)
+        REFERENCES companies(company_number)
+);
+
 CREATE TABLE ingestion_log (
     run_id INT IDENTITY(1,1) PRIMARY KEY,
     run_timestamp DATETIME2 DEFAULT SYSDATETIME(),
     records_inserted INT,
-    source VARCHAR(100),
-    status VARCHAR(20)
+    source VARCHAR(400),            -- run note; Storage caps it at RUN_NOTE_MAX
+    status VARCHAR(20),
+    parent_run_id INT NULL,         -- set on the per-shard child runs of a sharded backfill
+    CONSTRAINT fk_ingestion_log_parent FOREIGN KEY (parent_run_id)
+        REFERENCES ingestion_log(run_id)
 );
+
+CREATE TABLE ingestion_checkpoint (
+    run_id INT PRIMARY KEY,
+    cursor_key NVARCHAR(200) NOT NULL,  -- location or date-window work unit
+    start_index INT NOT NULL,
+    records_committed INT NOT NULL,
+    updated_at DATETIME2 DEFAULT SYSUTCDATETIME(),
+    CONSTRAINT fk_checkpoint_run FOREIGN KEY (run_id)
+        REFERENCES ingestion_log(run_id)
+);
+
+CREATE TABLE company_changes (
+    change_id BIGINT IDENTITY(1,1) PRIMARY KEY,
+    run_id INT NULL,
+    company_number VARCHAR(20) NOT NULL,
+    change_type VARCHAR(10) NOT NULL,       -- 'new' | 'update'
+    changed_fields VARCHAR(200) NULL,       -- e.g. 'company_status,address'; NULL for 'new'
+    changed_at DATETIME2 DEFAULT SYSUTCDATETIME(),
+    CONSTRAINT fk_change_run FOREIGN KEY (run_id)
+        REFERENCES ingestion_log(run_id)
+);
+
+CREATE TABLE quarantined_items (
+    quarantine_id BIGINT IDENTITY(1,1) PRIMARY KEY,
+    run_id INT NULL,
+    company_number VARCHAR(20) NULL,
+    reasons VARCHAR(400) NOT NULL,          -- failed rules, see src/validation/page_validation.py
+    payload NVARCHAR(MAX) NOT NULL,         -- the search item as JSON
+    quarantined_at DATETIME2 DEFAULT SYSUTCDATETIME(),
+    CONSTRAINT fk_quarantine_run FOREIGN KEY (run_id)
+        REFERENCES ingestion_log(run_id)
+);
+
+CREATE TABLE email_outbox (
+    message_id BIGINT IDENTITY(1,1) PRIMARY KEY,
+    run_id INT NULL,
+    recipient NVARCHAR(320) NOT NULL,
+    subject NVARCHAR(400) NOT NULL,
+    body NVARCHAR(MAX) NOT NULL,
+    attachment_path NVARCHAR(500) NULL,
+    status VARCHAR(10) NOT NULL DEFAULT 'pending',  -- 'pending' | 'sending' | 'sent' | 'failed'
+    attempts INT NOT NULL DEFAULT 0,
+    next_attempt_at DATETIME2 NOT NULL,
+    last_error NVARCHAR(1000) NULL,
+    created_at DATETIME2 DEFAULT SYSUTCDATETIME(),
+    sent_at DATETIME2 NULL,
+    CONSTRAINT fk_outbox_run FOREIGN KEY (run_id)
+        REFERENCES ingestion_log(run_id)
+);
+
+CREATE TABLE schema_version (
+    version INT PRIMARY KEY,
+    name NVARCHAR(200) NOT NULL,
+    checksum CHAR(64) NOT NULL,      -- sha256 of the applied migration file
+    applied_at DATETIME2 DEFAULT SYSUTCDATETIME()
+);
+
+-- Export and ingest hot paths (sql/migrations/sqlserver/0003_hot_path_indexes.sql)
+CREATE INDEX ix_companies_incorporation_date
+    ON companies (incorporation_date DESC) INCLUDE (company_name, company_status);
+CREATE INDEX ix_company_sic_sic_code
+    ON company_sic (sic_code, company_number);
+CREATE INDEX ix_company_addresses_company_number
+    ON company_addresses (company_number) INCLUDE (locality, region, postal_code, country);
+CREATE INDEX ix_company_addresses_lat_lon
+    ON company_addresses (latitude, longitude) INCLUDE (company_number, postal_code);
+CREATE INDEX ix_company_addresses_ungeocoded
+    ON company_addresses (address_id) INCLUDE (postal_code) WHERE latitude IS NULL;
+CREATE INDEX ix_companies_first_seen_run_id
+    ON companies (first_seen_run_id, incorporation_date DESC) INCLUDE (company_name, company_status);
+CREATE INDEX ix_companies_last_seen_run_id
+    ON companies (last_seen_run_id);
+CREATE INDEX ix_companies_changed_run_id
+    ON companies (changed_run_id) INCLUDE (incorporation_date, prev_incorporation_date);
+CREATE INDEX ix_ingestion_log_parent_run_id
+    ON ingestion_log (parent_run_id) INCLUDE (source, status, records_inserted);
+CREATE INDEX ix_company_changes_run_id
+    ON company_changes (run_id, change_id) INCLUDE (company_number, change_type, changed_fields);
+CREATE INDEX ix_quarantined_items_run_id
+    ON quarantined_items (run_id) INCLUDE (company_number, reasons);
+CREATE INDEX ix_email_outbox_due
+    ON email_outbox (status, next_attempt_at) INCLUDE (attempts);
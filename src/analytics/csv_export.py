@@ -0,0 +1,202 @@
+from __future__ import annotations
+
+import io
+import os
+import csv
+import gzip
+import json
+import hashlib
+import zipfile
+from contextlib import contextmanager
+from dataclasses import dataclass
+from datetime import datetime, timezone
+from pathlib import Path
+from typing import Any, BinaryIO, Iterator, List, Optional
+
+# Rows pulled per fetchmany() round-trip
+FETCH_ROWS = int(os.getenv("EXPORT_FETCH_ROWS", "5000"))
+
+# '' (plain .csv), 'gzip' (.csv.gz) or 'zip' (.zip holding the .csv)
+EXPORT_COMPRESSION = os.getenv("EXPORT_COMPRESSION", "").strip().lower()
+
+# Write <export>.footer.json (row count, checksums) beside each export
+EXPORT_FOOTER = os.getenv("EXPORT_FOOTER", "1") == "1"
+
+COMPRESSIONS = ("", "gzip", "zip")
+
+_WRITE_BUFFER = 1 << 16
+
+
+@dataclass
+class CsvExport:
+    path: Path                  # the file written: .csv, .csv.gz or .zip
+    rows: int
+    csv_sha256: str             # of the uncompressed CSV bytes
+    footer_path: Optional[Path] = None
+    cached: bool = False        # copied from the export cache rather than queried
+
+
+class _HashingWriter(io.RawIOBase):
+    """Passes bytes through to `raw`, hashing them on the way."""
+
+    def __init__(self, raw: BinaryIO) -> None:
+        self._raw = raw
+        self.sha256 = hashlib.sha256()
+
+    def writable(self) -> bool:
+        return True
+
+    def write(self, b) -> int:
+        self.sha256.update(b)
+        self._raw.write(b)
+        return len(b)
+
+
+def export_path(out_path: Path, compression: str = EXPORT_COMPRESSION) -> Path:
+    """out_path with the suffix for compression: x.csv, x.csv.gz or x.zip."""
+    if compression not in COMPRESSIONS:
+        raise RuntimeError(f"EXPORT_COMPRESSION must be one of {COMPRESSIONS}, got {compression!r}")
+    if compression == "gzip":
+        return out_path.with_name(out_path.name + ".gz")
+    if compression == "zip":
+        return out_path.with_suffix(".zip")
+    return out_path
+
+
+@contextmanager
+def _open_target(path: Path, compression: str, member: str) -> Iterator[BinaryIO]:
+    if compression == "gzip":
+        with gzip.open(path, "wb", compresslevel=6) as f:
+            yield f
+    elif compression == "zip":
+        with zipfile.ZipFile(path, "w", compression=zipfile.ZIP_DEFLATED) as zf:
+            # Size is unknown up front; zip64 keeps multi-GB exports valid
+            with zf.open(member, "w", force_zip64=True) as f:
+                yield f
+    else:
+        with path.open("wb") as f:
+            yield f
+
+
+def iter_batches(cur, fetch_rows: int = FETCH_ROWS) -> Iterator[List[Any]]:
+    """fetchmany() batches of an executed query until it is exhausted."""
+    while True:
+        rows = cur.fetchmany(fetch_rows)
+        if not rows:
+            return
+        yield rows
+
+
+def file_sha256(path: Path) -> str:
+    h = hashlib.sha256()
+    with path.open("rb") as f:
+        for block in iter(lambda: f.read(1 << 20), b""):
+            h.update(block)
+    return h.hexdigest()
+
+
+def write_footer(export: CsvExport, columns: List[str], compression: str) -> Path:
+    footer_path = export.path.with_name(export.path.name + ".footer.json")
+    footer = {
+        "file": export.path.name,
+        "rows": export.rows,
+        "columns": columns,
+        "compression": compression or None,
+        "csv_sha256": export.csv_sha256,
+        "file_sha256": file_sha256(export.path),
+        "file_bytes": export.path.stat().st_size,
+        "written_at": datetime.now(timezone.utc).isoformat(timespec="seconds"),
+    }
+    footer_path.write_text(json.dumps(footer, indent=2) + "\n", encoding="utf-8")
+    return footer_path
+
+
+class CsvSink:
+    """
+    One streamed CSV output: header on open, rows as they come, then
+    close() renames the .part file into place and returns the CsvExport.
+    abort() drops the partial file. write_cursor_csv() is one sink fed by
+    one cursor; the segmented export feeds many sinks from one cursor.
+    """
+
+    def __init__(
+        self,
+        out_path: Path,
+        columns: List[str],
+        *,
+        compression: str = EXPORT_COMPRESSION,
+        footer: bool = EXPORT_FOOTER,
+    ) -> None:
+        self.path = export_path(Path(out_path), compression)
+        self.columns = columns
+        self.compression = compression
+        self.footer = footer
+        self.rows = 0
+        self.path.parent.mkdir(parents=True, exist_ok=True)
+        self._partial = self.path.with_name(self.path.name + ".part")
+
+        self._target = _open_target(self._partial, compression, Path(out_path).name)
+        try:
+            self._hashing = _HashingWriter(self._target.__enter__())
+            self._text = io.TextIOWrapper(
+                io.BufferedWriter(self._hashing, _WRITE_BUFFER), encoding="utf-8", newline=""
+            )
+            self._writer = csv.writer(self._text)
+            self._writer.writerow(columns)
+        except BaseException:
+            self._partial.unlink(missing_ok=True)
+            raise
+
+    def writerow(self, row: Any) -> None:
+        self._writer.writerow(row)
+        self.rows += 1
+
+    def writerows(self, rows: List[Any]) -> None:
+        self._writer.writerows(rows)
+        self.rows += len(rows)
+
+    def close(self) -> CsvExport:
+        try:
+            self._text.close()
+            self._target.__exit__(None, None, None)
+            self._partial.replace(self.path)
+        except BaseException:
+            self._partial.unlink(missing_ok=True)
+            raise
+
+        export = CsvExport(self.path, self.rows, self._hashing.sha256.hexdigest())
+        if self.footer:
+            export.footer_path = write_footer(export, self.columns, self.compression)
+        return export
+
+    def abort(self) -> None:
+        try:
+            self._text.close()
+            self._target.__exit__(None, None, None)
+        except Exception:
+            pass
+        self._partial.unlink(missing_ok=True)
+
+
+def write_cursor_csv(
+    cur,
+    out_path: Path,
+    *,
+    compression: str = EXPORT_COMPRESSION,
+    fetch_rows: int = FETCH_ROWS,
+    footer: bool = EXPORT_FOOTER,
+) -> CsvExport:
+    """
+    Stream an executed query to CSV in fetchmany() batches, so memory stays
+    flat however many rows come back (pyodbc's default forward-only cursor
+    streams from the server). Written to a .part file and renamed into
+    place, so a failed export never leaves a truncated file behind.
+    """
+    sink = CsvSink(out_path, [d[0] for d in cur.description], compression=compression, footer=footer)
+    try:
+        for rows in iter_batches(cur, fetch_rows):
+            sink.writerows(rows)
+    except BaseException:
+        sink.abort()
+        raise
+    return sink.close()
@@ -0,0 +1,132 @@
+from __future__ import annotations
+
+import os
+import json
+import shutil
+import hashlib
+from dataclasses import dataclass
+from pathlib import Path
+from typing import Any, Dict, List, Optional
+
+from src.analytics.csv_export import CsvExport, export_path, write_footer
+
+# Serve repeat exports of unchanged data from a cached copy
+EXPORT_CACHE = os.getenv("EXPORT_CACHE", "1") == "1"
+
+EXPORT_CACHE_DIR = Path(os.getenv("EXPORT_CACHE_DIR", str(Path(os.getenv("EXPORT_DIR", "data/exports")) / ".cache")))
+
+# Entries kept; the least recently served are removed beyond this
+EXPORT_CACHE_MAX_ENTRIES = int(os.getenv("EXPORT_CACHE_MAX_ENTRIES", "48"))
+
+
+@dataclass(frozen=True)
+class DataVersion:
+    """Row versions of the companies behind an export; any later write to them moves it."""
+
+    companies: int
+    version_sum: int
+    version_max: int
+
+    def as_meta(self) -> Dict[str, int]:
+        return {"companies": self.companies, "version_sum": self.version_sum, "version_max": self.version_max}
+
+
+def export_key(query: str, compression: str, **filters: Any) -> str:
+    """
+    Cache key for one export: the query, the output compression and its
+    filters in canonical form (lists are sorted and de-duplicated).
+    """
+    canonical: Dict[str, Any] = {}
+    for k, v in filters.items():
+        canonical[k] = sorted(set(v)) if isinstance(v, (list, tuple, set, frozenset)) else v
+    raw = json.dumps([query, compression or "", canonical], sort_keys=True, separators=(",", ":"))
+    return hashlib.sha256(raw.encode("utf-8")).hexdigest()[:32]
+
+
+class ExportCache:
+    """
+    Finished export files by key, each stamped with the DataVersion it was
+    built from. A lookup with a different version is a miss, so a later run
+    that writes to the exported rows invalidates the entry without any
+    bookkeeping on the ingest side; the next export overwrites it.
+
+        <key>.json          version (companies, version_sum, version_max), rows, columns, checksum
+        <key>-<file name>   the export as written (.csv, .csv.gz or .zip)
+    """
+
+    def __init__(self, root: Path = EXPORT_CACHE_DIR, max_entries: int = EXPORT_CACHE_MAX_ENTRIES) -> None:
+        self.root = Path(root)
+        self.max_entries = max_entries
+
+    def _meta_path(self, key: str) -> Path:
+        return self.root / f"{key}.json"
+
+    def _load(self, key: str) -> Optional[dict]:
+        try:
+            return json.loads(self._meta_path(key).read_text(encoding="utf-8"))
+        except (OSError, ValueError):
+            return None
+
+    def serve(
+        self,
+        key: str,
+        version: DataVersion,
+        out_path: Path,
+        compression: str,
+        footer: bool,
+    ) -> Optional[CsvExport]:
+        """
+        Copy the cached export for key to out_path if it was built from
+        version; None on a miss.
+        """
+        meta = self._load(key)
+        if meta is None or meta.get("version") != version.as_meta():
+            return None
+        cached = self.root / meta["file"]
+        if not cached.exists():
+            return None
+
+        path = export_path(Path(out_path), compression)
+        path.parent.mkdir(parents=True, exist_ok=True)
+        partial = path.with_name(path.name + ".part")
+        try:
+            shutil.copyfile(cached, partial)
+            partial.replace(path)
+        except BaseException:
+            partial.unlink(missing_ok=True)
+            raise
+        os.utime(self._meta_path(key))
+
+        export = CsvExport(path, int(meta["rows"]), meta["csv_sha256"], cached=True)
+        if footer:
+            export.footer_path = write_footer(export, meta["columns"], compression)
+        return export
+
+    def put(self, key: str, version: DataVersion, export: CsvExport, columns: List[str]) -> None:
+        """Keep a copy of a freshly written export under key."""
+        self.root.mkdir(parents=True, exist_ok=True)
+        previous = self._load(key)
+        target = self.root / f"{key}-{export.path.name}"
+        partial = target.with_name(target.name + ".part")
+        shutil.copyfile(export.path, partial)
+        partial.replace(target)
+
+        meta = {
+            "version": version.as_meta(),
+            "file": target.name,
+            "rows": export.rows,
+            "columns": columns,
+            "csv_sha256": export.csv_sha256,
+        }
+        meta_partial = self._meta_path(key).with_suffix(".json.part")
+        meta_partial.write_text(json.dumps(meta, indent=2) + "\n", encoding="utf-8")
+        meta_partial.replace(self._meta_path(key))
+        if previous and previous.get("file") != target.name:
+            (self.root / previous["file"]).unlink(missing_ok=True)
+        self._evict()
+
+    def _evict(self) -> None:
+        metas = sorted(self.root.glob("*.json"), key=lambda p: p.stat().st_mtime, reverse=True)
+        for meta_path in metas[self.max_entries:]:
+            for p in self.root.glob(f"{meta_path.stem}*"):
+                p.unlink(missing_ok=True)
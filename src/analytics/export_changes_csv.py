@@ -0,0 +1,76 @@
+from __future__ import annotations
+
+import os
+import sys
+import csv
+from pathlib import Path
+from typing import List, Optional, Tuple
+
+from src.analytics.csv_export import FETCH_ROWS
+from src.db.storage import Storage, get_storage
+
+EXPORT_DIR = Path(os.getenv("EXPORT_DIR", "data/exports"))
+
+
+def export_changes_csv(
+    storage: Storage, conn, since_change_id: int, out_path: Path
+) -> Tuple[int, Optional[int], Optional[int]]:
+    """
+    Stream every company_changes row after since_change_id to a CSV,
+    fetchmany() at a time. Rows from a run that is still 'running', and
+    everything after its first row, are left for a later export: that run
+    can still commit changes below change ids other runs have committed.
+
+    Returns (rows written, highest change_id written, first change_id held
+    back). Pass the second as since_change_id next time to continue from
+    here; it is None when nothing was written.
+    """
+    cur = conn.cursor()
+    held_back = storage.first_unfinished_change_id(cur, since_change_id)
+    storage.select_changes_since(cur, since_change_id, held_back)
+    cols = [d[0] for d in cur.description]
+    change_col = cols.index("change_id")
+
+    count = 0
+    last_change_id: Optional[int] = None
+    out_path.parent.mkdir(parents=True, exist_ok=True)
+    with out_path.open("w", newline="", encoding="utf-8") as f:
+        w = csv.writer(f)
+        w.writerow(cols)
+        while True:
+            rows = cur.fetchmany(FETCH_ROWS)
+            if not rows:
+                break
+            w.writerows(rows)
+            count += len(rows)
+            # Ordered by change_id: the batch's last row is the highest so far
+            last_change_id = rows[-1][change_col]
+
+    return count, last_change_id, held_back
+
+
+def main(argv: Optional[List[str]] = None) -> None:
+    """
+    Usage:
+        python -m src.analytics.export_changes_csv SINCE_CHANGE_ID     # 0 for everything
+    """
+    args = list(sys.argv[1:] if argv is None else argv)
+    if len(args) != 1:
+        raise SystemExit("Usage: export_changes_csv SINCE_CHANGE_ID")
+    since_change_id = int(args[0])
+
+    out_path = EXPORT_DIR / f"company_changes_since_{since_change_id}.csv"
+
+    storage = get_storage()
+    with storage.connection() as conn:
+        count, last_change_id, held_back = export_changes_csv(storage, conn, since_change_id, out_path)
+
+    print(f"Changes exported: {count}")
+    print(f"CSV written to: {out_path}")
+    if held_back is not None:
+        print(f"Held back from change_id={held_back}: its run is still running")
+    print(f"Next export: SINCE_CHANGE_ID={since_change_id if last_change_id is None else last_change_id}")
+
+
+if __name__ == "__main__":
+    main()
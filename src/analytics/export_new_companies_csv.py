@@ -1,12 +1,14 @@
 from __future__ import annotations
 
 import os
-import csv
 from datetime import date
 from pathlib import Path
 from typing import Tuple, Optional
 
-from src.db.connection import get_conn
+from src.analytics.csv_export import EXPORT_COMPRESSION, EXPORT_FOOTER, CsvExport, write_cursor_csv
+from src.analytics.export_cache import EXPORT_CACHE, DataVersion, ExportCache, export_key
+from src.db.storage import Storage, get_storage
+from src.ingest.sic_reference import expand_sic_filters
 
 EXPORT_DIR = Path(os.getenv("EXPORT_DIR", "data/exports"))
 EXPORT_DIR.mkdir(parents=True, exist_ok=True)
@@ -53,97 +55,65 @@ def month_range(yyyy_mm: str) -> Tuple[date, date]:
 
 
 def parse_sic_codes() -> list[str]:
+    """SIC_CODES as concrete codes; entries may also be prefixes (62*) or sections (J)."""
     raw = os.getenv("SIC_CODES", "").strip()
     if not raw:
         return DEFAULT_SIC_CODES
-    return [x.strip() for x in raw.split(",") if x.strip()]
+    return expand_sic_filters([x.strip() for x in raw.split(",") if x.strip()])
 
 
-def get_latest_success_run_id(cur, only_incremental: bool = True) -> int:
+def get_latest_success_run_id(storage: Storage, cur, only_incremental: bool = True) -> int:
     """
-    Gets the latest successful run_id from dbo.ingestion_log.
+    Gets the latest successful run_id from ingestion_log.
     If only_incremental=True, it tries to pick runs whose source contains 'INCREMENTAL'.
     """
     if only_incremental:
-        cur.execute(
-            """
-            SELECT TOP 1 run_id
-            FROM dbo.ingestion_log
-            WHERE status = 'success'
-              AND source LIKE '%INCREMENTAL%'
-            ORDER BY run_id DESC;
-            """
-        )
-        row = cur.fetchone()
-        if row and row[0] is not None:
-            return int(row[0])
+        run_id = storage.latest_success_run_id(cur, source_like="%INCREMENTAL%")
+        if run_id is not None:
+            return run_id
 
     # Fallback: latest success of any type (backfill, etc.)
-    cur.execute(
-        """
-        SELECT TOP 1 run_id
-        FROM dbo.ingestion_log
-        WHERE status = 'success'
-        ORDER BY run_id DESC;
-        """
-    )
-    row = cur.fetchone()
-    if not row or row[0] is None:
-        raise RuntimeError("No successful runs found in dbo.ingestion_log.")
-    return int(row[0])
+    run_id = storage.latest_success_run_id(cur)
+    if run_id is None:
+        raise RuntimeError("No successful runs found in ingestion_log.")
+    return run_id
 
 
 def export_month_companies_csv(
+    storage: Storage,
     conn,
     start_date: str,
     end_date: str,
     sic_codes: list[str],
     out_path: Path,
-) -> int:
+    cache: Optional[ExportCache] = None,
+) -> CsvExport:
     """
     Export companies incorporated within [start_date, end_date) AND matching SIC codes.
+    Streamed in EXPORT_FETCH_ROWS batches; EXPORT_COMPRESSION picks gzip/zip output.
+
+    With a cache, the month's data version (count and row versions of its
+    companies) is read first; if the same export was cached at that version
+    it is copied to out_path and the export query is skipped.
     """
     if not sic_codes:
         raise ValueError("sic_codes is empty")
 
-    placeholders = ",".join(["?"] * len(sic_codes))
-
-    sql = f"""
-        SELECT DISTINCT
-            c.company_number,
-            c.company_name,
-            c.company_status,
-            c.incorporation_date,
-            a.locality,
-            a.region,
-            a.postal_code,
-            a.country
-        FROM dbo.companies c
-        LEFT JOIN dbo.company_addresses a
-            ON a.company_number = c.company_number
-        INNER JOIN dbo.company_sic cs
-            ON cs.company_number = c.company_number
-        WHERE
-            c.incorporation_date >= ?
-            AND c.incorporation_date < ?
-            AND cs.sic_code IN ({placeholders})
-        ORDER BY c.incorporation_date DESC;
-    """
-
-    params = [start_date, end_date] + sic_codes
-
     cur = conn.cursor()
-    cur.execute(sql, params)
-    rows = cur.fetchall()
-    cols = [d[0] for d in cur.description]
-
-    out_path.parent.mkdir(parents=True, exist_ok=True)
-    with out_path.open("w", newline="", encoding="utf-8") as f:
-        w = csv.writer(f)
-        w.writerow(cols)
-        w.writerows(rows)
-
-    return len(rows)
+    key = export_key("month_companies", EXPORT_COMPRESSION, start=start_date, end=end_date, sic_codes=sic_codes)
+    version = None
+    if cache is not None:
+        version = DataVersion(*storage.month_data_version(cur, start_date, end_date))
+        hit = cache.serve(key, version, out_path, EXPORT_COMPRESSION, EXPORT_FOOTER)
+        if hit is not None:
+            return hit
+
+    storage.select_month_companies(cur, start_date, end_date, sic_codes)
+    columns = [d[0] for d in cur.description]
+    export = write_cursor_csv(cur, out_path)
+    if cache is not None:
+        cache.put(key, version, export, columns)
+    return export
 
 
 def main() -> None:
@@ -155,24 +125,27 @@ def main() -> None:
 
     start_dt, end_dt = month_range(target_month)
 
-    with get_conn() as conn:
+    storage = get_storage()
+    with storage.connection() as conn:
         cur = conn.cursor()
-        run_id = get_latest_success_run_id(cur, only_incremental=only_incremental)
+        run_id = get_latest_success_run_id(storage, cur, only_incremental=only_incremental)
 
         out_path = EXPORT_DIR / f"companies_incorp_{target_month}_run_{run_id}.csv"
-        count = export_month_companies_csv(
+        export = export_month_companies_csv(
+            storage=storage,
             conn=conn,
             start_date=str(start_dt),
             end_date=str(end_dt),
             sic_codes=sic_codes,
             out_path=out_path,
+            cache=ExportCache() if EXPORT_CACHE else None,
         )
 
     print(f"Run id used: {run_id}")
     print(f"Target month: {target_month}")
     print(f"SIC codes: {','.join(sic_codes)}")
-    print(f"Exported rows: {count}")
-    print(f"CSV written to: {out_path}")
+    print(f"Exported rows: {export.rows}" + (" (unchanged since last export, served from cache)" if export.cached else ""))
+    print(f"CSV written to: {export.path}")
 
 
 if __name__ == "__main__":
@@ -0,0 +1,280 @@
+from __future__ import annotations
+
+import os
+import re
+import json
+import argparse
+from dataclasses import dataclass, field
+from datetime import datetime, timezone
+from itertools import groupby
+from pathlib import Path
+from typing import Any, Dict, Iterator, List, Optional, Tuple
+
+from src.analytics.csv_export import FETCH_ROWS, CsvExport, CsvSink, iter_batches
+from src.analytics.export_new_companies_csv import (
+    EXPORT_DIR,
+    get_latest_success_run_id,
+    month_range,
+    normalize_target_month,
+    parse_sic_codes,
+)
+from src.db.storage import Storage, get_storage
+from src.ingest.postcode_filter import PostcodeFilter, outward_code
+from src.ingest.sic_reference import SicPrefixIndex, expand_sic_filters
+
+# Output files open at once; a split over more distinct values than this is refused
+EXPORT_MAX_SEGMENT_FILES = int(os.getenv("EXPORT_MAX_SEGMENT_FILES", "500"))
+
+COLUMNS = [
+    "company_number",
+    "company_name",
+    "company_status",
+    "incorporation_date",
+    "locality",
+    "region",
+    "postal_code",
+    "country",
+    "sic_codes",
+]
+
+SPLITS = ("sic_code", "town", "postcode_district")
+
+_NAME_RE = re.compile(r"^[A-Za-z0-9_-]+$")
+_SPEC_KEYS = {"name", "sic_codes", "towns", "postcodes", "split_by"}
+
+
+@dataclass
+class Segment:
+    """
+    One output of the segmented export. Filters are ANDed; within a filter
+    any listed value matches. split_by fans the matching companies out to
+    one file per distinct SIC code, town or postcode district.
+    """
+
+    name: str
+    sic: Optional[SicPrefixIndex] = None        # codes, prefixes (62*) or sections (J)
+    towns: Optional[frozenset] = None           # casefolded locality
+    postcodes: Optional[PostcodeFilter] = None  # areas (LU) or districts (MK10)
+    split_by: Optional[str] = None
+
+    @classmethod
+    def from_spec(cls, entry: Dict[str, Any]) -> "Segment":
+        unknown = set(entry) - _SPEC_KEYS
+        if unknown:
+            raise ValueError(f"Segment {entry.get('name')!r}: unknown keys {sorted(unknown)}")
+        name = str(entry.get("name", ""))
+        if not _NAME_RE.fullmatch(name):
+            raise ValueError(f"Segment name {name!r} must be letters, digits, '_' or '-'")
+        split_by = entry.get("split_by")
+        if split_by is not None and split_by not in SPLITS:
+            raise ValueError(f"Segment {name!r}: split_by must be one of {SPLITS}, got {split_by!r}")
+
+        sic = SicPrefixIndex.from_patterns(entry["sic_codes"]) if entry.get("sic_codes") else None
+        towns = frozenset(" ".join(t.split()).casefold() for t in entry["towns"]) if entry.get("towns") else None
+        postcodes = PostcodeFilter(entry["postcodes"]) if entry.get("postcodes") else None
+        return cls(name, sic, towns, postcodes, split_by)
+
+    def matches(self, row: tuple, sic_codes: List[str]) -> bool:
+        if self.sic is not None and not any(self.sic.matches(c) for c in sic_codes):
+            return False
+        if self.towns is not None and _town(row[4]) not in self.towns:
+            return False
+        if self.postcodes is not None and not self.postcodes.matches(row[6]):
+            return False
+        return True
+
+    def keys(self, row: tuple, sic_codes: List[str], base: set) -> List[str]:
+        """
+        Split values this company is written under; [''] when not split.
+        A SIC split only uses the export's own codes (base), not every code
+        the company has.
+        """
+        if self.split_by is None:
+            return [""]
+        if self.split_by == "sic_code":
+            return [c for c in sic_codes if c in base and (self.sic is None or self.sic.matches(c))]
+        if self.split_by == "town":
+            return [_town(row[4]) or "unknown"]
+        return [outward_code(row[6]) or "unknown"]
+
+
+@dataclass
+class SegmentFile:
+    segment: str
+    value: str
+    export: CsvExport
+
+
+@dataclass
+class SegmentedExport:
+    out_dir: Path
+    manifest_path: Path
+    companies: int                  # companies read from the month query
+    unassigned: int                 # ... that matched no segment
+    files: List[SegmentFile] = field(default_factory=list)
+
+
+def _town(locality: Optional[str]) -> str:
+    return " ".join((locality or "").split()).casefold()
+
+
+def _slug(value: str) -> str:
+    return re.sub(r"[^a-z0-9]+", "-", value.casefold()).strip("-") or "unknown"
+
+
+def load_segment_spec(path: Path) -> Tuple[Optional[List[str]], List[Segment]]:
+    """
+    (base SIC filters or None, segments) from a JSON spec:
+
+        {
+          "sic_codes": ["62*"],                       optional; default SIC_CODES
+          "segments": [
+            {"name": "consultancy", "sic_codes": ["62020"]},
+            {"name": "luton_software", "sic_codes": ["62012"], "towns": ["Luton"]},
+            {"name": "mk", "postcodes": ["MK"]},
+            {"name": "by_district", "split_by": "postcode_district"}
+          ]
+        }
+    """
+    spec = json.loads(Path(path).read_text(encoding="utf-8"))
+    segments = [Segment.from_spec(e) for e in spec.get("segments") or []]
+    if not segments:
+        raise ValueError(f"{path}: no segments")
+    names = [s.name for s in segments]
+    if len(set(names)) != len(names):
+        raise ValueError(f"{path}: duplicate segment names")
+    base = spec.get("sic_codes")
+    return (list(base) if base else None), segments
+
+
+def _companies(cur, fetch_rows: int) -> Iterator[Tuple[tuple, List[str]]]:
+    """(company row without sic_code, its SIC codes) from the adjacent per-SIC rows."""
+    rows = (r for batch in iter_batches(cur, fetch_rows) for r in batch)
+    for _, group in groupby(rows, key=lambda r: r[0]):
+        group = list(group)
+        yield tuple(group[0][:-1]), [r[-1] for r in group]
+
+
+def export_segments(
+    storage: Storage,
+    conn,
+    start_date: str,
+    end_date: str,
+    sic_codes: List[str],
+    segments: List[Segment],
+    out_dir: Path,
+    fetch_rows: int = FETCH_ROWS,
+) -> SegmentedExport:
+    """
+    Export the month once, fanned out to every segment's files: a single
+    query over companies incorporated in [start_date, end_date) with any of
+    sic_codes, streamed in fetchmany() batches, each company written to every
+    segment (and split value) it matches. A manifest.json in out_dir lists
+    the files with their row counts and checksums. On error no file is left
+    behind.
+    """
+    if not sic_codes:
+        raise ValueError("sic_codes is empty")
+    out_dir.mkdir(parents=True, exist_ok=True)
+    base = set(sic_codes)
+
+    # Keyed by (segment, slug): values that differ only in punctuation share a file
+    sinks: Dict[Tuple[str, str], CsvSink] = {}
+    values: Dict[Tuple[str, str], str] = {}
+
+    def sink(segment: Segment, value: str) -> CsvSink:
+        key = (segment.name, _slug(value) if segment.split_by else "")
+        s = sinks.get(key)
+        if s is None:
+            if len(sinks) >= EXPORT_MAX_SEGMENT_FILES:
+                raise RuntimeError(
+                    f"Segment {segment.name!r} needs more than EXPORT_MAX_SEGMENT_FILES={EXPORT_MAX_SEGMENT_FILES} files"
+                )
+            filename = f"{segment.name}__{key[1]}.csv" if segment.split_by else f"{segment.name}.csv"
+            s = sinks[key] = CsvSink(out_dir / filename, COLUMNS)
+            values[key] = value
+        return s
+
+    companies = unassigned = 0
+    cur = conn.cursor()
+    storage.select_month_companies_sic_rows(cur, start_date, end_date, sic_codes)
+    try:
+        # Unsplit segments get a file even when nothing matches
+        for seg in segments:
+            if seg.split_by is None:
+                sink(seg, "")
+
+        for row, codes in _companies(cur, fetch_rows):
+            companies += 1
+            out = row + (";".join(codes),)
+            assigned = False
+            for seg in segments:
+                if not seg.matches(row, codes):
+                    continue
+                for value in seg.keys(row, codes, base):
+                    sink(seg, value).writerow(out)
+                    assigned = True
+            unassigned += not assigned
+
+        files = [SegmentFile(key[0], values[key], s.close()) for key, s in sinks.items()]
+    except BaseException:
+        for s in sinks.values():
+            s.abort()
+        raise
+
+    files.sort(key=lambda f: (f.segment, f.value))
+    manifest_path = out_dir / "manifest.json"
+    manifest = {
+        "start_date": start_date,
+        "end_date": end_date,
+        "sic_codes": sorted(base),
+        "companies": companies,
+        "unassigned": unassigned,
+        "segments": [
+            {
+                "segment": f.segment,
+                "value": f.value or None,
+                "file": f.export.path.name,
+                "rows": f.export.rows,
+                "csv_sha256": f.export.csv_sha256,
+            }
+            for f in files
+        ],
+        "written_at": datetime.now(timezone.utc).isoformat(timespec="seconds"),
+    }
+    manifest_path.write_text(json.dumps(manifest, indent=2) + "\n", encoding="utf-8")
+    return SegmentedExport(out_dir, manifest_path, companies, unassigned, files)
+
+
+def main(argv: Optional[List[str]] = None) -> None:
+    """
+    Usage:
+        python -m src.analytics.export_segments SPEC.json     # TARGET_MONTH, default previous month
+    """
+    parser = argparse.ArgumentParser(description="Single-pass segmented export of a month's companies")
+    parser.add_argument("spec", type=Path, help="JSON segment spec (see load_segment_spec)")
+    args = parser.parse_args(argv)
+
+    target_month = normalize_target_month(os.getenv("TARGET_MONTH", ""))
+    only_incremental = os.getenv("ONLY_INCREMENTAL_RUNS", "1") == "1"
+    base_filters, segments = load_segment_spec(args.spec)
+    sic_codes = expand_sic_filters(base_filters) if base_filters else parse_sic_codes()
+    start_dt, end_dt = month_range(target_month)
+
+    storage = get_storage()
+    with storage.connection() as conn:
+        run_id = get_latest_success_run_id(storage, conn.cursor(), only_incremental=only_incremental)
+        out_dir = EXPORT_DIR / f"segments_{target_month}_run_{run_id}"
+        result = export_segments(storage, conn, str(start_dt), str(end_dt), sic_codes, segments, out_dir)
+
+    print(f"Run id used: {run_id}")
+    print(f"Target month: {target_month}")
+    print(f"Companies: {result.companies} (in no segment: {result.unassigned})")
+    for f in result.files:
+        label = f"{f.segment}[{f.value}]" if f.value else f.segment
+        print(f"  {label}: {f.export.rows} rows -> {f.export.path.name}")
+    print(f"Manifest: {result.manifest_path}")
+
+
+if __name__ == "__main__":
+    main()
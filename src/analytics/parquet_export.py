@@ -0,0 +1,223 @@
+from __future__ import annotations
+
+import os
+import shutil
+import argparse
+from dataclasses import dataclass
+from datetime import date, datetime
+from pathlib import Path
+from typing import Any, Dict, Iterable, Iterator, List, Optional
+
+import pyarrow as pa
+import pyarrow.dataset as ds
+
+from src.analytics.csv_export import FETCH_ROWS, iter_batches
+from src.analytics.export_new_companies_csv import month_range, normalize_target_month
+from src.db.storage import Storage, get_storage
+
+# Hive-partitioned dataset root: incorporation_month=YYYY-MM/sic_code=NNNNN/*.parquet
+PARQUET_DIR = Path(os.getenv("PARQUET_DIR", "data/parquet/companies"))
+
+PARQUET_COMPRESSION = os.getenv("PARQUET_COMPRESSION", "zstd")
+
+# Rows per Parquet row group (the unit readers skip on column statistics)
+PARQUET_ROW_GROUP = int(os.getenv("PARQUET_ROW_GROUP", "64000"))
+
+_DICT = pa.dictionary(pa.int32(), pa.string())
+
+# Column order matches Storage.select_month_company_sic, plus the month
+SCHEMA = pa.schema(
+    [
+        ("sic_code", pa.string()),
+        ("company_number", pa.string()),
+        ("company_name", pa.string()),
+        ("company_status", _DICT),
+        ("incorporation_date", pa.date32()),
+        ("company_type", _DICT),
+        ("locality", _DICT),
+        ("region", _DICT),
+        ("postal_code", pa.string()),
+        ("country", _DICT),
+        ("incorporation_month", pa.string()),
+    ]
+)
+
+PARTITIONING = ds.partitioning(
+    pa.schema([("incorporation_month", pa.string()), ("sic_code", pa.string())]),
+    flavor="hive",
+)
+
+_STAGING = ".staging"
+
+
+@dataclass
+class ParquetMonth:
+    month: str
+    rows: int               # (company, SIC code) rows; a company appears once per SIC code
+    sic_codes: int          # partitions written under the month
+
+
+def _as_date(value: Any) -> Optional[date]:
+    # pyodbc returns date/datetime, SQLite the ISO text
+    if value is None:
+        return None
+    if isinstance(value, datetime):
+        return value.date()
+    if isinstance(value, date):
+        return value
+    return date.fromisoformat(str(value)[:10])
+
+
+def _record_batches(cur, month: str, fetch_rows: int) -> Iterator[pa.RecordBatch]:
+    for rows in iter_batches(cur, fetch_rows):
+        columns: List[Any] = [list(col) for col in zip(*rows)]
+        columns[4] = [_as_date(v) for v in columns[4]]
+        columns.append([month] * len(rows))
+
+        arrays = []
+        for i, field in enumerate(SCHEMA):
+            if pa.types.is_dictionary(field.type):
+                arrays.append(pa.array(columns[i], type=pa.string()).dictionary_encode())
+            else:
+                arrays.append(pa.array(columns[i], type=field.type))
+        yield pa.RecordBatch.from_arrays(arrays, schema=SCHEMA)
+
+
+def _month_dir(root: Path, month: str) -> Path:
+    return root / f"incorporation_month={month}"
+
+
+def _swap_in(staged: Path, live: Path, retired: Path) -> None:
+    """Replace live with staged by two renames, so readers never see half a month."""
+    if live.exists():
+        live.rename(retired)
+    live.parent.mkdir(parents=True, exist_ok=True)
+    staged.rename(live)
+    shutil.rmtree(retired, ignore_errors=True)
+
+
+def write_month_parquet(
+    storage: Storage,
+    conn,
+    month: str,
+    dataset_dir: Path = PARQUET_DIR,
+    run_id: Optional[int] = None,
+    fetch_rows: int = FETCH_ROWS,
+) -> ParquetMonth:
+    """
+    Rewrite one incorporation month of the dataset from the database, a
+    partition per SIC code. The month is streamed in fetchmany() batches to a
+    staging folder and swapped in whole, so SIC codes a company has dropped
+    do not linger in the old partitions and other months are left alone.
+    """
+    start, end = month_range(month)
+    staging_root = dataset_dir / _STAGING / f"{month}-{os.getpid()}"
+    shutil.rmtree(staging_root, ignore_errors=True)
+
+    cur = conn.cursor()
+    storage.select_month_company_sic(cur, str(start), str(end))
+
+    rows = 0
+
+    def counted(batches: Iterable[pa.RecordBatch]) -> Iterator[pa.RecordBatch]:
+        nonlocal rows
+        for b in batches:
+            rows += b.num_rows
+            yield b
+
+    file_format = ds.ParquetFileFormat()
+    try:
+        ds.write_dataset(
+            counted(_record_batches(cur, month, fetch_rows)),
+            staging_root,
+            schema=SCHEMA,
+            format=file_format,
+            file_options=file_format.make_write_options(compression=PARQUET_COMPRESSION),
+            partitioning=PARTITIONING,
+            basename_template=f"run-{run_id if run_id is not None else 'manual'}-{{i}}.parquet",
+            max_rows_per_group=PARQUET_ROW_GROUP,
+            min_rows_per_group=min(PARQUET_ROW_GROUP, fetch_rows),
+            existing_data_behavior="error",
+        )
+
+        staged = _month_dir(staging_root, month)
+        live = _month_dir(dataset_dir, month)
+        if staged.exists():
+            sic_codes = sum(1 for p in staged.iterdir() if p.is_dir())
+            _swap_in(staged, live, staging_root / "retired")
+        else:
+            # No companies left in the month: drop its partitions
+            sic_codes = 0
+            shutil.rmtree(live, ignore_errors=True)
+    finally:
+        shutil.rmtree(staging_root, ignore_errors=True)
+        try:
+            staging_root.parent.rmdir()
+        except OSError:
+            pass    # another month is still staging
+
+    return ParquetMonth(month, rows, sic_codes)
+
+
+def months_changed_in_run(storage: Storage, cur, run_id: int) -> List[str]:
+    """Incorporation months (YYYY-MM) a company the run added or changed is in, or was in before it."""
+    return sorted({d[:7] for d in storage.incorporation_dates_changed_in_run(cur, run_id)})
+
+
+def export_run_parquet(
+    storage: Storage,
+    conn,
+    run_id: int,
+    dataset_dir: Path = PARQUET_DIR,
+    extra_months: Iterable[str] = (),
+) -> List[ParquetMonth]:
+    """Refresh the months touched by run_id (plus extra_months); untouched months are not read."""
+    months = set(months_changed_in_run(storage, conn.cursor(), run_id)) | set(extra_months)
+    return [write_month_parquet(storage, conn, m, dataset_dir, run_id) for m in sorted(months)]
+
+
+def read_dataset(dataset_dir: Path = PARQUET_DIR) -> ds.Dataset:
+    """
+    The dataset for analysis, e.g.
+        read_dataset().to_table(columns=[...], filter=ds.field("sic_code") == "62020").to_pandas()
+    Filters on incorporation_month / sic_code only open the matching partitions;
+    both stay strings (a bare hive read would turn sic_code into an integer).
+    """
+    return ds.dataset(dataset_dir, format="parquet", partitioning=PARTITIONING, ignore_prefixes=[".", "_"])
+
+
+def main(argv: Optional[List[str]] = None) -> None:
+    """
+    Usage:
+        python -m src.analytics.parquet_export                  # TARGET_MONTH (default previous month)
+        python -m src.analytics.parquet_export 2024-01 2024-02  # explicit months
+        python -m src.analytics.parquet_export --run RUN_ID     # months touched by a run
+    """
+    parser = argparse.ArgumentParser(description="Partitioned Parquet export of companies")
+    parser.add_argument("months", nargs="*", metavar="YYYY-MM")
+    parser.add_argument("--run", type=int, metavar="RUN_ID", help="refresh the months this run changed")
+    parser.add_argument("--out", type=Path, default=PARQUET_DIR, help="dataset root")
+    args = parser.parse_args(argv)
+
+    months = [normalize_target_month(m) for m in args.months]
+    if args.run is None and not months:
+        months = [normalize_target_month(os.getenv("TARGET_MONTH", ""))]
+
+    storage = get_storage()
+    with storage.connection() as conn:
+        if args.run is not None:
+            written = export_run_parquet(storage, conn, args.run, args.out, months)
+        else:
+            written = [write_month_parquet(storage, conn, m, args.out) for m in months]
+
+    totals: Dict[str, int] = {"rows": 0, "partitions": 0}
+    for w in written:
+        print(f"  {w.month}: {w.rows} rows in {w.sic_codes} SIC partitions")
+        totals["rows"] += w.rows
+        totals["partitions"] += w.sic_codes
+    print(f"Months refreshed: {len(written)} | rows={totals['rows']} | partitions={totals['partitions']}")
+    print(f"Dataset: {args.out}")
+
+
+if __name__ == "__main__":
+    main()
@@ -1,23 +1,10 @@
-import os
-import pyodbc
-from dotenv import load_dotenv
-from pathlib import Path
+from src.db.storage import get_storage
 
-# (repo-safe)
-ENV_PATH = Path(__file__).resolve().parents[2] / ".env"
-load_dotenv(dotenv_path=ENV_PATH)
 
 def get_conn():
-    server = os.getenv("SQL_SERVER")
-    database = os.getenv("SQL_DATABASE")
-    if not server or not database:
-        raise ValueError("Missing SQL_SERVER or SQL_DATABASE in .env")
-
-    conn_str = (
-        "DRIVER={ODBC Driver 18 for SQL Server};"
-        f"SERVER={server};"
-        f"DATABASE={database};"
-        "Trusted_Connection=yes;"
-        "TrustServerCertificate=yes;"
-    )
-    return pyodbc.connect(conn_str)
+    """
+    Pooled connection from the configured storage backend (STORAGE_BACKEND).
+    Use as `with get_conn() as conn:`; it commits on success and goes back
+    to the pool on exit.
+    """
+    return get_storage().connection()
@@ -0,0 +1,124 @@
+from __future__ import annotations
+
+import argparse
+import hashlib
+import re
+from dataclasses import dataclass
+from pathlib import Path
+from typing import Dict, List, Optional
+
+from src.db.storage import Storage, get_storage
+
+# sql/migrations/<backend>/NNNN_description.sql, applied in version order
+MIGRATIONS_DIR = Path(__file__).resolve().parents[2] / "sql" / "migrations"
+
+_FILENAME = re.compile(r"^(\d{4})_([a-z0-9_]+)\.sql$")
+
+
+@dataclass(frozen=True)
+class Migration:
+    version: int
+    name: str
+    path: Path
+
+    def sql(self) -> str:
+        return self.path.read_text(encoding="utf-8")
+
+    def checksum(self) -> str:
+        return hashlib.sha256(self.path.read_bytes()).hexdigest()
+
+
+def discover(backend: str, root: Path = MIGRATIONS_DIR) -> List[Migration]:
+    folder = root / backend
+    if not folder.is_dir():
+        raise RuntimeError(f"No migrations folder for backend {backend!r}: {folder}")
+
+    found: Dict[int, Migration] = {}
+    for path in sorted(folder.glob("*.sql")):
+        m = _FILENAME.match(path.name)
+        if m is None:
+            raise RuntimeError(f"Bad migration file name {path.name!r} (expected NNNN_description.sql)")
+        version = int(m.group(1))
+        if version in found:
+            raise RuntimeError(f"Duplicate migration version {version}: {found[version].path.name}, {path.name}")
+        found[version] = Migration(version, m.group(2), path)
+    return [found[v] for v in sorted(found)]
+
+
+def applied_checksums(storage: Storage, cur) -> Dict[int, str]:
+    storage.ensure_schema_version_table(cur)
+    cur.execute(f"SELECT version, checksum FROM {storage.t('schema_version')};")
+    return {int(v): c.strip() for v, c in cur.fetchall()}
+
+
+def current_version(storage: Storage, cur) -> int:
+    return max(applied_checksums(storage, cur), default=0)
+
+
+def migrate(storage: Storage, conn, target: Optional[int] = None, quiet: bool = False) -> List[Migration]:
+    """
+    Apply pending migrations up to target (default: latest), each in its own
+    transaction together with its schema_version row. Refuses to run if an
+    already-applied migration file has been edited since.
+    """
+    cur = conn.cursor()
+    applied = applied_checksums(storage, cur)
+    conn.commit()
+
+    done: List[Migration] = []
+    for mig in discover(storage.name):
+        if mig.version in applied:
+            if applied[mig.version] != mig.checksum():
+                raise RuntimeError(
+                    f"Migration {mig.path.name} was modified after it was applied; add a new migration instead"
+                )
+            continue
+        if target is not None and mig.version > target:
+            break
+
+        if not quiet:
+            print(f"Applying migration {mig.path.name}")
+        try:
+            storage.run_script(cur, mig.sql())
+            cur.execute(
+                f"INSERT INTO {storage.t('schema_version')} (version, name, checksum) VALUES (?, ?, ?);",
+                (mig.version, mig.name, mig.checksum()),
+            )
+            conn.commit()
+        except Exception:
+            conn.rollback()
+            raise
+        done.append(mig)
+
+    return done
+
+
+def main(argv: Optional[List[str]] = None) -> None:
+    """
+    Usage:
+        python -m src.db.migrate             # apply everything pending
+        python -m src.db.migrate --to 2      # stop after version 2
+        python -m src.db.migrate --status
+    """
+    parser = argparse.ArgumentParser(description="Apply versioned schema migrations")
+    parser.add_argument("--to", type=int, metavar="VERSION", help="highest version to apply")
+    parser.add_argument("--status", action="store_true", help="list migrations and exit")
+    args = parser.parse_args(argv)
+
+    storage = get_storage()
+    with storage.connection() as conn:
+        if args.status:
+            applied = applied_checksums(storage, conn.cursor())
+            for mig in discover(storage.name):
+                state = "applied" if mig.version in applied else "pending"
+                print(f"{mig.version:04d} {mig.name:<40} {state}")
+            return
+
+        done = migrate(storage, conn, target=args.to)
+        version = current_version(storage, conn.cursor())
+
+    print(f"{storage.name}: applied {len(done)} migration(s); schema version {version}")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,108 @@
+from __future__ import annotations
+
+import queue
+import threading
+from contextlib import contextmanager
+from typing import Any, Callable, Iterator, List
+
+
+class ConnectionPool:
+    """
+    Small thread-safe pool of DB-API connections.
+
+    Connections are opened lazily by `connect` (up to max_size at once) and
+    handed back for reuse instead of being closed. A connection that comes
+    back after an error is rolled back; if that fails it is discarded.
+    """
+
+    def __init__(self, connect: Callable[[], Any], max_size: int = 4, timeout: float = 60.0) -> None:
+        if max_size < 1:
+            raise ValueError("max_size must be >= 1")
+        self._connect = connect
+        self._max_size = max_size
+        self._timeout = timeout
+        self._idle: "queue.LifoQueue[Any]" = queue.LifoQueue()
+        self._lock = threading.Lock()
+        self._opened = 0
+        self._closed = False
+
+    @property
+    def opened(self) -> int:
+        return self._opened
+
+    @property
+    def max_size(self) -> int:
+        return self._max_size
+
+    def resize(self, max_size: int) -> None:
+        """Raise or lower the cap; existing connections are not closed."""
+        if max_size < 1:
+            raise ValueError("max_size must be >= 1")
+        with self._lock:
+            self._max_size = max_size
+
+    def acquire(self) -> Any:
+        if self._closed:
+            raise RuntimeError("ConnectionPool is closed")
+        try:
+            return self._idle.get_nowait()
+        except queue.Empty:
+            pass
+
+        with self._lock:
+            can_open = self._opened < self._max_size
+            if can_open:
+                self._opened += 1
+        if can_open:
+            try:
+                return self._connect()
+            except Exception:
+                with self._lock:
+                    self._opened -= 1
+                raise
+
+        try:
+            return self._idle.get(timeout=self._timeout)
+        except queue.Empty:
+            raise RuntimeError(f"No pooled connection free after {self._timeout}s (max_size={self._max_size})")
+
+    def release(self, conn: Any, *, broken: bool = False) -> None:
+        if not broken:
+            try:
+                conn.rollback()  # never hand out a connection mid-transaction
+            except Exception:
+                broken = True
+
+        if broken or self._closed:
+            self._discard(conn)
+            return
+        self._idle.put(conn)
+
+    def _discard(self, conn: Any) -> None:
+        with self._lock:
+            self._opened -= 1
+        try:
+            conn.close()
+        except Exception:
+            pass
+
+    @contextmanager
+    def connection(self) -> Iterator[Any]:
+        conn = self.acquire()
+        try:
+            yield conn
+        except BaseException:
+            self.release(conn)
+            raise
+        self.release(conn)
+
+    def close(self) -> None:
+        self._closed = True
+        idle: List[Any] = []
+        while True:
+            try:
+                idle.append(self._idle.get_nowait())
+            except queue.Empty:
+                break
+        for conn in idle:
+            self._discard(conn)
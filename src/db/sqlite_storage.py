@@ -0,0 +1,217 @@
+from __future__ import annotations
+
+import os
+import sqlite3
+import threading
+from pathlib import Path
+from typing import Any, Dict, List, Optional, Tuple
+
+from src.db.migrate import migrate
+from src.db.storage import Storage, _chunks
+
+REPO_ROOT = Path(__file__).resolve().parents[2]
+
+SQLITE_PATH = Path(os.getenv("SQLITE_PATH", str(REPO_ROOT / "data" / "pipeline.sqlite")))
+
+
+class SqliteStorage(Storage):
+    """
+    Single-file backend for laptops and CI. WAL mode lets pooled connections
+    read while one of them writes; pending migrations are applied on first
+    connect.
+    """
+
+    name = "sqlite"
+
+    def __init__(self, path: Path = SQLITE_PATH, **kwargs) -> None:
+        self.path = Path(path)
+        self._schema_lock = threading.Lock()
+        self._schema_ready = False
+        super().__init__(**kwargs)
+
+    def _connect(self) -> Any:
+        self.path.parent.mkdir(parents=True, exist_ok=True)
+        # Pooled connections move between threads, one user at a time
+        conn = sqlite3.connect(self.path, timeout=60, check_same_thread=False)
+        conn.execute("PRAGMA journal_mode=WAL;")
+        conn.execute("PRAGMA synchronous=NORMAL;")
+        conn.execute("PRAGMA foreign_keys=ON;")
+
+        with self._schema_lock:
+            if not self._schema_ready:
+                migrate(self, conn, quiet=True)
+                self._schema_ready = True
+        return conn
+
+    def describe(self, cur) -> Tuple[str, List[str]]:
+        cur.execute("SELECT name FROM sqlite_master WHERE type = 'table' AND name NOT LIKE 'sqlite_%' ORDER BY name;")
+        return str(self.path), [row[0] for row in cur.fetchall()]
+
+    def ensure_schema_version_table(self, cur) -> None:
+        cur.execute(
+            """
+            CREATE TABLE IF NOT EXISTS schema_version (
+                version INTEGER PRIMARY KEY,
+                name TEXT NOT NULL,
+                checksum TEXT NOT NULL,
+                applied_at TEXT DEFAULT CURRENT_TIMESTAMP
+            );
+            """
+        )
+
+    def run_script(self, cur, sql: str) -> None:
+        # executescript() would commit first; run statement by statement
+        # inside an explicit transaction so DDL rolls back with the rest.
+        if not cur.connection.in_transaction:
+            cur.execute("BEGIN;")
+        statement = ""
+        for line in sql.splitlines(keepends=True):
+            statement += line
+            if sqlite3.complete_statement(statement):
+                cur.execute(statement)
+                statement = ""
+        if statement.strip() and not statement.strip().startswith("--"):
+            cur.execute(statement)
+
+    def start_run(self, cur, note: str, parent_run_id: Optional[int] = None) -> int:
+        cur.execute(
+            "INSERT INTO ingestion_log (records_inserted, source, status, parent_run_id) VALUES (?, ?, ?, ?);",
+            (0, self.run_note(note), "running", parent_run_id),
+        )
+        if cur.lastrowid is None:
+            raise RuntimeError("start_run(): could not retrieve run_id from ingestion_log insert")
+        return int(cur.lastrowid)
+
+    def upsert_companies(self, cur, companies, addresses, sic_links) -> None:
+        """
+        In-process, so plain executemany is already set-based enough: one
+        upsert for companies, then delete + insert for addresses and SIC links.
+        """
+        # One writer at a time, so MAX + 1 (read under the write lock) is always a new version
+        cur.executemany(
+            """
+            INSERT INTO companies (
+                company_number, company_name, company_status, incorporation_date, company_type,
+                content_hash, first_seen_run_id, last_seen_run_id, last_seen_at, row_version, changed_run_id
+            )
+            VALUES (
+                ?1, ?2, ?3, ?4, ?5, ?7, ?6, ?6, CASE WHEN ?6 IS NULL THEN NULL ELSE CURRENT_TIMESTAMP END,
+                (SELECT COALESCE(MAX(row_version), 0) + 1 FROM companies), ?6
+            )
+            ON CONFLICT (company_number) DO UPDATE SET
+                company_name = excluded.company_name,
+                company_status = excluded.company_status,
+                incorporation_date = excluded.incorporation_date,
+                company_type = excluded.company_type,
+                content_hash = excluded.content_hash,
+                row_version = CASE
+                    WHEN companies.content_hash IS excluded.content_hash THEN companies.row_version
+                    ELSE excluded.row_version
+                END,
+                changed_run_id = CASE
+                    WHEN companies.content_hash IS excluded.content_hash THEN companies.changed_run_id
+                    ELSE excluded.changed_run_id
+                END,
+                -- The date before the run's first change to the company, not an in-run one
+                prev_incorporation_date = CASE
+                    WHEN companies.content_hash IS excluded.content_hash THEN companies.prev_incorporation_date
+                    WHEN companies.changed_run_id IS excluded.changed_run_id THEN companies.prev_incorporation_date
+                    ELSE companies.incorporation_date
+                END,
+                last_seen_run_id = COALESCE(excluded.last_seen_run_id, companies.last_seen_run_id),
+                last_seen_at = COALESCE(excluded.last_seen_at, companies.last_seen_at);
+            """,
+            companies,
+        )
+
+        numbers = [(row[0],) for row in companies]
+        coords = self._stored_coordinates(cur, [n for (n,) in numbers])
+        cur.executemany("DELETE FROM company_addresses WHERE company_number = ?;", numbers)
+        cur.executemany(
+            """
+            INSERT INTO company_addresses (company_number, locality, region, postal_code, country, latitude, longitude)
+            VALUES (?, ?, ?, ?, ?, ?, ?);
+            """,
+            [(*a, *coords.get((a[0], a[3]), (None, None))) for a in addresses],
+        )
+
+        cur.executemany("DELETE FROM company_sic WHERE company_number = ?;", numbers)
+        self.add_sic_codes(cur, {sic for _, sic in sic_links})
+        cur.executemany("INSERT INTO company_sic (company_number, sic_code) VALUES (?, ?);", sic_links)
+
+    def _stored_coordinates(self, cur, company_numbers: List[str]) -> Dict[Tuple[str, str], Tuple[float, float]]:
+        """(company_number, postal_code) -> (latitude, longitude) for geocoded addresses."""
+        coords: Dict[Tuple[str, str], Tuple[float, float]] = {}
+        for chunk in _chunks(company_numbers, self.max_params):
+            cur.execute(
+                f"""
+                SELECT company_number, postal_code, latitude, longitude
+                FROM company_addresses
+                WHERE latitude IS NOT NULL AND company_number IN ({",".join(["?"] * len(chunk))});
+                """,
+                tuple(chunk),
+            )
+            for number, pc, lat, lon in cur.fetchall():
+                coords[(number, pc)] = (lat, lon)
+        return coords
+
+    def touch_companies(self, cur, company_numbers, run_id) -> None:
+        cur.executemany(
+            "UPDATE companies SET last_seen_run_id = ?, last_seen_at = CURRENT_TIMESTAMP WHERE company_number = ?;",
+            [(run_id, n) for n in company_numbers],
+        )
+
+    def upsert_sic_codes(self, cur, rows) -> None:
+        cur.executemany(
+            """
+            INSERT INTO sic_codes (sic_code, description, level, parent_code, section)
+            VALUES (?, ?, ?, ?, ?)
+            ON CONFLICT (sic_code) DO UPDATE SET
+                description = COALESCE(excluded.description, sic_codes.description),
+                level = excluded.level,
+                parent_code = excluded.parent_code,
+                section = excluded.section;
+            """,
+            rows,
+        )
+
+    def save_checkpoint(self, cur, run_id, cursor_key, start_index, records_committed) -> None:
+        cur.execute(
+            """
+            INSERT INTO ingestion_checkpoint (run_id, cursor_key, start_index, records_committed, updated_at)
+            VALUES (?, ?, ?, ?, CURRENT_TIMESTAMP)
+            ON CONFLICT (run_id) DO UPDATE SET
+                cursor_key = excluded.cursor_key,
+                start_index = excluded.start_index,
+                records_committed = excluded.records_committed,
+                updated_at = excluded.updated_at;
+            """,
+            (run_id, cursor_key, start_index, records_committed),
+        )
+
+    def _fresh_profiles_sql(self, placeholders: str) -> str:
+        return f"""
+            SELECT company_number
+            FROM company_profiles
+            WHERE fetched_at >= datetime('now', '-' || ? || ' days')
+              AND company_number IN ({placeholders});
+            """
+
+    def write_profiles(self, cur, rows) -> None:
+        cur.executemany(
+            """
+            INSERT INTO company_profiles (
+                company_number, accounts_next_due, accounts_last_made_up_to,
+                accounts_overdue, previous_names, sic_codes, fetched_at
+            )
+            VALUES (?, ?, ?, ?, ?, ?, CURRENT_TIMESTAMP)
+            ON CONFLICT (company_number) DO UPDATE SET
+                accounts_next_due = excluded.accounts_next_due,
+                accounts_last_made_up_to = excluded.accounts_last_made_up_to,
+                accounts_overdue = excluded.accounts_overdue,
+                previous_names = excluded.previous_names,
+                sic_codes = excluded.sic_codes,
+                fetched_at = excluded.fetched_at;
+            """,
+            rows,
+        )
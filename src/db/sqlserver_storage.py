@@ -0,0 +1,332 @@
+from __future__ import annotations
+
+import os
+import re
+from typing import Any, List, Optional, Tuple
+
+from src.db.storage import Storage
+
+# Batch separator in migration scripts (a line containing only GO)
+_GO = re.compile(r"^\s*GO\s*;?\s*$", re.IGNORECASE | re.MULTILINE)
+
+
+def connection_string() -> str:
+    """
+    ODBC connection string from .env: SQL_SERVER and SQL_DATABASE, plus
+    SQL_USER/SQL_PASSWORD for SQL authentication (trusted connection
+    otherwise) and an optional SQL_DRIVER.
+    """
+    server = os.getenv("SQL_SERVER")
+    database = os.getenv("SQL_DATABASE")
+    if not server or not database:
+        raise ValueError("Missing SQL_SERVER or SQL_DATABASE in .env")
+
+    driver = os.getenv("SQL_DRIVER", "ODBC Driver 18 for SQL Server")
+    user = os.getenv("SQL_USER")
+    auth = f"UID={user};PWD={os.getenv('SQL_PASSWORD', '')};" if user else "Trusted_Connection=yes;"
+    return (
+        f"DRIVER={{{driver}}};"
+        f"SERVER={server};"
+        f"DATABASE={database};"
+        f"{auth}"
+        "TrustServerCertificate=yes;"
+    )
+
+
+class SqlServerStorage(Storage):
+    name = "sqlserver"
+    schema = "dbo."
+    now_sql = "SYSUTCDATETIME()"
+    max_params = 2000  # SQL Server allows ~2100 parameters per statement
+
+    def _connect(self) -> Any:
+        import pyodbc
+
+        return pyodbc.connect(connection_string())
+
+    def describe(self, cur) -> Tuple[str, List[str]]:
+        cur.execute("SELECT DB_NAME();")
+        name = cur.fetchone()[0]
+        cur.execute(
+            """
+            SELECT TABLE_NAME
+            FROM INFORMATION_SCHEMA.TABLES
+            WHERE TABLE_TYPE='BASE TABLE'
+            ORDER BY TABLE_NAME;
+            """
+        )
+        return name, [row[0] for row in cur.fetchall()]
+
+    def ensure_schema_version_table(self, cur) -> None:
+        cur.execute(
+            """
+            IF OBJECT_ID('dbo.schema_version') IS NULL
+                CREATE TABLE dbo.schema_version (
+                    version INT PRIMARY KEY,
+                    name NVARCHAR(200) NOT NULL,
+                    checksum CHAR(64) NOT NULL,
+                    applied_at DATETIME2 DEFAULT SYSUTCDATETIME()
+                );
+            """
+        )
+
+    def run_script(self, cur, sql: str) -> None:
+        for batch in _GO.split(sql):
+            if batch.strip():
+                cur.execute(batch)
+
+    def start_run(self, cur, note: str, parent_run_id: Optional[int] = None) -> int:
+        cur.execute(
+            """
+            INSERT INTO dbo.ingestion_log (records_inserted, source, status, parent_run_id)
+            OUTPUT INSERTED.run_id
+            VALUES (?, ?, ?, ?);
+            """,
+            (0, self.run_note(note), "running", parent_run_id),
+        )
+        row = cur.fetchone()
+        if row is None or row[0] is None:
+            raise RuntimeError("start_run(): could not retrieve run_id from ingestion_log insert")
+        return int(row[0])
+
+    def _binary_order(self, column: str) -> str:
+        return f"{column} COLLATE Latin1_General_BIN2"
+
+    def _ensure_staging_tables(self, cur) -> None:
+        """Create the session-scoped #staging tables; they live as long as the pooled connection."""
+        cur.execute(
+            """
+            IF OBJECT_ID('tempdb..#stg_companies') IS NULL
+                CREATE TABLE #stg_companies (
+                    company_number VARCHAR(20) NOT NULL PRIMARY KEY,
+                    company_name NVARCHAR(255),
+                    company_status VARCHAR(50),
+                    incorporation_date DATE,
+                    company_type VARCHAR(50),
+                    run_id INT NULL,
+                    content_hash BIGINT NOT NULL
+                );
+            IF OBJECT_ID('tempdb..#stg_addresses') IS NULL
+                CREATE TABLE #stg_addresses (
+                    company_number VARCHAR(20) NOT NULL PRIMARY KEY,
+                    locality NVARCHAR(100),
+                    region NVARCHAR(100),
+                    postal_code VARCHAR(20),
+                    country VARCHAR(50),
+                    latitude FLOAT NULL,
+                    longitude FLOAT NULL
+                );
+            IF OBJECT_ID('tempdb..#stg_sic') IS NULL
+                CREATE TABLE #stg_sic (
+                    company_number VARCHAR(20) NOT NULL,
+                    sic_code VARCHAR(10) NOT NULL,
+                    PRIMARY KEY (company_number, sic_code)
+                );
+            IF OBJECT_ID('tempdb..#stg_seen') IS NULL
+                CREATE TABLE #stg_seen (
+                    company_number VARCHAR(20) NOT NULL PRIMARY KEY
+                );
+            """
+        )
+
+    def upsert_companies(self, cur, companies, addresses, sic_links) -> None:
+        """
+        Bulk-load the batch into #staging tables (fast_executemany), then apply
+        it with one MERGE into companies and one DELETE + INSERT each for
+        company_addresses (keeping coordinates of unchanged postcodes) and
+        company_sic (registering unseen SIC codes).
+        """
+        self._ensure_staging_tables(cur)
+        cur.execute("TRUNCATE TABLE #stg_companies; TRUNCATE TABLE #stg_addresses; TRUNCATE TABLE #stg_sic;")
+
+        cur.fast_executemany = True
+        cur.executemany(
+            """
+            INSERT INTO #stg_companies
+            (company_number, company_name, company_status, incorporation_date, company_type, run_id, content_hash)
+            VALUES (?, ?, ?, ?, ?, ?, ?);
+            """,
+            companies,
+        )
+        cur.executemany(
+            """
+            INSERT INTO #stg_addresses (company_number, locality, region, postal_code, country)
+            VALUES (?, ?, ?, ?, ?);
+            """,
+            addresses,
+        )
+        if sic_links:
+            cur.executemany("INSERT INTO #stg_sic (company_number, sic_code) VALUES (?, ?);", sic_links)
+        cur.fast_executemany = False
+
+        cur.execute(
+            """
+            SET NOCOUNT ON;
+
+            DECLARE @row_version BIGINT = NEXT VALUE FOR dbo.company_row_version;
+
+            MERGE dbo.companies AS tgt
+            USING #stg_companies AS src
+            ON tgt.company_number = src.company_number
+            WHEN MATCHED THEN
+                UPDATE SET
+                    company_name = src.company_name,
+                    company_status = src.company_status,
+                    incorporation_date = src.incorporation_date,
+                    company_type = src.company_type,
+                    content_hash = src.content_hash,
+                    row_version = CASE
+                        WHEN tgt.content_hash = src.content_hash THEN tgt.row_version
+                        ELSE @row_version
+                    END,
+                    changed_run_id = CASE
+                        WHEN tgt.content_hash = src.content_hash THEN tgt.changed_run_id
+                        ELSE src.run_id
+                    END,
+                    -- The date before the run's first change to the company, not an in-run one
+                    prev_incorporation_date = CASE
+                        WHEN tgt.content_hash = src.content_hash THEN tgt.prev_incorporation_date
+                        WHEN tgt.changed_run_id = src.run_id THEN tgt.prev_incorporation_date
+                        ELSE tgt.incorporation_date
+                    END,
+                    last_seen_run_id = COALESCE(src.run_id, tgt.last_seen_run_id),
+                    last_seen_at = CASE WHEN src.run_id IS NULL THEN tgt.last_seen_at ELSE SYSUTCDATETIME() END
+            WHEN NOT MATCHED THEN
+                INSERT (
+                    company_number, company_name, company_status, incorporation_date, company_type,
+                    content_hash, first_seen_run_id, last_seen_run_id, last_seen_at, row_version, changed_run_id
+                )
+                VALUES (
+                    src.company_number, src.company_name, src.company_status, src.incorporation_date,
+                    src.company_type, src.content_hash, src.run_id, src.run_id,
+                    CASE WHEN src.run_id IS NULL THEN NULL ELSE SYSUTCDATETIME() END,
+                    @row_version, src.run_id
+                );
+
+            UPDATE s
+            SET latitude = a.latitude, longitude = a.longitude
+            FROM #stg_addresses s
+            INNER JOIN dbo.company_addresses a
+                ON a.company_number = s.company_number AND a.postal_code = s.postal_code;
+
+            DELETE a
+            FROM dbo.company_addresses a
+            INNER JOIN #stg_companies s ON s.company_number = a.company_number;
+
+            INSERT INTO dbo.company_addresses (company_number, locality, region, postal_code, country, latitude, longitude)
+            SELECT company_number, locality, region, postal_code, country, latitude, longitude
+            FROM #stg_addresses;
+
+            DELETE cs
+            FROM dbo.company_sic cs
+            INNER JOIN #stg_companies s ON s.company_number = cs.company_number;
+
+            INSERT INTO dbo.sic_codes (sic_code)
+            SELECT DISTINCT s.sic_code
+            FROM #stg_sic s
+            WHERE NOT EXISTS (SELECT 1 FROM dbo.sic_codes sc WHERE sc.sic_code = s.sic_code);
+
+            INSERT INTO dbo.company_sic (company_number, sic_code)
+            SELECT company_number, sic_code
+            FROM #stg_sic;
+            """
+        )
+
+    def touch_companies(self, cur, company_numbers, run_id) -> None:
+        self._ensure_staging_tables(cur)
+        cur.execute("TRUNCATE TABLE #stg_seen;")
+        cur.fast_executemany = True
+        cur.executemany("INSERT INTO #stg_seen (company_number) VALUES (?);", [(n,) for n in company_numbers])
+        cur.fast_executemany = False
+        cur.execute(
+            """
+            UPDATE c
+            SET last_seen_run_id = ?, last_seen_at = SYSUTCDATETIME()
+            FROM dbo.companies c
+            INNER JOIN #stg_seen s ON s.company_number = c.company_number;
+            """,
+            (run_id,),
+        )
+
+    def insert_changes(self, cur, rows) -> None:
+        cur.fast_executemany = True
+        super().insert_changes(cur, rows)
+        cur.fast_executemany = False
+
+    def set_address_coordinates(self, cur, rows) -> None:
+        cur.fast_executemany = True
+        super().set_address_coordinates(cur, rows)
+        cur.fast_executemany = False
+
+    def upsert_sic_codes(self, cur, rows) -> None:
+        cur.executemany(
+            """
+            MERGE dbo.sic_codes AS tgt
+            USING (SELECT ? AS sic_code, ? AS description, ? AS level, ? AS parent_code, ? AS section) AS src
+            ON tgt.sic_code = src.sic_code
+            WHEN MATCHED THEN
+                UPDATE SET
+                    description = COALESCE(src.description, tgt.description),
+                    level = src.level,
+                    parent_code = src.parent_code,
+                    section = src.section
+            WHEN NOT MATCHED THEN
+                INSERT (sic_code, description, level, parent_code, section)
+                VALUES (src.sic_code, src.description, src.level, src.parent_code, src.section);
+            """,
+            rows,
+        )
+
+    def save_checkpoint(self, cur, run_id, cursor_key, start_index, records_committed) -> None:
+        cur.execute(
+            """
+            MERGE dbo.ingestion_checkpoint AS tgt
+            USING (SELECT ? AS run_id) AS src
+            ON tgt.run_id = src.run_id
+            WHEN MATCHED THEN
+                UPDATE SET
+                    cursor_key = ?,
+                    start_index = ?,
+                    records_committed = ?,
+                    updated_at = SYSUTCDATETIME()
+            WHEN NOT MATCHED THEN
+                INSERT (run_id, cursor_key, start_index, records_committed, updated_at)
+                VALUES (?, ?, ?, ?, SYSUTCDATETIME());
+            """,
+            (
+                run_id, cursor_key, start_index, records_committed,
+                run_id, cursor_key, start_index, records_committed,
+            ),
+        )
+
+    def _fresh_profiles_sql(self, placeholders: str) -> str:
+        return f"""
+            SELECT company_number
+            FROM dbo.company_profiles
+            WHERE fetched_at >= DATEADD(day, -?, SYSUTCDATETIME())
+              AND company_number IN ({placeholders});
+            """
+
+    def write_profiles(self, cur, rows) -> None:
+        cur.executemany(
+            """
+            MERGE dbo.company_profiles AS tgt
+            USING (SELECT ? AS company_number, ? AS accounts_next_due, ? AS accounts_last_made_up_to,
+                          ? AS accounts_overdue, ? AS previous_names, ? AS sic_codes) AS src
+            ON tgt.company_number = src.company_number
+            WHEN MATCHED THEN
+                UPDATE SET
+                    accounts_next_due = src.accounts_next_due,
+                    accounts_last_made_up_to = src.accounts_last_made_up_to,
+                    accounts_overdue = src.accounts_overdue,
+                    previous_names = src.previous_names,
+                    sic_codes = src.sic_codes,
+                    fetched_at = SYSUTCDATETIME()
+            WHEN NOT MATCHED THEN
+                INSERT (company_number, accounts_next_due, accounts_last_made_up_to,
+                        accounts_overdue, previous_names, sic_codes, fetched_at)
+                VALUES (src.company_number, src.accounts_next_due, src.accounts_last_made_up_to,
+                        src.accounts_overdue, src.previous_names, src.sic_codes, SYSUTCDATETIME());
+            """,
+            rows,
+        )
@@ -0,0 +1,662 @@
+from __future__ import annotations
+
+import os
+import threading
+from contextlib import contextmanager
+from pathlib import Path
+from typing import Any, Dict, Iterable, Iterator, List, Optional, Sequence, Tuple
+
+from dotenv import load_dotenv
+
+from src.db.pool import ConnectionPool
+
+# (repo-safe)
+ENV_PATH = Path(__file__).resolve().parents[2] / ".env"
+load_dotenv(dotenv_path=ENV_PATH)
+
+# 'sqlserver' (default) or 'sqlite'
+STORAGE_BACKEND = os.getenv("STORAGE_BACKEND", "sqlserver").strip().lower()
+
+# Connections kept per process; parallel workers each hold one
+DB_POOL_SIZE = int(os.getenv("DB_POOL_SIZE", "4"))
+
+# ingestion_log.source width; longer run notes are cut to fit
+RUN_NOTE_MAX = 400
+
+
+def _chunks(seq: Sequence, n: int) -> Iterator[Sequence]:
+    for i in range(0, len(seq), n):
+        yield seq[i:i + n]
+
+
+class Storage:
+    """
+    What the ingest, export and logging code needs from the database.
+
+    Statements that are portable between backends live here, written against
+    `self.t(table)` and `self.now_sql`; subclasses supply the connection and
+    the dialect-specific writes. Every method takes an open cursor and leaves
+    the transaction to the caller, as the ingest scripts always have.
+    """
+
+    name = "base"
+    schema = ""                     # table prefix, e.g. 'dbo.'
+    now_sql = "CURRENT_TIMESTAMP"   # UTC timestamp expression
+    max_params = 999                # bound parameters per statement
+
+    def __init__(self, pool_size: int = DB_POOL_SIZE) -> None:
+        self._pool = ConnectionPool(self._connect, max_size=pool_size)
+
+    # -- connections -------------------------------------------------------
+
+    def _connect(self) -> Any:
+        raise NotImplementedError
+
+    @contextmanager
+    def connection(self) -> Iterator[Any]:
+        """
+        Borrow a pooled connection. Commits on a clean exit and rolls back on
+        error (the pyodbc `with conn:` semantics), then returns it to the pool.
+        """
+        with self._pool.connection() as conn:
+            yield conn
+            conn.commit()
+
+    def ensure_pool_size(self, size: int) -> None:
+        """Make room for `size` connections held at once (e.g. one per worker)."""
+        if size > self._pool.max_size:
+            self._pool.resize(size)
+
+    def close(self) -> None:
+        self._pool.close()
+
+    def t(self, table: str) -> str:
+        return f"{self.schema}{table}"
+
+    def describe(self, cur) -> Tuple[str, List[str]]:
+        """(database name, base table names)."""
+        raise NotImplementedError
+
+    # -- migrations --------------------------------------------------------
+
+    def ensure_schema_version_table(self, cur) -> None:
+        raise NotImplementedError
+
+    def run_script(self, cur, sql: str) -> None:
+        """Execute a multi-statement migration script inside the current transaction."""
+        raise NotImplementedError
+
+    # -- ingestion_log -----------------------------------------------------
+
+    @staticmethod
+    def run_note(note: str) -> str:
+        """note cut to RUN_NOTE_MAX, keeping its start (resume matches on the prefix)."""
+        return note if len(note) <= RUN_NOTE_MAX else note[: RUN_NOTE_MAX - 3] + "..."
+
+    def start_run(self, cur, note: str, parent_run_id: Optional[int] = None) -> int:
+        """Insert a 'running' ingestion_log row and return its run_id."""
+        raise NotImplementedError
+
+    def finish_run(self, cur, run_id: int, status: str, records_inserted: int) -> None:
+        cur.execute(
+            f"UPDATE {self.t('ingestion_log')} SET status = ?, records_inserted = ? WHERE run_id = ?;",
+            (status, records_inserted, run_id),
+        )
+
+    def log_run(self, cur, note: str, status: str, records_inserted: int) -> None:
+        """One-shot log row for scripts that do not track a run_id."""
+        cur.execute(
+            f"INSERT INTO {self.t('ingestion_log')} (records_inserted, source, status) VALUES (?, ?, ?);",
+            (records_inserted, self.run_note(note), status),
+        )
+
+    def get_run(self, cur, run_id: int) -> Optional[Tuple[str, str]]:
+        """(source, status) of a run, or None."""
+        cur.execute(f"SELECT source, status FROM {self.t('ingestion_log')} WHERE run_id = ?;", (run_id,))
+        row = cur.fetchone()
+        return None if row is None else (row[0], row[1])
+
+    def child_runs(self, cur, parent_run_id: int) -> List[Tuple[int, str, str, int]]:
+        """(run_id, source, status, records_inserted) of a parent's child runs, oldest first."""
+        cur.execute(
+            f"""
+            SELECT run_id, source, status, records_inserted
+            FROM {self.t('ingestion_log')}
+            WHERE parent_run_id = ?
+            ORDER BY run_id;
+            """,
+            (parent_run_id,),
+        )
+        return [(int(r[0]), r[1], r[2], int(r[3] or 0)) for r in cur.fetchall()]
+
+    def set_run_status(self, cur, run_id: int, status: str) -> None:
+        cur.execute(f"UPDATE {self.t('ingestion_log')} SET status = ? WHERE run_id = ?;", (status, run_id))
+
+    def latest_success_run_id(self, cur, source_like: Optional[str] = None) -> Optional[int]:
+        sql = f"SELECT MAX(run_id) FROM {self.t('ingestion_log')} WHERE status = 'success'"
+        params: tuple = ()
+        if source_like is not None:
+            sql += " AND source LIKE ?"
+            params = (source_like,)
+        cur.execute(sql + ";", params)
+        row = cur.fetchone()
+        return None if row is None or row[0] is None else int(row[0])
+
+    # -- companies ---------------------------------------------------------
+
+    def upsert_companies(
+        self,
+        cur,
+        companies: List[tuple],
+        addresses: List[tuple],
+        sic_links: List[Tuple[str, str]],
+    ) -> None:
+        """
+        Apply one batch, set-based:
+          companies  (company_number, company_name, company_status, incorporation_date,
+                      company_type, run_id, content_hash), upserted; a NULL run_id leaves
+                      the first/last-seen columns alone
+          addresses  (company_number, locality, region, postal_code, country), replacing
+                      the stored address of every company in the batch; latitude and
+                      longitude carry over where the postcode is unchanged
+          sic_links  (company_number, sic_code), replacing the batch's SIC links; codes
+                      missing from sic_codes are added there first, never dropped
+        """
+        raise NotImplementedError
+
+    def touch_companies(self, cur, company_numbers: List[str], run_id: int) -> None:
+        """Bump last_seen_run_id/last_seen_at for companies that did not change."""
+        raise NotImplementedError
+
+    def upsert_sic_codes(self, cur, rows: List[tuple]) -> None:
+        """Insert or update (sic_code, description, level, parent_code, section) reference rows."""
+        raise NotImplementedError
+
+    def add_sic_codes(self, cur, sic_codes: Iterable[str]) -> None:
+        """Register SIC codes missing from sic_codes (description left NULL)."""
+        codes = sorted({c for c in sic_codes if c})
+        if not codes:
+            return
+        cur.executemany(
+            f"""
+            INSERT INTO {self.t('sic_codes')} (sic_code, description)
+            SELECT ?, NULL
+            WHERE NOT EXISTS (SELECT 1 FROM {self.t('sic_codes')} WHERE sic_code = ?);
+            """,
+            [(c, c) for c in codes],
+        )
+
+    def company_state(self, cur, company_numbers: List[str]) -> Dict[str, dict]:
+        """
+        Stored fields of the given companies, as compared by the change log:
+        company_name, company_status, incorporation_date (ISO string),
+        company_type, address (locality, region, postal_code, country) and
+        sic_codes (frozenset). Unknown companies are absent.
+        """
+        state: Dict[str, dict] = {}
+        for chunk in _chunks(sorted(set(company_numbers)), self.max_params):
+            placeholders = ",".join(["?"] * len(chunk))
+            cur.execute(
+                f"""
+                SELECT company_number, company_name, company_status, incorporation_date, company_type
+                FROM {self.t('companies')}
+                WHERE company_number IN ({placeholders});
+                """,
+                tuple(chunk),
+            )
+            for number, name, status, inc, ctype in cur.fetchall():
+                state[number] = {
+                    "company_name": name,
+                    "company_status": status,
+                    "incorporation_date": None if inc is None else str(inc)[:10],
+                    "company_type": ctype,
+                    "address": None,
+                    "sic_codes": frozenset(),
+                }
+
+            cur.execute(
+                f"""
+                SELECT company_number, locality, region, postal_code, country
+                FROM {self.t('company_addresses')}
+                WHERE company_number IN ({placeholders});
+                """,
+                tuple(chunk),
+            )
+            for number, *addr in cur.fetchall():
+                if number in state:
+                    state[number]["address"] = tuple(addr)
+
+            cur.execute(
+                f"""
+                SELECT company_number, sic_code
+                FROM {self.t('company_sic')}
+                WHERE company_number IN ({placeholders});
+                """,
+                tuple(chunk),
+            )
+            for number, sic in cur.fetchall():
+                if number in state:
+                    state[number]["sic_codes"] = state[number]["sic_codes"] | {sic}
+        return state
+
+    def insert_changes(self, cur, rows: List[tuple]) -> None:
+        """Append (run_id, company_number, change_type, changed_fields) rows to company_changes."""
+        cur.executemany(
+            f"""
+            INSERT INTO {self.t('company_changes')} (run_id, company_number, change_type, changed_fields)
+            VALUES (?, ?, ?, ?);
+            """,
+            rows,
+        )
+
+    def insert_quarantine(self, cur, rows: List[tuple]) -> None:
+        """Append (run_id, company_number, reasons, payload) rows to quarantined_items."""
+        cur.executemany(
+            f"""
+            INSERT INTO {self.t('quarantined_items')} (run_id, company_number, reasons, payload)
+            VALUES (?, ?, ?, ?);
+            """,
+            rows,
+        )
+
+    def _binary_order(self, column: str) -> str:
+        return column
+
+    def iter_fingerprints(self, cur, batch_size: int) -> Iterator[Tuple[str, int]]:
+        """(company_number, content_hash) in byte order of company_number."""
+        cur.execute(
+            f"""
+            SELECT company_number, content_hash
+            FROM {self.t('companies')}
+            WHERE content_hash IS NOT NULL
+            ORDER BY {self._binary_order('company_number')};
+            """
+        )
+        while True:
+            batch = cur.fetchmany(batch_size)
+            if not batch:
+                return
+            for number, h in batch:
+                yield number, int(h)
+
+    def companies_seen_in_run(self, cur, run_id: int) -> List[str]:
+        cur.execute(f"SELECT company_number FROM {self.t('companies')} WHERE last_seen_run_id = ?;", (run_id,))
+        return [r[0] for r in cur.fetchall()]
+
+    # -- geocoding ---------------------------------------------------------
+
+    def addresses_missing_coordinates(self, cur) -> List[Tuple[int, str]]:
+        """(address_id, postal_code) of addresses with a postcode but no latitude yet."""
+        cur.execute(
+            f"""
+            SELECT address_id, postal_code
+            FROM {self.t('company_addresses')}
+            WHERE latitude IS NULL AND postal_code IS NOT NULL
+            ORDER BY address_id;
+            """
+        )
+        return [(int(r[0]), r[1]) for r in cur.fetchall()]
+
+    def set_address_coordinates(self, cur, rows: List[tuple]) -> None:
+        """Apply (latitude, longitude, address_id) rows."""
+        cur.executemany(
+            f"UPDATE {self.t('company_addresses')} SET latitude = ?, longitude = ? WHERE address_id = ?;",
+            rows,
+        )
+
+    def select_companies_in_box(self, cur, min_lat: float, max_lat: float, min_lon: float, max_lon: float) -> None:
+        """Execute the geocoded-companies-in-bounding-box query; the caller fetches."""
+        cur.execute(
+            f"""
+            SELECT
+                c.company_number,
+                c.company_name,
+                c.company_status,
+                c.incorporation_date,
+                a.locality,
+                a.postal_code,
+                a.latitude,
+                a.longitude
+            FROM {self.t('company_addresses')} a
+            INNER JOIN {self.t('companies')} c
+                ON c.company_number = a.company_number
+            WHERE
+                a.latitude BETWEEN ? AND ?
+                AND a.longitude BETWEEN ? AND ?;
+            """,
+            (min_lat, max_lat, min_lon, max_lon),
+        )
+
+    # -- checkpoints -------------------------------------------------------
+
+    def save_checkpoint(self, cur, run_id: int, cursor_key: str, start_index: int, records_committed: int) -> None:
+        raise NotImplementedError
+
+    def load_checkpoint(self, cur, run_id: int) -> Optional[Tuple[str, int, int]]:
+        """(cursor_key, start_index, records_committed), or None."""
+        cur.execute(
+            f"""
+            SELECT cursor_key, start_index, records_committed
+            FROM {self.t('ingestion_checkpoint')}
+            WHERE run_id = ?;
+            """,
+            (run_id,),
+        )
+        row = cur.fetchone()
+        return None if row is None else (row[0], int(row[1]), int(row[2]))
+
+    # -- profiles ----------------------------------------------------------
+
+    def _fresh_profiles_sql(self, placeholders: str) -> str:
+        """SELECT company_number of profiles fetched within ? days, among the IN (...) list."""
+        raise NotImplementedError
+
+    def fresh_profile_numbers(self, cur, company_numbers: Iterable[str], max_age_days: int) -> set[str]:
+        wanted = sorted({n for n in company_numbers if n})
+        fresh: set[str] = set()
+        for chunk in _chunks(wanted, self.max_params - 1):
+            cur.execute(self._fresh_profiles_sql(",".join(["?"] * len(chunk))), (max_age_days, *chunk))
+            fresh.update(r[0] for r in cur.fetchall())
+        return fresh
+
+    def write_profiles(self, cur, rows: List[tuple]) -> None:
+        """
+        Upsert (company_number, accounts_next_due, accounts_last_made_up_to,
+        accounts_overdue, previous_names, sic_codes) rows into company_profiles.
+        """
+        raise NotImplementedError
+
+    # -- email outbox ------------------------------------------------------
+    # Timestamps are UTC 'YYYY-MM-DD HH:MM:SS' strings computed by the caller,
+    # which both backends compare and convert the same way.
+
+    def enqueue_emails(self, cur, rows: List[tuple]) -> None:
+        """Queue (run_id, recipient, subject, body, attachment_path, next_attempt_at) rows as 'pending'."""
+        cur.executemany(
+            f"""
+            INSERT INTO {self.t('email_outbox')}
+                (run_id, recipient, subject, body, attachment_path, status, attempts, next_attempt_at)
+            VALUES (?, ?, ?, ?, ?, 'pending', 0, ?);
+            """,
+            rows,
+        )
+
+    def due_emails(self, cur, now: str) -> List[Tuple[int, str, str, str, Optional[str], int]]:
+        """
+        (message_id, recipient, subject, body, attachment_path, attempts) of
+        messages due by now: pending ones, and claims that lapsed unsent.
+        """
+        cur.execute(
+            f"""
+            SELECT message_id, recipient, subject, body, attachment_path, attempts
+            FROM {self.t('email_outbox')}
+            WHERE status IN ('pending', 'sending') AND next_attempt_at <= ?
+            ORDER BY message_id;
+            """,
+            (now,),
+        )
+        return [(int(r[0]), r[1], r[2], r[3], r[4], int(r[5])) for r in cur.fetchall()]
+
+    def claim_email(self, cur, message_id: int, now: str, lease_until: str) -> bool:
+        """Mark a due message 'sending' until lease_until; False if another worker has it."""
+        cur.execute(
+            f"""
+            UPDATE {self.t('email_outbox')}
+            SET status = 'sending', attempts = attempts + 1, next_attempt_at = ?
+            WHERE message_id = ? AND status IN ('pending', 'sending') AND next_attempt_at <= ?;
+            """,
+            (lease_until, message_id, now),
+        )
+        return cur.rowcount == 1
+
+    def finish_email(
+        self,
+        cur,
+        message_id: int,
+        status: str,
+        next_attempt_at: str,
+        error: Optional[str] = None,
+    ) -> None:
+        """Record a delivery attempt: 'sent', 'pending' (retry at next_attempt_at) or 'failed'."""
+        cur.execute(
+            f"""
+            UPDATE {self.t('email_outbox')}
+            SET status = ?, next_attempt_at = ?, last_error = ?,
+                sent_at = CASE WHEN ? = 'sent' THEN {self.now_sql} ELSE sent_at END
+            WHERE message_id = ?;
+            """,
+            (status, next_attempt_at, error, status, message_id),
+        )
+
+    # -- exports -----------------------------------------------------------
+
+    def select_new_companies(self, cur, run_id: int) -> None:
+        """Execute the first-seen-in-run export query; the caller fetches."""
+        cur.execute(
+            f"""
+            SELECT
+                c.company_number,
+                c.company_name,
+                c.company_status,
+                c.incorporation_date,
+                a.locality,
+                a.region,
+                a.postal_code,
+                a.country
+            FROM {self.t('companies')} c
+            LEFT JOIN {self.t('company_addresses')} a
+                ON a.company_number = c.company_number
+            WHERE c.first_seen_run_id = ?
+            ORDER BY c.incorporation_date DESC;
+            """,
+            (run_id,),
+        )
+
+    def first_unfinished_change_id(self, cur, since_change_id: int) -> Optional[int]:
+        """
+        Lowest change_id after since_change_id that belongs to a run still
+        'running', or None. Such a run may yet commit rows below change ids
+        other runs have already committed, so a delta export stops short of it.
+        """
+        cur.execute(
+            f"""
+            SELECT MIN(ch.change_id)
+            FROM {self.t('ingestion_log')} l
+            INNER JOIN {self.t('company_changes')} ch
+                ON ch.run_id = l.run_id
+            WHERE l.status = 'running' AND ch.change_id > ?;
+            """,
+            (since_change_id,),
+        )
+        row = cur.fetchone()
+        return None if row is None or row[0] is None else int(row[0])
+
+    def select_changes_since(self, cur, since_change_id: int, before_change_id: Optional[int] = None) -> None:
+        """
+        Execute the delta query: change rows after since_change_id (and below
+        before_change_id, if given) in change order, with each company's
+        current fields. Rows written without a run (run_id NULL) are included.
+        The caller fetches.
+        """
+        bound = "" if before_change_id is None else "AND ch.change_id < ?"
+        params = (since_change_id,) if before_change_id is None else (since_change_id, before_change_id)
+        cur.execute(
+            f"""
+            SELECT
+                ch.change_id,
+                ch.run_id,
+                ch.company_number,
+                ch.change_type,
+                ch.changed_fields,
+                c.company_name,
+                c.company_status,
+                c.incorporation_date,
+                c.company_type,
+                a.locality,
+                a.region,
+                a.postal_code,
+                a.country
+            FROM {self.t('company_changes')} ch
+            INNER JOIN {self.t('companies')} c
+                ON c.company_number = ch.company_number
+            LEFT JOIN {self.t('company_addresses')} a
+                ON a.company_number = ch.company_number
+            WHERE ch.change_id > ? {bound}
+            ORDER BY ch.change_id;
+            """,
+            params,
+        )
+
+    def select_month_companies(self, cur, start_date: str, end_date: str, sic_codes: List[str]) -> None:
+        """Execute the incorporated-in-[start, end) by SIC export query; the caller fetches."""
+        placeholders = ",".join(["?"] * len(sic_codes))
+        cur.execute(
+            f"""
+            SELECT DISTINCT
+                c.company_number,
+                c.company_name,
+                c.company_status,
+                c.incorporation_date,
+                a.locality,
+                a.region,
+                a.postal_code,
+                a.country
+            FROM {self.t('companies')} c
+            LEFT JOIN {self.t('company_addresses')} a
+                ON a.company_number = c.company_number
+            INNER JOIN {self.t('company_sic')} cs
+                ON cs.company_number = c.company_number
+            WHERE
+                c.incorporation_date >= ?
+                AND c.incorporation_date < ?
+                AND cs.sic_code IN ({placeholders})
+            ORDER BY c.incorporation_date DESC;
+            """,
+            (start_date, end_date, *sic_codes),
+        )
+
+    def select_month_companies_sic_rows(self, cur, start_date: str, end_date: str, sic_codes: List[str]) -> None:
+        """
+        Execute the segmented-export query: companies incorporated in
+        [start, end) with any of sic_codes, one row per company and each of
+        its SIC codes (sic_code last), adjacent per company in the month
+        export's order. The caller fetches.
+        """
+        placeholders = ",".join(["?"] * len(sic_codes))
+        cur.execute(
+            f"""
+            SELECT
+                c.company_number,
+                c.company_name,
+                c.company_status,
+                c.incorporation_date,
+                a.locality,
+                a.region,
+                a.postal_code,
+                a.country,
+                cs.sic_code
+            FROM {self.t('companies')} c
+            LEFT JOIN {self.t('company_addresses')} a
+                ON a.company_number = c.company_number
+            INNER JOIN {self.t('company_sic')} cs
+                ON cs.company_number = c.company_number
+            WHERE
+                c.incorporation_date >= ?
+                AND c.incorporation_date < ?
+                AND EXISTS (
+                    SELECT 1 FROM {self.t('company_sic')} f
+                    WHERE f.company_number = c.company_number AND f.sic_code IN ({placeholders})
+                )
+            ORDER BY c.incorporation_date DESC, c.company_number, cs.sic_code;
+            """,
+            (start_date, end_date, *sic_codes),
+        )
+
+    def month_data_version(self, cur, start_date: str, end_date: str) -> Tuple[int, int, int]:
+        """
+        (companies, SUM(row_version), MAX(row_version)) over companies
+        incorporated in [start, end). upsert_companies gives a company a new
+        row_version whenever its content_hash changes, change log or not, so
+        any write to an exported field moves the sum; a company leaving the
+        month moves the count.
+        """
+        cur.execute(
+            f"""
+            SELECT COUNT(*), COALESCE(SUM(row_version), 0), COALESCE(MAX(row_version), 0)
+            FROM {self.t('companies')}
+            WHERE
+                incorporation_date >= ?
+                AND incorporation_date < ?;
+            """,
+            (start_date, end_date),
+        )
+        row = cur.fetchone()
+        return int(row[0]), int(row[1]), int(row[2])
+
+    def select_month_company_sic(self, cur, start_date: str, end_date: str) -> None:
+        """
+        Execute the one-row-per-(company, SIC code) query for companies
+        incorporated in [start, end), grouped by SIC code; the caller fetches.
+        """
+        cur.execute(
+            f"""
+            SELECT
+                cs.sic_code,
+                c.company_number,
+                c.company_name,
+                c.company_status,
+                c.incorporation_date,
+                c.company_type,
+                a.locality,
+                a.region,
+                a.postal_code,
+                a.country
+            FROM {self.t('companies')} c
+            INNER JOIN {self.t('company_sic')} cs
+                ON cs.company_number = c.company_number
+            LEFT JOIN {self.t('company_addresses')} a
+                ON a.company_number = c.company_number
+            WHERE
+                c.incorporation_date >= ?
+                AND c.incorporation_date < ?
+            ORDER BY cs.sic_code, c.incorporation_date, c.company_number;
+            """,
+            (start_date, end_date),
+        )
+
+    def incorporation_dates_changed_in_run(self, cur, run_id: int) -> List[str]:
+        """
+        Distinct incorporation dates (ISO strings) of companies the run added
+        or changed, current and previous, so a month a company moved out of
+        is included. Read from companies (changed_run_id), so it does not
+        need CAPTURE_CHANGES.
+        """
+        cur.execute(
+            f"""
+            SELECT DISTINCT incorporation_date, prev_incorporation_date
+            FROM {self.t('companies')}
+            WHERE changed_run_id = ?;
+            """,
+            (run_id,),
+        )
+        return sorted({str(d)[:10] for row in cur.fetchall() for d in row if d is not None})
+
+
+_STORAGE: Optional[Storage] = None
+_STORAGE_LOCK = threading.Lock()
+
+
+def get_storage() -> Storage:
+    """Process-wide storage for STORAGE_BACKEND, created on first use."""
+    global _STORAGE
+    with _STORAGE_LOCK:
+        if _STORAGE is None:
+            if STORAGE_BACKEND == "sqlite":
+                from src.db.sqlite_storage import SqliteStorage
+                _STORAGE = SqliteStorage()
+            elif STORAGE_BACKEND == "sqlserver":
+                from src.db.sqlserver_storage import SqlServerStorage
+                _STORAGE = SqlServerStorage()
+            else:
+                raise RuntimeError(f"Unknown STORAGE_BACKEND={STORAGE_BACKEND!r} (expected 'sqlserver' or 'sqlite')")
+        return _STORAGE
@@ -0,0 +1,272 @@
+from __future__ import annotations
+
+import os
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor
+from dataclasses import dataclass
+from datetime import date, timedelta
+from typing import Dict, Iterable, List, Optional, Set, Tuple
+
+from src.db.storage import Storage
+from src.ingest.checkpoint import (
+    companies_written_in_run,
+    load_checkpoint,
+    reopen_run,
+    resume_position,
+    save_checkpoint,
+)
+from src.ingest.company_writer import write_changed
+from src.ingest.fingerprints import FingerprintMap
+from src.ingest.postcode_filter import PostcodeFilter
+from src.ingest.query_planner import iter_work_unit_pages, plan_work_units
+from src.validation.page_validation import quarantine_invalid
+
+# Extra attempts for a failed shard; each resumes from the shard's own checkpoint
+SHARD_RETRIES = int(os.getenv("SHARD_RETRIES", "2"))
+SHARD_RETRY_SLEEP_SECONDS = float(os.getenv("SHARD_RETRY_SLEEP_SECONDS", "5"))
+
+# Pages within one shard are few; the parallelism comes from the workers
+SHARD_PAGE_CONCURRENCY = int(os.getenv("SHARD_PAGE_CONCURRENCY", "2"))
+
+SHARD_NOTE_PREFIX = "BACKFILL SHARD "
+
+
+@dataclass(frozen=True)
+class Shard:
+    month: str                  # YYYY-MM
+    location: Optional[str]     # None: nationwide, filtered on postcode
+    incorporated_from: date
+    incorporated_to: date       # inclusive
+
+    @property
+    def key(self) -> str:
+        return f"{self.month}|{self.location or '*'}"
+
+    @property
+    def note(self) -> str:
+        return f"{SHARD_NOTE_PREFIX}{self.key}"
+
+
+@dataclass
+class ShardResult:
+    shard: Shard
+    run_id: Optional[int]
+    status: str
+    written: int = 0
+    unchanged: int = 0
+    duplicates: int = 0
+    outside: int = 0
+    quarantined: int = 0
+    attempts: int = 0
+    error: Optional[str] = None
+
+
+def month_shards(start: date, end: date, locations: Iterable[Optional[str]]) -> List[Shard]:
+    """One shard per (calendar month, location) covering [start, end], months clipped to the range."""
+    locations = list(locations)
+    shards: List[Shard] = []
+    month_start = start.replace(day=1)
+    while month_start <= end:
+        next_month = (month_start + timedelta(days=32)).replace(day=1)
+        lo = max(month_start, start)
+        hi = min(next_month - timedelta(days=1), end)
+        for loc in locations:
+            shards.append(Shard(month_start.strftime("%Y-%m"), loc, lo, hi))
+        month_start = next_month
+    return shards
+
+
+class SeenSet:
+    """
+    Company numbers claimed across all workers. Locations overlap, so the
+    same company can turn up in several shards of one month; whichever shard
+    claims it first writes it. Claims that never got committed are released
+    so the shard's retry (or another shard) can pick them up again.
+    """
+
+    def __init__(self, numbers: Iterable[str] = ()) -> None:
+        self._numbers: Set[str] = set(numbers)
+        self._lock = threading.Lock()
+
+    def __len__(self) -> int:
+        return len(self._numbers)
+
+    def claim(self, items: List[dict]) -> Tuple[List[dict], int]:
+        """(items this caller now owns, number already claimed elsewhere)."""
+        mine: List[dict] = []
+        duplicates = 0
+        with self._lock:
+            for it in items:
+                number = it.get("company_number")
+                if not number:
+                    continue
+                if number in self._numbers:
+                    duplicates += 1
+                    continue
+                self._numbers.add(number)
+                mine.append(it)
+        return mine, duplicates
+
+    def release(self, numbers: Iterable[str]) -> None:
+        with self._lock:
+            self._numbers.difference_update(numbers)
+
+    def snapshot(self) -> Set[str]:
+        with self._lock:
+            return set(self._numbers)
+
+
+def run_shard(
+    storage: Storage,
+    shard: Shard,
+    *,
+    parent_run_id: int,
+    sic_codes: List[str],
+    page_size: int,
+    commit_every: int,
+    seen: SeenSet,
+    fingerprints: Optional[FingerprintMap],
+    corridor: Optional[PostcodeFilter] = None,
+    run_id: Optional[int] = None,
+) -> ShardResult:
+    """
+    Ingest one shard on its own pooled connection, logged as a child run of
+    parent_run_id. With run_id, that child run is reopened and continued from
+    its checkpoint. Never raises for shard-level errors; the result carries
+    status 'failure' and the error instead.
+    """
+    result = ShardResult(shard, run_id, "running")
+    tag = f"[{shard.key}]"
+    # Claimed but not yet committed by this attempt
+    uncommitted: List[str] = []
+
+    with storage.connection() as conn:
+        cur = conn.cursor()
+        checkpoint = None
+        if run_id is None:
+            run_id = storage.start_run(cur, shard.note, parent_run_id=parent_run_id)
+        else:
+            reopen_run(storage, cur, run_id)
+            checkpoint = load_checkpoint(storage, cur, run_id)
+            result.written = len(companies_written_in_run(storage, cur, run_id))
+        conn.commit()
+        result.run_id = run_id
+        committed = result.written
+
+        try:
+            units = plan_work_units(
+                locations=[shard.location],
+                sic_codes=sic_codes,
+                incorporated_from=shard.incorporated_from,
+                incorporated_to=shard.incorporated_to,
+                company_status="active",
+                max_concurrency=SHARD_PAGE_CONCURRENCY,
+            )
+            first_unit, first_start_index = resume_position([u.key for u in units], checkpoint)
+
+            for unit, start_index, data in iter_work_unit_pages(
+                units[first_unit:],
+                sic_codes=sic_codes,
+                size=page_size,
+                company_status="active",
+                max_concurrency=SHARD_PAGE_CONCURRENCY,
+                first_start_index=first_start_index,
+            ):
+                items = data.get("items") or []
+                if corridor is not None:
+                    kept = corridor.filter_items(items)
+                    result.outside += len(items) - len(kept)
+                    items = kept
+
+                batch, duplicates = seen.claim(items)
+                result.duplicates += duplicates
+                uncommitted.extend(it["company_number"] for it in batch)
+
+                batch, quarantined = quarantine_invalid(storage, cur, batch, run_id)
+                result.quarantined += quarantined
+
+                written, unchanged = write_changed(storage, cur, batch, run_id, fingerprints)
+                result.written += written + unchanged
+                result.unchanged += unchanged
+
+                if len(uncommitted) >= commit_every:
+                    save_checkpoint(storage, cur, run_id, unit.key, start_index + page_size, result.written)
+                    conn.commit()
+                    uncommitted = []
+                    committed = result.written
+
+            storage.finish_run(cur, run_id, "success", result.written)
+            conn.commit()
+            result.status = "success"
+            print(f"{tag} done run_id={run_id} written={result.written} (unchanged={result.unchanged})")
+
+        except Exception as e:
+            conn.rollback()
+            seen.release(uncommitted)
+            if fingerprints is not None:
+                for number in uncommitted:
+                    fingerprints.forget(number)
+            result.written = committed
+            storage.finish_run(cur, run_id, "failure", result.written)
+            conn.commit()
+            result.status = "failure"
+            result.error = f"{type(e).__name__}: {e}"
+            print(f"{tag} FAILED run_id={run_id}: {result.error}")
+
+    return result
+
+
+def run_shard_with_retries(storage: Storage, shard: Shard, *, run_id: Optional[int] = None, **kwargs) -> ShardResult:
+    """Run a shard, retrying only that shard (resuming its child run) up to SHARD_RETRIES times."""
+    attempts = 0
+    while True:
+        attempts += 1
+        result = run_shard(storage, shard, run_id=run_id, **kwargs)
+        result.attempts = attempts
+        if result.status == "success" or attempts > SHARD_RETRIES:
+            return result
+        run_id = result.run_id
+        time.sleep(SHARD_RETRY_SLEEP_SECONDS * attempts)
+
+
+def existing_shard_runs(storage: Storage, cur, parent_run_id: int) -> Dict[str, Tuple[int, str]]:
+    """shard key -> (latest child run_id, status) for a parent run."""
+    runs: Dict[str, Tuple[int, str]] = {}
+    for run_id, source, status, _ in storage.child_runs(cur, parent_run_id):
+        if source and source.startswith(SHARD_NOTE_PREFIX):
+            runs[source[len(SHARD_NOTE_PREFIX):]] = (run_id, status)
+    return runs
+
+
+def run_shards(
+    storage: Storage,
+    shards: List[Shard],
+    *,
+    workers: int,
+    parent_run_id: int,
+    resume_runs: Optional[Dict[str, Tuple[int, str]]] = None,
+    **kwargs,
+) -> List[ShardResult]:
+    """
+    Run shards on a pool of `workers` threads, each holding its own pooled
+    connection. Shards that already succeeded under resume_runs are skipped;
+    failed ones continue their existing child run.
+    """
+    resume_runs = resume_runs or {}
+    todo: List[Tuple[Shard, Optional[int]]] = []
+    for shard in shards:
+        prior = resume_runs.get(shard.key)
+        if prior is not None and prior[1] == "success":
+            continue
+        todo.append((shard, prior[0] if prior else None))
+
+    print(f"Sharded backfill: {len(todo)} of {len(shards)} shards to run on {workers} workers")
+    storage.ensure_pool_size(workers)
+
+    with ThreadPoolExecutor(max_workers=workers, thread_name_prefix="shard") as pool:
+        futures = [
+            pool.submit(run_shard_with_retries, storage, shard, run_id=run_id, parent_run_id=parent_run_id, **kwargs)
+            for shard, run_id in todo
+        ]
+        return [f.result() for f in futures]
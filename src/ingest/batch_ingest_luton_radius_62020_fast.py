@@ -1,9 +1,15 @@
 from __future__ import annotations
 import os
 import time
-from typing import Optional
-from src.db.connection import get_conn
-from src.ingest.ch_client import advanced_search_companies
+from typing import Any, Dict, Iterator, Optional
+
+import requests
+
+from src.db.storage import get_storage
+from src.ingest.ch_client import SearchPageStream, stream_advanced_search
+from src.ingest.company_writer import write_companies
+from src.ingest.postcode_filter import CORRIDOR_RADIUS
+from src.validation.page_validation import quarantine_invalid
 
 # Target universe (Luton radius + Milton Keynes)
 LOCATIONS = [
@@ -44,102 +50,55 @@ def parse_year(d: Optional[str]) -> Optional[int]:
         return None
 
 
-def upsert_company_from_item(cur, it: dict) -> None:
-    company_number = it.get("company_number")
-    company_name = it.get("company_name") or it.get("title")
-    status = it.get("company_status")
-    inc_date = it.get("date_of_creation")
-    company_type = it.get("company_type")
-
-    cur.execute(
-        """
-        MERGE dbo.companies AS tgt
-        USING (SELECT ? AS company_number) AS src
-        ON tgt.company_number = src.company_number
-        WHEN MATCHED THEN
-            UPDATE SET
-                company_name = ?,
-                company_status = ?,
-                incorporation_date = ?,
-                company_type = ?
-        WHEN NOT MATCHED THEN
-            INSERT (company_number, company_name, company_status, incorporation_date, company_type)
-            VALUES (?, ?, ?, ?, ?);
-        """,
-        company_number,
-        company_name,
-        status,
-        inc_date,
-        company_type,
-        company_number,
-        company_name,
-        status,
-        inc_date,
-        company_type,
-    )
-
-
-def replace_address_from_item(cur, company_number: str, it: dict) -> None:
-    addr = it.get("registered_office_address") or {}
+class PageStreamError(Exception):
+    """The page body failed part-way through: connection dropped or malformed JSON."""
 
-    cur.execute("DELETE FROM dbo.company_addresses WHERE company_number = ?;", company_number)
 
-    cur.execute(
-        """
-        INSERT INTO dbo.company_addresses (company_number, locality, region, postal_code, country)
-        VALUES (?, ?, ?, ?, ?);
-        """,
-        company_number,
-        addr.get("locality"),
-        addr.get("region"),
-        addr.get("postal_code"),
-        addr.get("country"),
-    )
-
-
-def replace_sic(cur, company_number: str, sic_list: list[str], existing_sic: set[str]) -> None:
-    cur.execute("DELETE FROM dbo.company_sic WHERE company_number = ?;", company_number)
-
-    for sic in (sic_list or []):
-        if sic not in existing_sic:
-            continue
-        cur.execute(
-            "INSERT INTO dbo.company_sic (company_number, sic_code) VALUES (?, ?);",
-            company_number,
-            sic,
-        )
-
-
-def log_run(cur, inserted: int, status: str, note: str) -> None:
-    cur.execute(
-        """
-        INSERT INTO dbo.ingestion_log (records_inserted, source, status)
-        VALUES (?, ?, ?);
-        """,
-        inserted,
-        f"Companies House API (advanced search) - {note}",
-        status,
-    )
+def read_page(page: SearchPageStream) -> Iterator[Dict[str, Any]]:
+    """
+    The page's items; errors while reading the body become PageStreamError.
+    Errors raised by the caller's loop body (e.g. the database) pass through
+    unchanged, since they are not thrown into this generator.
+    """
+    try:
+        yield from page
+    except (requests.RequestException, ValueError) as e:
+        raise PageStreamError(f"{type(e).__name__}: {e}") from e
 
 
 def main() -> None:
     inserted_total = 0
     scanned_total = 0
+    duplicates_total = 0
+    # Company numbers already written this run; locations overlap heavily
+    seen: set[str] = set()
+
+    outside_total = 0
+    quarantined_total = 0
 
     incorporated_from = f"{MIN_YEAR}-01-01"
     incorporated_to = f"{MAX_YEAR}-12-31"
 
+    # The location names only seed the free-text search; CORRIDOR_RADIUS
+    # (e.g. 'LU1:25') cuts the results to a true radius around a postcode
+    radius = None
+    geography = f"locations={len(LOCATIONS)}"
+    if CORRIDOR_RADIUS:
+        from src.ingest.postcode_geo import RadiusFilter
+
+        radius = RadiusFilter.from_spec(CORRIDOR_RADIUS)
+        geography += f" within {radius.describe()}"
+
     note = (
-        f"locations={len(LOCATIONS)} | sic={','.join(SIC_CODES)} | "
+        f"{geography} | sic={','.join(SIC_CODES)} | "
         f"incorporated {incorporated_from}..{incorporated_to} | cap {MAX_RECORDS}"
     )
 
-    with get_conn() as conn:
-        cur = conn.cursor()
+    storage = get_storage()
+    source = f"Companies House API (advanced search) - {note}"
 
-        # Load SIC 
-        cur.execute("SELECT sic_code FROM dbo.sic_codes;")
-        existing_sic = {row[0] for row in cur.fetchall()}
+    with storage.connection() as conn:
+        cur = conn.cursor()
 
         try:
             for loc in LOCATIONS:
@@ -149,10 +108,12 @@ def main() -> None:
                 print(f"\n=== Location: {loc} ===")
                 start_index = 0
                 consecutive_page_errors = 0
+                # Companies written by a failed read of the current page
+                retried: set[str] = set()
 
                 while inserted_total < MAX_RECORDS:
                     try:
-                        data = advanced_search_companies(
+                        page = stream_advanced_search(
                             location=loc,
                             sic_codes=SIC_CODES,
                             start_index=start_index,
@@ -174,64 +135,109 @@ def main() -> None:
 
                         time.sleep(SLEEP_ON_ERROR_SECONDS)
                         start_index += PAGE_SIZE
+                        retried.clear()
                         continue
 
-                    consecutive_page_errors = 0
-
-                    items = data.get("items", []) or []
-                    hits = data.get("hits")
-                    print(f"Fetched page start_index={start_index} | items={len(items)} | hits={hits}")
-
-                    if not items:
-                        break
-
-                    last_page = len(items) < PAGE_SIZE
-
-                    for it in items:
-                        scanned_total += 1
-                        if inserted_total >= MAX_RECORDS:
+                    # Items are written as they are parsed off the wire, in
+                    # set-based batches of COMMIT_EVERY
+                    page_items = 0
+                    page_outside = outside_total
+                    page_numbers: set[str] = set()
+                    batch = []
+                    stream_error: Optional[PageStreamError] = None
+                    try:
+                        for it in read_page(page):
+                            page_items += 1
+                            scanned_total += 1
+                            if inserted_total + len(batch) >= MAX_RECORDS:
+                                break
+
+                            # Missing or malformed dates are left to validation (quarantine)
+                            y = parse_year(it.get("date_of_creation"))
+                            if y is not None and (y < MIN_YEAR or y > MAX_YEAR):
+                                continue
+
+                            if radius is not None and not radius.matches(
+                                (it.get("registered_office_address") or {}).get("postal_code")
+                            ):
+                                outside_total += 1
+                                continue
+
+                            number = it.get("company_number")
+                            if not number:
+                                continue
+                            if number in seen:
+                                # Written by an earlier, failed read of this same page
+                                if number not in retried:
+                                    duplicates_total += 1
+                                continue
+
+                            seen.add(number)
+                            page_numbers.add(number)
+                            batch.append(it)
+
+                            if len(batch) >= COMMIT_EVERY or inserted_total + len(batch) >= MAX_RECORDS:
+                                batch, quarantined = quarantine_invalid(storage, cur, batch, None)
+                                quarantined_total += quarantined
+                                inserted_total += write_companies(storage, cur, batch)
+                                batch = []
+                                conn.commit()
+                                print(f"Committed {inserted_total}/{MAX_RECORDS} records so far (scanned {scanned_total})")
+                    except PageStreamError as e:
+                        stream_error = e
+                    finally:
+                        page.close()
+
+                    # Items parsed before a failure are complete, so they are kept
+                    if batch:
+                        batch, quarantined = quarantine_invalid(storage, cur, batch, None)
+                        quarantined_total += quarantined
+                        inserted_total += write_companies(storage, cur, batch)
+                        conn.commit()
+
+                    if stream_error is not None:
+                        consecutive_page_errors += 1
+                        print(
+                            f"Stream error at {loc} start_index={start_index} after {page_items} items "
+                            f"(consecutive={consecutive_page_errors}). Error: {stream_error}"
+                        )
+                        if consecutive_page_errors >= MAX_CONSECUTIVE_PAGE_ERRORS:
+                            print(f"Too many API failures for {loc}. Moving to next location.")
                             break
 
-                        y = parse_year(it.get("date_of_creation"))
-                        if y is None or y < MIN_YEAR or y > MAX_YEAR:
-                            continue
-
-                        number = it.get("company_number")
-                        if not number:
-                            continue
-
-                        if inserted_total == 0:
-                            print("Starting first insert...")
-
-                        upsert_company_from_item(cur, it)
-                        replace_address_from_item(cur, number, it)
-                        replace_sic(cur, number, it.get("sic_codes", []) or [], existing_sic)
-
-                        inserted_total += 1
+                        # The retry reads the page from the start again
+                        scanned_total -= page_items
+                        outside_total = page_outside
+                        retried |= page_numbers
+                        time.sleep(SLEEP_ON_ERROR_SECONDS)
+                        continue
 
-                        if inserted_total % COMMIT_EVERY == 0:
-                            conn.commit()
-                            print(f"Committed {inserted_total} records so far")
+                    consecutive_page_errors = 0
+                    retried.clear()
 
-                        if inserted_total % 50 == 0:
-                            print(f"Inserted {inserted_total}/{MAX_RECORDS} (scanned {scanned_total})")
+                    hits = page.hits
+                    print(f"Fetched page start_index={start_index} | items={page_items} | hits={hits}")
 
-                    if last_page:
+                    if page_items < PAGE_SIZE:
                         break
 
-                    if isinstance(hits, int) and (start_index + len(items) >= hits):
+                    if isinstance(hits, int) and (start_index + page_items >= hits):
                         break
 
                     start_index += PAGE_SIZE
 
-            log_run(cur, inserted=inserted_total, status="success", note=note)
+            storage.log_run(cur, source, status="success", records_inserted=inserted_total)
             conn.commit()
-            print(f"\nDone. Inserted/updated: {inserted_total} (scanned: {scanned_total})")
+            print(
+                f"\nDone. Inserted/updated: {inserted_total} (scanned: {scanned_total}, "
+                f"cross-location duplicates: {duplicates_total}, outside radius: {outside_total}, "
+                f"quarantined: {quarantined_total})"
+            )
 
         except Exception:
             conn.rollback()
             cur = conn.cursor()
-            log_run(cur, inserted=inserted_total, status="failure", note=note)
+            storage.log_run(cur, source, status="failure", records_inserted=inserted_total)
             conn.commit()
             raise
 
@@ -2,11 +2,18 @@ from __future__ import annotations
 import os
 import time
 import random
-from typing import Any, Dict, List, Optional
+import asyncio
+import json
+from typing import Any, Callable, Dict, Iterator, List, Optional, Tuple
 import requests
+from requests.adapters import HTTPAdapter
 from dotenv import load_dotenv
 from pathlib import Path
 
+from src.ingest.json_stream import iter_array_items
+from src.ingest.rate_limit import TokenBucket, parse_retry_after
+from src.ingest.response_cache import ResponseCache, cache_key
+
 # Load .env relative to repo root (not CWD)
 ENV_PATH = Path(__file__).resolve().parents[2] / ".env"
 load_dotenv(dotenv_path=ENV_PATH)
@@ -21,57 +28,212 @@ if not CH_API_KEY:
     )
 
 RETRY_STATUS = {500, 502, 503, 504}
+RATE_LIMITED_STATUS = 429
+
+# Companies House allows 600 requests per key per 5-minute window
+RATE_LIMIT = int(os.getenv("CH_RATE_LIMIT", "600"))
+RATE_WINDOW_SECONDS = float(os.getenv("CH_RATE_WINDOW_SECONDS", "300"))
+
+# Process-wide: every request made through this module draws from it
+LIMITER = TokenBucket(RATE_LIMIT, RATE_WINDOW_SECONDS)
+
+# Local response cache (set CH_CACHE=0 to disable)
+CACHE_ENABLED = os.getenv("CH_CACHE", "1") == "1"
+CACHE_DIR = Path(os.getenv("CH_CACHE_DIR", str(Path(__file__).resolve().parents[2] / "data" / "cache")))
+CACHE_TTL_SECONDS = float(os.getenv("CH_CACHE_TTL_SECONDS", "86400"))
+CACHE_MAX_MB = int(os.getenv("CH_CACHE_MAX_MB", "512"))
+
+CACHE: Optional[ResponseCache] = (
+    ResponseCache(CACHE_DIR / "ch_responses.sqlite", CACHE_TTL_SECONDS, CACHE_MAX_MB * 1024 * 1024)
+    if CACHE_ENABLED
+    else None
+)
+
+# Network read size for streamed search pages
+STREAM_CHUNK_BYTES = int(os.getenv("CH_STREAM_CHUNK_BYTES", "65536"))
+
+# Upper bound on in-flight requests for the concurrent helpers below
+MAX_CONCURRENCY = int(os.getenv("CH_MAX_CONCURRENCY", "8"))
+
 SESSION = requests.Session()
+# One keep-alive connection per concurrent worker, reused across pages
+SESSION.mount("https://", HTTPAdapter(pool_connections=1, pool_maxsize=MAX_CONCURRENCY))
 
 
-def advanced_search_companies(
+def _search_params(
     *,
-    location: str,
+    location: Optional[str],
     sic_codes: List[str],
     start_index: int,
     size: int,
-    company_status: str = "active",
-    incorporated_from: Optional[str] = None,  # 'YYYY-MM-DD'
-    incorporated_to: Optional[str] = None,    # 'YYYY-MM-DD'
-    max_retries: int = 3,
+    company_status: str,
+    incorporated_from: Optional[str],
+    incorporated_to: Optional[str],
 ) -> Dict[str, Any]:
-    """
-    Companies House advanced search: /advanced-search/companies
-
-    Retries transient 5xx with exponential backoff + jitter.
-    Raises a RuntimeError with useful context after final failure.
-    """
     params: Dict[str, Any] = {
-        "location": location,
         "sic_codes": ",".join(sic_codes),
         "start_index": start_index,
         "size": size,
         "company_status": company_status,
     }
+    # No location means a nationwide query (filtered locally by the caller)
+    if location:
+        params["location"] = location
     if incorporated_from:
         params["incorporated_from"] = incorporated_from
     if incorporated_to:
         params["incorporated_to"] = incorporated_to
+    return params
+
+
+def advanced_search_companies(
+    *,
+    location: Optional[str],
+    sic_codes: List[str],
+    start_index: int,
+    size: int,
+    company_status: str = "active",
+    incorporated_from: Optional[str] = None,  # 'YYYY-MM-DD'
+    incorporated_to: Optional[str] = None,    # 'YYYY-MM-DD'
+    max_retries: int = 3,
+) -> Dict[str, Any]:
+    """
+    Companies House advanced search: /advanced-search/companies
 
-    url = f"{BASE_URL}/advanced-search/companies"
+    Goes through the shared rate limiter; see _get_json() for retry rules.
+    """
+    params = _search_params(
+        location=location,
+        sic_codes=sic_codes,
+        start_index=start_index,
+        size=size,
+        company_status=company_status,
+        incorporated_from=incorporated_from,
+        incorporated_to=incorporated_to,
+    )
+    return _get_json(f"{BASE_URL}/advanced-search/companies", params, max_retries=max_retries)
+
+
+class SearchPageStream:
+    """
+    One advanced-search page whose items are parsed as they arrive.
+
+    Iterate it to get items one at a time; top-level members such as `hits`
+    are collected in `fields` as they are parsed (members that follow the
+    items array are only available once iteration has finished).
+    """
+
+    def __init__(self, resp: requests.Response) -> None:
+        self._resp = resp
+        self.fields: Dict[str, Any] = {}
+
+    @property
+    def hits(self) -> Optional[int]:
+        hits = self.fields.get("hits")
+        return hits if isinstance(hits, int) else None
+
+    def __iter__(self) -> Iterator[Dict[str, Any]]:
+        try:
+            yield from iter_array_items(
+                self._resp.iter_content(chunk_size=STREAM_CHUNK_BYTES), "items", self.fields
+            )
+        finally:
+            self._resp.close()
+
+    def close(self) -> None:
+        self._resp.close()
+
+
+def stream_advanced_search(
+    *,
+    location: Optional[str],
+    sic_codes: List[str],
+    start_index: int,
+    size: int,
+    company_status: str = "active",
+    incorporated_from: Optional[str] = None,  # 'YYYY-MM-DD'
+    incorporated_to: Optional[str] = None,    # 'YYYY-MM-DD'
+    max_retries: int = 3,
+) -> SearchPageStream:
+    """
+    Streaming variant of advanced_search_companies().
+
+    Retries apply until the response headers arrive; the body is then parsed
+    incrementally, so memory stays flat regardless of page size. Streamed
+    pages bypass the response cache.
+    """
+    params = _search_params(
+        location=location,
+        sic_codes=sic_codes,
+        start_index=start_index,
+        size=size,
+        company_status=company_status,
+        incorporated_from=incorporated_from,
+        incorporated_to=incorporated_to,
+    )
+    resp = _send(f"{BASE_URL}/advanced-search/companies", params, stream=True, max_retries=max_retries)
+    return SearchPageStream(resp)
+
+
+def rate_limit_status() -> Dict[str, Any]:
+    """Remaining request budget as currently known to the shared limiter."""
+    return LIMITER.status()
+
+
+def _rate_limited_wait(resp: requests.Response) -> float:
+    wait = parse_retry_after(resp.headers.get("Retry-After"))
+    if wait is None:
+        wait = LIMITER.seconds_until_reset()
+    if wait is None:
+        # No hint from the server: assume a full window
+        wait = RATE_WINDOW_SECONDS
+    return wait + random.uniform(0.0, 0.75)
+
+
+def _send(
+    url: str,
+    params: Optional[Dict[str, Any]] = None,
+    *,
+    headers: Optional[Dict[str, str]] = None,
+    stream: bool = False,
+    max_retries: int = 3,
+) -> requests.Response:
+    """
+    GET a Companies House endpoint through the shared rate limiter.
 
+    Retries transient 5xx with exponential backoff + jitter. A 429 pauses
+    every caller for Retry-After (or until the rate-limit window resets)
+    and then retries.
+    Raises a RuntimeError with useful context after final failure.
+    """
     last_exc: Optional[Exception] = None
 
     for attempt in range(1, max_retries + 1):
         try:
-            resp = SESSION.get(url, params=params, auth=(CH_API_KEY, ""), timeout=30)
+            LIMITER.acquire()
+            resp = SESSION.get(
+                url, params=params, headers=headers or {}, auth=(CH_API_KEY, ""), timeout=30, stream=stream
+            )
+            LIMITER.observe(resp.headers)
+
+            if resp.status_code == RATE_LIMITED_STATUS:
+                resp.close()
+                LIMITER.pause(_rate_limited_wait(resp))
+                last_exc = RuntimeError(f"HTTP 429 | {resp.url} | rate limited")
+                continue
 
             if resp.status_code in RETRY_STATUS:
-                # exponential backoff + jitter
-                sleep_s = (2 ** attempt) + random.uniform(0.0, 0.75)
-                time.sleep(sleep_s)
                 last_exc = RuntimeError(
                     f"HTTP {resp.status_code} | {resp.url} | {resp.text[:300]}"
                 )
+                resp.close()
+                # exponential backoff + jitter
+                sleep_s = (2 ** attempt) + random.uniform(0.0, 0.75)
+                time.sleep(sleep_s)
                 continue
 
             resp.raise_for_status()
-            return resp.json()
+            return resp
 
         except requests.RequestException as e:
             last_exc = e
@@ -82,3 +244,177 @@ def advanced_search_companies(
     raise RuntimeError(
         f"Companies House API failed after retries. Last error: {last_exc}"
     )
+
+
+def _get_json(url: str, params: Optional[Dict[str, Any]] = None, *, max_retries: int = 3) -> Dict[str, Any]:
+    """
+    GET a Companies House endpoint as JSON, through the local cache.
+
+    Fresh cache hits are returned without a request; stale ones are
+    revalidated with If-None-Match and reused on 304 Not Modified.
+    See _send() for rate limiting and retries.
+    """
+    key = cache_key(url, params) if CACHE is not None else None
+    cached = CACHE.get(key) if key is not None else None
+    if cached is not None and cached.fresh:
+        return json.loads(cached.body)
+
+    headers = {"If-None-Match": cached.etag} if cached is not None and cached.etag else {}
+    resp = _send(url, params, headers=headers, max_retries=max_retries)
+
+    if resp.status_code == 304 and cached is not None:
+        CACHE.touch(key)
+        return json.loads(cached.body)
+
+    data = resp.json()
+    if key is not None:
+        CACHE.put(key, resp.content, resp.headers.get("ETag"))
+    return data
+
+
+def company_profile(company_number: str, *, max_retries: int = 3) -> Dict[str, Any]:
+    """
+    Companies House company profile: /company/{company_number}
+
+    Goes through the shared rate limiter and cache; see _get_json().
+    """
+    return _get_json(f"{BASE_URL}/company/{company_number}", max_retries=max_retries)
+
+
+async def _gather_calls(
+    fn: Callable[..., Any],
+    calls: List[Dict[str, Any]],
+    max_concurrency: int,
+) -> List[Any]:
+    sem = asyncio.Semaphore(max_concurrency)
+
+    async def call_one(kwargs: Dict[str, Any]) -> Any:
+        async with sem:
+            return await asyncio.to_thread(fn, **kwargs)
+
+    return await asyncio.gather(*(call_one(kw) for kw in calls))
+
+
+def fetch_pages(
+    page_params: List[Dict[str, Any]],
+    max_concurrency: int = MAX_CONCURRENCY,
+) -> List[Dict[str, Any]]:
+    """
+    Fetch many advanced-search pages at once.
+
+    Each entry of page_params is the keyword arguments for one
+    advanced_search_companies() call, so every page keeps the same retry
+    behaviour. At most max_concurrency requests are in flight; results are
+    returned in the same order as page_params.
+    """
+    if not page_params:
+        return []
+    return asyncio.run(_gather_calls(advanced_search_companies, page_params, max(1, max_concurrency)))
+
+
+def _company_profile_or_none(company_number: str) -> Optional[Dict[str, Any]]:
+    try:
+        return company_profile(company_number)
+    except RuntimeError as e:
+        print(f"Profile fetch failed for {company_number}: {e}")
+        return None
+
+
+def fetch_profiles(
+    company_numbers: List[str],
+    max_concurrency: int = MAX_CONCURRENCY,
+) -> List[Optional[Dict[str, Any]]]:
+    """
+    Fetch company profiles concurrently, returned in input order.
+
+    A profile that still fails after retries comes back as None rather than
+    aborting the whole batch.
+    """
+    if not company_numbers:
+        return []
+    return asyncio.run(_gather_calls(
+        _company_profile_or_none,
+        [{"company_number": n} for n in company_numbers],
+        max(1, max_concurrency),
+    ))
+
+
+def iter_location_pages(
+    *,
+    locations: List[str],
+    sic_codes: List[str],
+    size: int,
+    company_status: str = "active",
+    incorporated_from: Optional[str] = None,
+    incorporated_to: Optional[str] = None,
+    max_results: Optional[int] = None,
+    max_concurrency: int = MAX_CONCURRENCY,
+) -> Iterator[Tuple[str, int, Dict[str, Any]]]:
+    """
+    Yield (location, start_index, page) for every result page of every location.
+
+    The first page of each location is fetched concurrently; its `hits` value
+    tells us which further start_index values exist, and those are fetched in
+    concurrent waves. Pages are always yielded in (location order, start_index)
+    order. max_results caps how far into each location we page.
+    """
+    base: Dict[str, Any] = {
+        "sic_codes": sic_codes,
+        "size": size,
+        "company_status": company_status,
+        "incorporated_from": incorporated_from,
+        "incorporated_to": incorporated_to,
+    }
+
+    firsts = fetch_pages(
+        [dict(base, location=loc, start_index=0) for loc in locations],
+        max_concurrency,
+    )
+
+    # (location, start_index, page or None if still to fetch, known_total)
+    tasks: List[Tuple[str, int, Optional[Dict[str, Any]], bool]] = []
+    for loc, first in zip(locations, firsts):
+        tasks.append((loc, 0, first, True))
+        if len(first.get("items") or []) < size:
+            continue
+
+        hits = first.get("hits")
+        if isinstance(hits, int):
+            limit = hits if max_results is None else min(hits, max_results)
+            tasks.extend((loc, start, None, True) for start in range(size, limit, size))
+        else:
+            # No hit count: fall back to paging this location one page at a time
+            tasks.append((loc, size, None, False))
+
+    wave = max(1, max_concurrency) * 2
+    i = 0
+    while i < len(tasks):
+        batch = tasks[i:i + wave]
+        pending = [t for t in batch if t[2] is None and t[3]]
+        fetched = iter(fetch_pages(
+            [dict(base, location=loc, start_index=start) for loc, start, _, _ in pending],
+            max_concurrency,
+        ))
+
+        for loc, start, page, known in batch:
+            if not known:
+                yield from _iter_sequential_pages(base, loc, start, size, max_results)
+                continue
+            yield loc, start, page if page is not None else next(fetched)
+
+        i += wave
+
+
+def _iter_sequential_pages(
+    base: Dict[str, Any],
+    location: str,
+    start_index: int,
+    size: int,
+    max_results: Optional[int],
+) -> Iterator[Tuple[str, int, Dict[str, Any]]]:
+    while max_results is None or start_index < max_results:
+        page = advanced_search_companies(location=location, start_index=start_index, **base)
+        yield location, start_index, page
+        if len(page.get("items") or []) < size:
+            return
+        start_index += size
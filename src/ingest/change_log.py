@@ -0,0 +1,58 @@
+from __future__ import annotations
+
+import os
+from typing import Dict, List, Optional
+
+from src.db.storage import Storage
+
+# Record a company_changes row for every new or modified company the writers touch
+CAPTURE_CHANGES = os.getenv("CAPTURE_CHANGES", "1") == "1"
+
+# Order of names in company_changes.changed_fields
+CHANGE_FIELDS = (
+    "company_name",
+    "company_status",
+    "incorporation_date",
+    "company_type",
+    "address",
+    "sic_codes",
+)
+
+
+def _incoming_state(it: dict) -> dict:
+    """An item's fields in the shape of Storage.company_state(), as the writer would store them."""
+    addr = it.get("registered_office_address") or {}
+    inc = it.get("date_of_creation")
+    return {
+        "company_name": it.get("company_name") or it.get("title"),
+        "company_status": it.get("company_status"),
+        "incorporation_date": str(inc)[:10] if inc else None,
+        "company_type": it.get("company_type"),
+        "address": (addr.get("locality"), addr.get("region"), addr.get("postal_code"), addr.get("country")),
+        "sic_codes": frozenset(c for c in (it.get("sic_codes") or []) if c),
+    }
+
+
+def changed_fields(old: dict, new: dict) -> List[str]:
+    return [f for f in CHANGE_FIELDS if old.get(f) != new.get(f)]
+
+
+def change_rows(storage: Storage, cur, by_number: Dict[str, dict], run_id: Optional[int]) -> List[tuple]:
+    """
+    (run_id, company_number, change_type, changed_fields) for a batch about
+    to be written: 'new' for unknown companies, 'update' listing the fields
+    that differ from what is stored. Companies that are identical get no row.
+    Call before the batch is written.
+    """
+    stored = storage.company_state(cur, list(by_number))
+
+    rows: List[tuple] = []
+    for number, it in by_number.items():
+        old = stored.get(number)
+        if old is None:
+            rows.append((run_id, number, "new", None))
+            continue
+        fields = changed_fields(old, _incoming_state(it))
+        if fields:
+            rows.append((run_id, number, "update", ",".join(fields)))
+    return rows
@@ -0,0 +1,65 @@
+from __future__ import annotations
+
+from dataclasses import dataclass
+from typing import List, Optional, Tuple
+
+from src.db.storage import Storage
+
+
+@dataclass(frozen=True)
+class Checkpoint:
+    run_id: int
+    cursor_key: str     # location name or query_planner.WorkUnit.key
+    start_index: int    # first page of cursor_key not yet committed
+    records_committed: int
+
+
+def save_checkpoint(
+    storage: Storage, cur, run_id: int, cursor_key: str, start_index: int, records_committed: int
+) -> None:
+    """Record the cursor; call inside the transaction that is about to be committed."""
+    storage.save_checkpoint(cur, run_id, cursor_key, start_index, records_committed)
+
+
+def load_checkpoint(storage: Storage, cur, run_id: int) -> Optional[Checkpoint]:
+    row = storage.load_checkpoint(cur, run_id)
+    if row is None:
+        return None
+    return Checkpoint(run_id, *row)
+
+
+def reopen_run(storage: Storage, cur, run_id: int) -> str:
+    """
+    Mark a failed/interrupted run as running again. Returns its source note.
+    Refuses to reopen runs that already succeeded.
+    """
+    row = storage.get_run(cur, run_id)
+    if row is None:
+        raise RuntimeError(f"Cannot resume: run_id {run_id} not found in ingestion_log")
+    if row[1] == "success":
+        raise RuntimeError(f"Cannot resume: run_id {run_id} already finished successfully")
+
+    storage.set_run_status(cur, run_id, "running")
+    return row[0]
+
+
+def companies_written_in_run(storage: Storage, cur, run_id: int) -> set[str]:
+    """Company numbers already committed by this run (rebuilds the in-run seen-set)."""
+    return set(storage.companies_seen_in_run(cur, run_id))
+
+
+def resume_position(keys: List[str], cp: Optional[Checkpoint]) -> Tuple[int, int]:
+    """
+    (index into keys, start_index) to continue from.
+
+    If the checkpointed key is not in this run's plan (e.g. hit counts moved
+    and the windows were split differently) the whole plan is replayed;
+    upserts are idempotent so this only costs time.
+    """
+    if cp is None:
+        return 0, 0
+    try:
+        return keys.index(cp.cursor_key), cp.start_index
+    except ValueError:
+        print(f"WARNING: checkpoint cursor {cp.cursor_key!r} not in current plan; replaying from the start")
+        return 0, 0
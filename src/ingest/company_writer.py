@@ -0,0 +1,113 @@
+from __future__ import annotations
+
+from typing import Dict, List, Optional, Tuple
+
+from src.db.storage import Storage
+from src.ingest.change_log import CAPTURE_CHANGES, change_rows
+from src.ingest.fingerprints import FingerprintMap, content_hash
+
+# Writes shared by the ingest entry points. Callers own the transaction
+# (commit/rollback) and the run_id lifecycle (Storage.start_run/finish_run).
+
+
+def _company_row(it: dict, run_id: Optional[int]) -> tuple:
+    return (
+        it.get("company_number"),
+        it.get("company_name") or it.get("title"),
+        it.get("company_status"),
+        it.get("date_of_creation"),
+        it.get("company_type"),
+        run_id,
+        content_hash(it),
+    )
+
+
+def _address_row(it: dict) -> tuple:
+    addr = it.get("registered_office_address") or {}
+    return (
+        it.get("company_number"),
+        addr.get("locality"),
+        addr.get("region"),
+        addr.get("postal_code"),
+        addr.get("country"),
+    )
+
+
+def write_companies(storage: Storage, cur, items: List[dict], run_id: Optional[int] = None) -> int:
+    """
+    Write a batch of search items with a fixed number of round-trips.
+
+    The batch is applied set-based by the storage backend: one upsert into
+    companies and a replace of company_addresses and company_sic. SIC codes
+    not yet in sic_codes are registered there rather than dropped. When
+    run_id is None the first/last-seen columns are left alone. Later items
+    win if a company_number repeats. New and modified companies also get a
+    company_changes row (see change_log.py).
+
+    Returns the number of distinct companies written. The caller commits.
+    """
+    by_number: Dict[str, dict] = {}
+    for it in items:
+        number = it.get("company_number")
+        if number:
+            by_number[number] = it
+    if not by_number:
+        return 0
+
+    companies = [_company_row(it, run_id) for it in by_number.values()]
+    addresses = [_address_row(it) for it in by_number.values()]
+    sic_links = sorted({
+        (number, sic)
+        for number, it in by_number.items()
+        for sic in (it.get("sic_codes") or [])
+        if sic
+    })
+
+    changes = change_rows(storage, cur, by_number, run_id) if CAPTURE_CHANGES else []
+
+    storage.upsert_companies(cur, companies, addresses, sic_links)
+    if changes:
+        storage.insert_changes(cur, changes)
+    return len(by_number)
+
+
+def touch_companies(storage: Storage, cur, company_numbers: List[str], run_id: Optional[int]) -> int:
+    """Bump last_seen_run_id/last_seen_at for unchanged companies in one statement."""
+    numbers = sorted(set(company_numbers))
+    if not numbers or run_id is None:
+        return len(numbers)
+
+    storage.touch_companies(cur, numbers, run_id)
+    return len(numbers)
+
+
+def write_changed(
+    storage: Storage,
+    cur,
+    items: List[dict],
+    run_id: Optional[int],
+    fingerprints: Optional[FingerprintMap],
+) -> Tuple[int, int]:
+    """
+    Like write_companies(), but items whose content hash matches the
+    preloaded fingerprint map only get their last-seen columns bumped.
+    Returns (written, unchanged).
+    """
+    if fingerprints is None:
+        return write_companies(storage, cur, items, run_id), 0
+
+    changed: List[dict] = []
+    unchanged: List[str] = []
+    for it in items:
+        if fingerprints.is_unchanged(it):
+            unchanged.append(it["company_number"])
+        else:
+            changed.append(it)
+
+    written = write_companies(storage, cur, changed, run_id)
+    touch_companies(storage, cur, unchanged, run_id)
+
+    for it in changed:
+        if it.get("company_number"):
+            fingerprints.update(it["company_number"], content_hash(it))
+    return written, len(unchanged)
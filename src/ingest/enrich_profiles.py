@@ -0,0 +1,95 @@
+from __future__ import annotations
+
+import os
+import sys
+import json
+from typing import Iterable, List, Optional
+
+from src.db.storage import Storage, get_storage
+from src.ingest.ch_client import fetch_profiles
+
+# Profiles fetched more recently than this are not re-requested
+PROFILE_MAX_AGE_DAYS = int(os.getenv("PROFILE_MAX_AGE_DAYS", "30"))
+PROFILE_BATCH_SIZE = int(os.getenv("PROFILE_BATCH_SIZE", "200"))
+
+
+def _chunks(seq: List[str], n: int) -> Iterable[List[str]]:
+    for i in range(0, len(seq), n):
+        yield seq[i:i + n]
+
+
+def stale_company_numbers(
+    storage: Storage, cur, company_numbers: Iterable[str], max_age_days: int = PROFILE_MAX_AGE_DAYS
+) -> List[str]:
+    """Company numbers with no stored profile, or one older than max_age_days."""
+    wanted = sorted({n for n in company_numbers if n})
+    fresh = storage.fresh_profile_numbers(cur, wanted, max_age_days)
+    return [n for n in wanted if n not in fresh]
+
+
+def profile_row(p: dict) -> tuple:
+    """Map a profile payload to a company_profiles row."""
+    accounts = p.get("accounts") or {}
+    last_accounts = accounts.get("last_accounts") or {}
+    previous = p.get("previous_company_names") or []
+    sic_codes = p.get("sic_codes") or []
+
+    return (
+        p.get("company_number"),
+        accounts.get("next_due"),
+        last_accounts.get("made_up_to"),
+        1 if accounts.get("overdue") else 0,
+        json.dumps(previous, ensure_ascii=False) if previous else None,
+        ",".join(sic_codes) if sic_codes else None,
+    )
+
+
+def enrich_companies(storage: Storage, conn, company_numbers: Iterable[str], batch_size: int = PROFILE_BATCH_SIZE) -> int:
+    """
+    Fetch and store profiles for the given companies, skipping fresh ones.
+
+    Profiles are requested concurrently (within the shared rate budget) one
+    batch at a time, and each batch is written and committed together.
+    Returns the number of profiles written.
+    """
+    cur = conn.cursor()
+    todo = stale_company_numbers(storage, cur, company_numbers)
+    print(f"Profile enrichment: {len(todo)} to fetch")
+
+    written = 0
+    for batch in _chunks(todo, batch_size):
+        profiles = fetch_profiles(batch)
+        rows = [profile_row(p) for p in profiles if p and p.get("company_number")]
+        if rows:
+            storage.write_profiles(cur, rows)
+        conn.commit()
+        written += len(rows)
+        print(f"Profiles written: {written}/{len(todo)}")
+
+    return written
+
+
+def main(argv: Optional[List[str]] = None) -> None:
+    """
+    Usage:
+        python -m src.ingest.enrich_profiles RUN_ID
+        python -m src.ingest.enrich_profiles --numbers 00006400 12345678
+    """
+    args = list(sys.argv[1:] if argv is None else argv)
+    if not args:
+        raise SystemExit("Usage: enrich_profiles RUN_ID | --numbers N [N ...]")
+
+    storage = get_storage()
+    with storage.connection() as conn:
+        if args[0] == "--numbers":
+            numbers = args[1:]
+        else:
+            numbers = storage.companies_seen_in_run(conn.cursor(), int(args[0]))
+
+        written = enrich_companies(storage, conn, numbers)
+
+    print(f"Enrichment done. profiles_written={written}")
+
+
+if __name__ == "__main__":
+    main()
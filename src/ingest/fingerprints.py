@@ -0,0 +1,123 @@
+from __future__ import annotations
+
+import os
+import hashlib
+from array import array
+from bisect import bisect_left
+from typing import Dict, Iterable, Optional, Tuple
+
+from src.db.storage import Storage
+
+# Skip rewriting companies whose content hash is unchanged since the last run
+SKIP_UNCHANGED = os.getenv("SKIP_UNCHANGED", "1") == "1"
+
+FETCH_BATCH = 50_000
+
+
+def content_hash(it: dict) -> int:
+    """
+    Signed 64-bit hash of the fields the writer stores for a company:
+    name, status, type, incorporation date, registered address and SIC set.
+    """
+    addr = it.get("registered_office_address") or {}
+    parts = (
+        it.get("company_name") or it.get("title") or "",
+        it.get("company_status") or "",
+        it.get("company_type") or "",
+        it.get("date_of_creation") or "",
+        addr.get("locality") or "",
+        addr.get("region") or "",
+        addr.get("postal_code") or "",
+        addr.get("country") or "",
+        ",".join(sorted(set(it.get("sic_codes") or []))),
+    )
+    digest = hashlib.blake2b("\x1f".join(parts).encode("utf-8"), digest_size=8).digest()
+    return int.from_bytes(digest, "big", signed=True)
+
+
+def _pack_number(company_number: str) -> Optional[int]:
+    """
+    Company numbers are 8 ASCII characters; pack them into one uint64 whose
+    integer order matches byte order. Anything else returns None.
+    """
+    try:
+        raw = company_number.encode("ascii")
+    except UnicodeEncodeError:
+        return None
+    if len(raw) > 8:
+        return None
+    return int.from_bytes(raw.ljust(8, b"\0"), "big")
+
+
+class FingerprintMap:
+    """
+    company_number -> content_hash, in two parallel sorted arrays.
+
+    At 16 bytes per company, a few hundred thousand companies fit in a few
+    MB. Lookups are a binary search. Entries added after loading (and any
+    odd-shaped company numbers) go to a small overflow dict.
+    """
+
+    def __init__(self, pairs: Iterable[Tuple[str, int]] = ()) -> None:
+        self._keys = array("Q")
+        self._hashes = array("q")
+        self._overflow: Dict[str, Optional[int]] = {}
+
+        ordered = True
+        for number, h in pairs:
+            key = _pack_number(number)
+            if key is None:
+                self._overflow[number] = h
+                continue
+            if self._keys and key < self._keys[-1]:
+                ordered = False
+            self._keys.append(key)
+            self._hashes.append(h)
+
+        if not ordered:
+            order = sorted(range(len(self._keys)), key=self._keys.__getitem__)
+            self._keys = array("Q", (self._keys[i] for i in order))
+            self._hashes = array("q", (self._hashes[i] for i in order))
+
+    def __len__(self) -> int:
+        return len(self._keys) + len(self._overflow)
+
+    def get(self, company_number: str) -> Optional[int]:
+        if company_number in self._overflow:
+            return self._overflow[company_number]
+        key = _pack_number(company_number)
+        if key is None:
+            return None
+        i = bisect_left(self._keys, key)
+        if i < len(self._keys) and self._keys[i] == key:
+            return self._hashes[i]
+        return None
+
+    def is_unchanged(self, it: dict) -> bool:
+        return self.get(it.get("company_number") or "") == content_hash(it)
+
+    def update(self, company_number: str, h: int) -> None:
+        key = _pack_number(company_number)
+        if key is not None:
+            i = bisect_left(self._keys, key)
+            if i < len(self._keys) and self._keys[i] == key:
+                self._hashes[i] = h
+                return
+        self._overflow[company_number] = h
+
+    def forget(self, company_number: str) -> None:
+        """Drop a hash recorded for a write that was rolled back, so the company is rewritten."""
+        self._overflow[company_number] = None
+
+    def nbytes(self) -> int:
+        return (
+            self._keys.itemsize * len(self._keys)
+            + self._hashes.itemsize * len(self._hashes)
+        )
+
+
+def load_fingerprints(storage: Storage, cur) -> FingerprintMap:
+    """Stream (company_number, content_hash) for every hashed company into a FingerprintMap."""
+    fp = FingerprintMap(storage.iter_fingerprints(cur, FETCH_BATCH))
+    print(f"Loaded {len(fp)} company fingerprints ({fp.nbytes() / 1_048_576:.1f} MB)")
+    return fp
@@ -0,0 +1,226 @@
+from __future__ import annotations
+
+import os
+import sys
+import zipfile
+from datetime import date
+from pathlib import Path
+from typing import Iterator, List, Optional
+
+import pandas as pd
+
+from src.db.storage import get_storage
+from src.ingest.company_writer import write_changed
+from src.ingest.fingerprints import SKIP_UNCHANGED, load_fingerprints
+from src.ingest.pipeline import prefetch
+from src.ingest.postcode_filter import PostcodeFilter, corridor_from_env
+from src.ingest.sic_reference import filter_prefixes
+from src.validation.page_validation import quarantine_invalid
+
+# Bulk backfill from the Companies House "Free Company Data Product"
+# (BasicCompanyDataAsOneFile-YYYY-MM-DD.zip), read straight from the archive.
+
+# Exact codes, prefixes (62*) or sections (J); matched on the snapshot's SIC text
+SIC_CODES = [x.strip() for x in os.getenv("SIC_CODES", "62020,62012,62090").split(",") if x.strip()]
+
+SNAPSHOT_FROM = date.fromisoformat(os.getenv("SNAPSHOT_FROM", "2018-01-01"))
+SNAPSHOT_TO = date.fromisoformat(os.getenv("SNAPSHOT_TO", str(date.today())))  # inclusive
+
+CHUNK_ROWS = int(os.getenv("SNAPSHOT_CHUNK_ROWS", "100000"))
+COMMIT_EVERY = int(os.getenv("COMMIT_EVERY", "200"))
+
+SIC_COLUMNS = [f"SICCode.SicText_{i}" for i in range(1, 5)]
+
+# Snapshot headers carry stray leading spaces (' CompanyNumber'); matched stripped
+SNAPSHOT_COLUMNS = [
+    "CompanyName",
+    "CompanyNumber",
+    "RegAddress.PostTown",
+    "RegAddress.County",
+    "RegAddress.Country",
+    "RegAddress.PostCode",
+    "CompanyCategory",
+    "CompanyStatus",
+    "IncorporationDate",
+    *SIC_COLUMNS,
+]
+
+# CompanyCategory text -> advanced-search company_type
+COMPANY_TYPES = {
+    "Private Limited Company": "ltd",
+    "Public Limited Company": "plc",
+    "Limited Liability Partnership": "llp",
+    "Limited Partnership": "limited-partnership",
+    "Community Interest Company": "ltd",
+    "PRI/LBG/NSC (Private, Limited by guarantee, no share capital, use of 'Limited' exemption)":
+        "private-limited-guarant-nsc-limited-exemption",
+    "PRI/LTD BY GUAR/NSC (Private, limited by guarantee, no share capital)": "private-limited-guarant-nsc",
+    "Private Unlimited Company": "private-unlimited",
+}
+
+
+def _csv_member(zf: zipfile.ZipFile) -> str:
+    names = [n for n in zf.namelist() if n.lower().endswith(".csv")]
+    if not names:
+        raise RuntimeError("Snapshot zip contains no .csv member")
+    return names[0]
+
+
+def iter_snapshot_chunks(zip_path: Path, chunk_rows: int = CHUNK_ROWS) -> Iterator[pd.DataFrame]:
+    """Stream the snapshot CSV out of the zip in DataFrame chunks (all columns as str)."""
+    wanted = set(SNAPSHOT_COLUMNS)
+    with zipfile.ZipFile(zip_path) as zf:
+        with zf.open(_csv_member(zf)) as fh:
+            reader = pd.read_csv(
+                fh,
+                dtype=str,
+                keep_default_na=False,
+                usecols=lambda c: c.strip() in wanted,
+                chunksize=chunk_rows,
+                encoding="utf-8",
+            )
+            for chunk in reader:
+                chunk.columns = [c.strip() for c in chunk.columns]
+                yield chunk
+
+
+def filter_chunk(
+    df: pd.DataFrame,
+    *,
+    sic_codes: List[str],
+    incorporated_from: date,
+    incorporated_to: date,
+    corridor: PostcodeFilter,
+) -> pd.DataFrame:
+    """
+    Vectorised row filter: active status, incorporation window, any of the
+    four SIC columns starting with one of the sic_codes prefixes (see
+    sic_reference.filter_prefixes), registered office postcode in corridor.
+    Adds parsed `inc_date` and `sic_list` columns to the surviving rows.
+    """
+    mask = df["CompanyStatus"].str.strip().str.lower() == "active"
+
+    inc = pd.to_datetime(df["IncorporationDate"], format="%d/%m/%Y", errors="coerce")
+    mask &= (inc >= pd.Timestamp(incorporated_from)) & (inc <= pd.Timestamp(incorporated_to))
+
+    # 'SicText' values look like '62020 - Information technology consultancy activities'
+    sic = df[SIC_COLUMNS].apply(lambda col: col.str.slice(0, 5))
+    prefixes = tuple(filter_prefixes(sic_codes))
+    mask &= sic.apply(lambda col: col.str.startswith(prefixes, na=False)).any(axis=1)
+
+    mask &= corridor.mask(df["RegAddress.PostCode"])
+
+    out = df.loc[mask].copy()
+    out["inc_date"] = inc[mask].dt.strftime("%Y-%m-%d")
+    out["sic_list"] = [
+        [code for code in row if code.isdigit()]
+        for row in sic.loc[mask].itertuples(index=False, name=None)
+    ]
+    return out
+
+
+def _blank_to_none(v: str) -> Optional[str]:
+    v = (v or "").strip()
+    return v or None
+
+
+def rows_to_items(df: pd.DataFrame) -> Iterator[dict]:
+    """Shape filtered snapshot rows like advanced-search items for the shared writer."""
+    for r in df.to_dict("records"):
+        category = r["CompanyCategory"].strip()
+        yield {
+            "company_number": r["CompanyNumber"].strip(),
+            "company_name": r["CompanyName"].strip(),
+            "company_status": "active",
+            "date_of_creation": r["inc_date"],
+            "company_type": COMPANY_TYPES.get(category, category[:50] or None),
+            "registered_office_address": {
+                "locality": _blank_to_none(r["RegAddress.PostTown"]),
+                "region": _blank_to_none(r["RegAddress.County"]),
+                "postal_code": _blank_to_none(r["RegAddress.PostCode"]),
+                "country": _blank_to_none(r["RegAddress.Country"]),
+            },
+            "sic_codes": r["sic_list"],
+        }
+
+
+def main(argv: Optional[List[str]] = None) -> None:
+    """
+    Usage:
+        python -m src.ingest.ingest_snapshot_zip BasicCompanyDataAsOneFile-2025-12-01.zip
+    """
+    args = list(sys.argv[1:] if argv is None else argv)
+    if len(args) != 1:
+        raise SystemExit("Usage: ingest_snapshot_zip PATH_TO_SNAPSHOT_ZIP")
+    zip_path = Path(args[0])
+
+    corridor = corridor_from_env()
+    note = (
+        f"SNAPSHOT {zip_path.name} {SNAPSHOT_FROM}..{SNAPSHOT_TO} "
+        f"postcodes={corridor.describe()} sic={','.join(SIC_CODES)}"
+    )
+
+    inserted_total = 0
+    scanned_total = 0
+    quarantined_total = 0
+    seen: set[str] = set()
+
+    storage = get_storage()
+    with storage.connection() as conn:
+        cur = conn.cursor()
+        fingerprints = load_fingerprints(storage, cur) if SKIP_UNCHANGED else None
+
+        run_id = storage.start_run(cur, note=note)
+        conn.commit()
+
+        try:
+            # Decompress/parse the next chunk while this one is written
+            with prefetch(iter_snapshot_chunks(zip_path), maxsize=2) as chunks:
+                for chunk in chunks:
+                    scanned_total += len(chunk)
+                    matched = filter_chunk(
+                        chunk,
+                        sic_codes=SIC_CODES,
+                        incorporated_from=SNAPSHOT_FROM,
+                        incorporated_to=SNAPSHOT_TO,
+                        corridor=corridor,
+                    )
+
+                    # The whole chunk's matches are validated in one pass
+                    items, quarantined = quarantine_invalid(storage, cur, list(rows_to_items(matched)), run_id)
+                    quarantined_total += quarantined
+
+                    batch = []
+                    for it in items:
+                        number = it["company_number"]
+                        if not number or number in seen:
+                            continue
+                        seen.add(number)
+                        batch.append(it)
+
+                        if len(batch) >= COMMIT_EVERY:
+                            inserted_total += sum(write_changed(storage, cur, batch, run_id, fingerprints))
+                            batch = []
+                            conn.commit()
+
+                    inserted_total += sum(write_changed(storage, cur, batch, run_id, fingerprints))
+                    conn.commit()
+                    print(f"Scanned {scanned_total} rows | matched so far {inserted_total}")
+
+            storage.finish_run(cur, run_id, status="success", records_inserted=inserted_total)
+            conn.commit()
+            print(
+                f"\nSNAPSHOT DONE. run_id={run_id} inserted/updated={inserted_total} scanned={scanned_total} "
+                f"quarantined={quarantined_total}"
+            )
+
+        except BaseException:
+            conn.rollback()
+            cur = conn.cursor()
+            storage.finish_run(cur, run_id, status="failure", records_inserted=inserted_total)
+            conn.commit()
+            raise
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,115 @@
+from __future__ import annotations
+
+import codecs
+import json
+from typing import Any, Dict, Iterable, Iterator
+
+_WS = " \t\r\n"
+_DECODER = json.JSONDecoder()
+
+
+class _TextStream:
+    """Incrementally decoded text over an iterable of byte chunks."""
+
+    def __init__(self, chunks: Iterable[bytes]) -> None:
+        self._chunks = iter(chunks)
+        self._utf8 = codecs.getincrementaldecoder("utf-8")()
+        self.buf = ""
+        self.pos = 0
+        self.eof = False
+
+    def more(self) -> bool:
+        """Append the next chunk to the buffer. False once the input is exhausted."""
+        if self.eof:
+            return False
+        for chunk in self._chunks:
+            if not chunk:
+                continue
+            text = self._utf8.decode(chunk)
+            if not text:
+                continue
+            # Drop what has already been consumed so the buffer stays small
+            self.buf = self.buf[self.pos:] + text
+            self.pos = 0
+            return True
+        self.buf = self.buf[self.pos:] + self._utf8.decode(b"", final=True)
+        self.pos = 0
+        self.eof = True
+        return False
+
+    def peek(self) -> str:
+        """Next non-whitespace character ('' at end of input), not consumed."""
+        while True:
+            while self.pos < len(self.buf) and self.buf[self.pos] in _WS:
+                self.pos += 1
+            if self.pos < len(self.buf):
+                return self.buf[self.pos]
+            if not self.more():
+                return ""
+
+    def expect(self, ch: str) -> None:
+        got = self.peek()
+        if got != ch:
+            raise ValueError(f"Malformed JSON stream: expected {ch!r}, got {got!r}")
+        self.pos += 1
+
+    def value(self) -> Any:
+        """Decode one complete JSON value starting at the current position."""
+        self.peek()
+        while True:
+            try:
+                obj, end = _DECODER.raw_decode(self.buf, self.pos)
+            except json.JSONDecodeError:
+                if not self.more():
+                    raise
+                continue
+            # A number that ends exactly at the buffer edge may continue in
+            # the next chunk
+            if end == len(self.buf) and not self.eof and self.more():
+                continue
+            self.pos = end
+            return obj
+
+
+def iter_array_items(chunks: Iterable[bytes], array_key: str, fields: Dict[str, Any]) -> Iterator[Any]:
+    """
+    Stream the elements of the top-level array `array_key` from a JSON object.
+
+    Elements are yielded one at a time as soon as each has been received and
+    parsed, so only one element (plus one network chunk) is held in memory.
+    Every other top-level member is decoded normally and stored in `fields`
+    as it is encountered; members after the array are available once the
+    iterator is exhausted.
+    """
+    s = _TextStream(chunks)
+    s.expect("{")
+
+    while True:
+        ch = s.peek()
+        if ch == "}":
+            s.pos += 1
+            return
+        if ch == ",":
+            s.pos += 1
+            continue
+
+        key = s.value()
+        if not isinstance(key, str):
+            raise ValueError("Malformed JSON stream: object key is not a string")
+        s.expect(":")
+
+        if key == array_key and s.peek() == "[":
+            s.pos += 1
+            while True:
+                ch = s.peek()
+                if ch == "]":
+                    s.pos += 1
+                    break
+                if ch == ",":
+                    s.pos += 1
+                    continue
+                if ch == "":
+                    raise ValueError("Malformed JSON stream: unterminated array")
+                yield s.value()
+        else:
+            fields[key] = s.value()
@@ -0,0 +1,83 @@
+from __future__ import annotations
+
+import os
+import queue
+import threading
+from contextlib import contextmanager
+from typing import Iterable, Iterator, TypeVar
+
+T = TypeVar("T")
+
+# Pages fetched ahead of the writer; the fetch side blocks once this many are waiting
+PIPELINE_QUEUE_PAGES = int(os.getenv("PIPELINE_QUEUE_PAGES", "8"))
+
+_POLL_SECONDS = 0.2
+
+
+class _Done:
+    pass
+
+
+class _Failed:
+    def __init__(self, exc: BaseException) -> None:
+        self.exc = exc
+
+
+@contextmanager
+def prefetch(source: Iterable[T], maxsize: int = PIPELINE_QUEUE_PAGES) -> Iterator[Iterator[T]]:
+    """
+    Run `source` on a background thread, handing its items over through a
+    bounded queue so fetching overlaps with whatever the caller does per item
+    (DB writes). Items keep their order.
+
+        with prefetch(iter_month_pages(...)) as pages:
+            for key, start_index, data in pages:
+                ...
+
+    An exception raised by the source is re-raised in the caller at the point
+    it occurred in the sequence. Leaving the block early (break, error in the
+    caller) stops the producer and closes the source before returning.
+    """
+    q: "queue.Queue[object]" = queue.Queue(maxsize=max(1, maxsize))
+    stop = threading.Event()
+
+    def put(item: object) -> bool:
+        while not stop.is_set():
+            try:
+                q.put(item, timeout=_POLL_SECONDS)
+                return True
+            except queue.Full:
+                continue
+        return False
+
+    def produce() -> None:
+        it = iter(source)
+        try:
+            for item in it:
+                if not put(item):
+                    return
+            put(_Done())
+        except BaseException as e:
+            put(_Failed(e))
+        finally:
+            close = getattr(it, "close", None)
+            if close is not None:
+                close()
+
+    worker = threading.Thread(target=produce, name="prefetch", daemon=True)
+    worker.start()
+
+    def consume() -> Iterator[T]:
+        while True:
+            item = q.get()
+            if isinstance(item, _Done):
+                return
+            if isinstance(item, _Failed):
+                raise item.exc
+            yield item  # type: ignore[misc]
+
+    try:
+        yield consume()
+    finally:
+        stop.set()
+        worker.join()
@@ -0,0 +1,89 @@
+from __future__ import annotations
+
+import os
+import re
+from typing import Iterable, List, Optional
+
+# Postcode areas covering the Luton -> Milton Keynes corridor
+DEFAULT_CORRIDOR_POSTCODES = "LU,MK,AL,HP,SG"
+
+# 'LU1:25' selects registered offices within 25 km of LU1 instead of
+# CORRIDOR_POSTCODES (needs the postcode centroid file, see postcode_geo.py)
+CORRIDOR_RADIUS = os.getenv("CORRIDOR_RADIUS", "").strip()
+
+_AREA_RE = re.compile(r"[A-Z]{1,2}")
+_DISTRICT_RE = re.compile(r"[A-Z]{1,2}[0-9][0-9A-Z]?")
+
+
+def outward_code(postal_code: Optional[str]) -> Optional[str]:
+    """'lu1 3ab' -> 'LU1'. Also accepts a bare outward code ('LU1')."""
+    if not postal_code:
+        return None
+    pc = postal_code.upper().replace(" ", "")
+    # Full postcodes always end in a 3-character inward code
+    outward = pc[:-3] if len(pc) >= 5 else pc
+    return outward if _DISTRICT_RE.fullmatch(outward) else None
+
+
+class PostcodeFilter:
+    """
+    Set-lookup filter on registered office postcodes.
+
+    Entries are either whole postcode areas ('LU') or individual districts
+    ('MK10'); a postcode matches if its district or its area is listed.
+    """
+
+    def __init__(self, entries: Iterable[str]) -> None:
+        self.areas: set[str] = set()
+        self.districts: set[str] = set()
+        for raw in entries:
+            e = raw.strip().upper().replace(" ", "")
+            if not e:
+                continue
+            if _AREA_RE.fullmatch(e):
+                self.areas.add(e)
+            elif _DISTRICT_RE.fullmatch(e):
+                self.districts.add(e)
+            else:
+                raise ValueError(f"Not a postcode area or district: {raw!r}")
+
+    @classmethod
+    def from_env(cls) -> "PostcodeFilter":
+        raw = os.getenv("CORRIDOR_POSTCODES", DEFAULT_CORRIDOR_POSTCODES)
+        return cls(raw.split(","))
+
+    def matches(self, postal_code: Optional[str]) -> bool:
+        outward = outward_code(postal_code)
+        if outward is None:
+            return False
+        if outward in self.districts:
+            return True
+        m = _AREA_RE.match(outward)
+        return m is not None and m.group(0) in self.areas
+
+    def filter_items(self, items: Iterable[dict]) -> List[dict]:
+        """Search items whose registered office postcode is in the filter."""
+        matches = self.matches
+        return [
+            it for it in items
+            if matches((it.get("registered_office_address") or {}).get("postal_code"))
+        ]
+
+    def mask(self, postal_codes):
+        """Vectorised matches() over a pandas Series of postcodes."""
+        pc = postal_codes.fillna("").str.upper().str.replace(" ", "", regex=False)
+        outward = pc.str.slice(0, -3)
+        area = outward.str.extract(r"^([A-Z]{1,2})", expand=False)
+        return outward.isin(self.districts) | area.isin(self.areas)
+
+    def describe(self) -> str:
+        return ",".join(sorted(self.areas | self.districts))
+
+
+def corridor_from_env():
+    """RadiusFilter for CORRIDOR_RADIUS if set, else PostcodeFilter for CORRIDOR_POSTCODES."""
+    if CORRIDOR_RADIUS:
+        from src.ingest.postcode_geo import RadiusFilter
+
+        return RadiusFilter.from_spec(CORRIDOR_RADIUS)
+    return PostcodeFilter.from_env()
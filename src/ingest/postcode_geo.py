@@ -0,0 +1,356 @@
+from __future__ import annotations
+
+import os
+import csv
+import math
+import argparse
+from pathlib import Path
+from typing import Iterable, List, Optional, Sequence, Tuple
+
+import numpy as np
+import pandas as pd
+
+from src.db.storage import Storage, get_storage
+from src.ingest.postcode_filter import outward_code
+
+# ONS Postcode Directory (ONSPD) CSV, or any CSV with a postcode and lat/long column.
+# A .npz copy is cached beside it on first load.
+REPO_ROOT = Path(__file__).resolve().parents[2]
+POSTCODE_CENTROIDS = Path(os.getenv("POSTCODE_CENTROIDS", str(REPO_ROOT / "data" / "reference" / "ONSPD.csv")))
+
+# Grid cell edge in degrees: ~11 km north-south, ~7 km east-west in the UK
+GRID_CELL_DEGREES = float(os.getenv("GRID_CELL_DEGREES", "0.1"))
+
+# Address rows updated per commit by geocode_addresses
+GEOCODE_BATCH = int(os.getenv("GEOCODE_BATCH", "5000"))
+
+EARTH_RADIUS_KM = 6371.0088
+KM_PER_DEGREE_LAT = math.pi * EARTH_RADIUS_KM / 180
+
+_POSTCODE_COLUMNS = ("pcds", "pcd", "pcd2", "postcode")
+_LAT_COLUMNS = ("lat", "latitude")
+_LON_COLUMNS = ("long", "lon", "longitude")
+
+# Grid cell key = row * _GRID_STRIDE + col
+_GRID_STRIDE = 1 << 20
+
+
+def normalize_postcode(raw: Optional[str]) -> str:
+    return (raw or "").upper().replace(" ", "")
+
+
+def haversine_km(lat: float, lon: float, lats: np.ndarray, lons: np.ndarray) -> np.ndarray:
+    """Great-circle distance from (lat, lon) to each point, vectorised."""
+    lat1, lon1 = math.radians(lat), math.radians(lon)
+    lat2, lon2 = np.radians(lats), np.radians(lons)
+    a = np.sin((lat2 - lat1) / 2) ** 2 + math.cos(lat1) * np.cos(lat2) * np.sin((lon2 - lon1) / 2) ** 2
+    return 2 * EARTH_RADIUS_KM * np.arcsin(np.sqrt(a))
+
+
+def bounding_box(lat: float, lon: float, km: float) -> Tuple[float, float, float, float]:
+    """(min_lat, max_lat, min_lon, max_lon) enclosing the circle of radius km."""
+    dlat = km / KM_PER_DEGREE_LAT
+    # Widest in longitude at the edge furthest from the equator
+    widest = min(abs(lat) + dlat, 89.0)
+    dlon = km / (KM_PER_DEGREE_LAT * math.cos(math.radians(widest)))
+    return lat - dlat, lat + dlat, lon - dlon, lon + dlon
+
+
+def _pick(columns: Iterable[str], candidates: Sequence[str], path: Path) -> str:
+    by_lower = {c.strip().lower(): c for c in columns}
+    for name in candidates:
+        if name in by_lower:
+            return by_lower[name]
+    raise RuntimeError(f"{path}: no column named any of {', '.join(candidates)}")
+
+
+class PostcodeIndex:
+    """
+    Postcode centroids held in flat numpy arrays, in two orders over the
+    same points: by postcode (binary search for lookups) and by grid cell
+    (each cell a contiguous slice). A radius query reads only the cells its
+    bounding box covers and filters those candidates with one vectorised
+    haversine, so it stays in the millisecond range over the full ONSPD.
+    """
+
+    def __init__(
+        self,
+        postcodes: np.ndarray,
+        lat: np.ndarray,
+        lon: np.ndarray,
+        cell_degrees: float = GRID_CELL_DEGREES,
+    ) -> None:
+        """postcodes: normalised (no spaces) and sorted; lat/lon aligned with them."""
+        self.postcodes = postcodes
+        self.lat = lat
+        self.lon = lon
+        self.cell_degrees = cell_degrees
+
+        keys = self._cell_key(*self._cell(lat, lon))
+        self._by_cell = np.argsort(keys, kind="stable")
+        self._cell_keys = keys[self._by_cell]
+
+    def __len__(self) -> int:
+        return len(self.postcodes)
+
+    # -- loading -----------------------------------------------------------
+
+    @classmethod
+    def from_csv(cls, path: Path) -> "PostcodeIndex":
+        columns = pd.read_csv(path, nrows=0).columns
+        pc_col = _pick(columns, _POSTCODE_COLUMNS, path)
+        lat_col = _pick(columns, _LAT_COLUMNS, path)
+        lon_col = _pick(columns, _LON_COLUMNS, path)
+
+        df = pd.read_csv(
+            path,
+            usecols=[pc_col, lat_col, lon_col],
+            dtype={pc_col: str, lat_col: "float64", lon_col: "float64"},
+        )
+        # ONSPD gives 99.999999 / 0 for postcodes without a grid reference
+        df = df[df[lat_col].between(-90, 90) & (df[lat_col] != 0) & df[pc_col].notna()]
+
+        postcodes = df[pc_col].str.upper().str.replace(" ", "", regex=False).to_numpy(dtype=str)
+        order = np.argsort(postcodes)
+        return cls(postcodes[order], df[lat_col].to_numpy()[order], df[lon_col].to_numpy()[order])
+
+    @classmethod
+    def load(cls, path: Path = POSTCODE_CENTROIDS) -> "PostcodeIndex":
+        """From the CSV, through a .npz cache beside it that is rebuilt whenever the CSV is newer."""
+        if not path.exists():
+            raise RuntimeError(f"Postcode centroid file not found: {path} (set POSTCODE_CENTROIDS)")
+        cache = path.with_suffix(".npz")
+        if cache.exists() and cache.stat().st_mtime >= path.stat().st_mtime:
+            with np.load(cache) as data:
+                return cls(data["postcodes"], data["lat"], data["lon"])
+
+        index = cls.from_csv(path)
+        np.savez(cache, postcodes=index.postcodes, lat=index.lat, lon=index.lon)
+        return index
+
+    # -- grid --------------------------------------------------------------
+
+    def _cell(self, lat, lon):
+        row = np.floor((np.asarray(lat) + 90.0) / self.cell_degrees).astype(np.int64)
+        col = np.floor((np.asarray(lon) + 180.0) / self.cell_degrees).astype(np.int64)
+        return row, col
+
+    @staticmethod
+    def _cell_key(row, col):
+        return row * _GRID_STRIDE + col
+
+    def within(self, lat: float, lon: float, km: float) -> np.ndarray:
+        """Positions (into self.postcodes) of the centroids within km of (lat, lon)."""
+        min_lat, max_lat, min_lon, max_lon = bounding_box(lat, lon, km)
+        (r0, r1), (c0, c1) = self._cell([min_lat, max_lat], [min_lon, max_lon])
+
+        # Cells of one grid row are adjacent in key order: one slice per row
+        rows = np.arange(r0, r1 + 1, dtype=np.int64)
+        starts = np.searchsorted(self._cell_keys, self._cell_key(rows, c0), side="left")
+        ends = np.searchsorted(self._cell_keys, self._cell_key(rows, c1), side="right")
+        slices = [self._by_cell[s:e] for s, e in zip(starts, ends) if e > s]
+        if not slices:
+            return np.empty(0, dtype=np.int64)
+
+        candidates = np.concatenate(slices)
+        dist = haversine_km(lat, lon, self.lat[candidates], self.lon[candidates])
+        return candidates[dist <= km]
+
+    # -- lookups -----------------------------------------------------------
+
+    def _prefix_range(self, prefix: str) -> Tuple[int, int]:
+        lo = int(np.searchsorted(self.postcodes, prefix, side="left"))
+        hi = int(np.searchsorted(self.postcodes, prefix + "\uffff", side="left"))
+        return lo, hi
+
+    def locate(self, code: str) -> Optional[Tuple[float, float]]:
+        """
+        (lat, lon) of a full postcode ('LU1 3AB'), or the mean centroid of a
+        district ('LU1') or area ('LU'). None if nothing matches.
+        """
+        code = normalize_postcode(code)
+        if not code:
+            return None
+        lo, hi = self._prefix_range(code)
+        if lo < len(self.postcodes) and self.postcodes[lo] == code:
+            return float(self.lat[lo]), float(self.lon[lo])
+
+        if code.isalpha():
+            # Area: 'L' must not pick up 'LU...'
+            members = [i for i in range(lo, hi) if self.postcodes[i][len(code)].isdigit()]
+        else:
+            members = [i for i in range(lo, hi) if outward_code(str(self.postcodes[i])) == code]
+        if not members:
+            return None
+        return float(self.lat[members].mean()), float(self.lon[members].mean())
+
+    def coordinates(self, postcodes: Sequence[Optional[str]]) -> Tuple[np.ndarray, np.ndarray]:
+        """(lat, lon) arrays aligned with postcodes; NaN where a postcode is unknown."""
+        wanted = np.array([normalize_postcode(p) for p in postcodes], dtype=str)
+        lat = np.full(len(wanted), np.nan)
+        lon = np.full(len(wanted), np.nan)
+        if not len(wanted) or not len(self.postcodes):
+            return lat, lon
+
+        pos = np.minimum(np.searchsorted(self.postcodes, wanted), len(self.postcodes) - 1)
+        found = self.postcodes[pos] == wanted
+        lat[found] = self.lat[pos[found]]
+        lon[found] = self.lon[pos[found]]
+        return lat, lon
+
+
+_INDEX: Optional[PostcodeIndex] = None
+
+
+def postcode_index() -> PostcodeIndex:
+    global _INDEX
+    if _INDEX is None:
+        _INDEX = PostcodeIndex.load()
+    return _INDEX
+
+
+def parse_radius(spec: str) -> Tuple[str, float]:
+    """'LU1:25' -> ('LU1', 25.0)."""
+    centre, sep, km = spec.partition(":")
+    try:
+        radius = float(km)
+    except ValueError:
+        radius = -1.0
+    if not sep or not centre.strip() or radius <= 0:
+        raise ValueError(f"Bad radius {spec!r} (expected POSTCODE:KM, e.g. LU1:25)")
+    return centre.strip().upper(), radius
+
+
+class RadiusFilter:
+    """
+    Registered office postcode within km of a centre postcode, district or
+    area. Same interface as PostcodeFilter; the radius is resolved once to
+    the set of postcodes inside it, so matching is a set lookup.
+    """
+
+    def __init__(self, index: PostcodeIndex, centre: str, km: float) -> None:
+        point = index.locate(centre)
+        if point is None:
+            raise ValueError(f"Unknown postcode, district or area: {centre!r}")
+        self.centre = centre.strip().upper()
+        self.km = km
+        self.postcodes = frozenset(index.postcodes[index.within(point[0], point[1], km)].tolist())
+
+    @classmethod
+    def from_spec(cls, spec: str) -> "RadiusFilter":
+        centre, km = parse_radius(spec)
+        return cls(postcode_index(), centre, km)
+
+    def matches(self, postal_code: Optional[str]) -> bool:
+        return normalize_postcode(postal_code) in self.postcodes
+
+    def filter_items(self, items: Iterable[dict]) -> List[dict]:
+        matches = self.matches
+        return [
+            it for it in items
+            if matches((it.get("registered_office_address") or {}).get("postal_code"))
+        ]
+
+    def mask(self, postal_codes: pd.Series) -> pd.Series:
+        pc = postal_codes.fillna("").str.upper().str.replace(" ", "", regex=False)
+        return pc.isin(self.postcodes)
+
+    def describe(self) -> str:
+        return f"{self.centre}+{self.km:g}km"
+
+
+def geocode_addresses(storage: Storage, conn, index: Optional[PostcodeIndex] = None) -> Tuple[int, int]:
+    """
+    Set latitude/longitude on company_addresses rows that have none, in
+    batches of GEOCODE_BATCH committed separately. Returns (located, unknown);
+    unknown postcodes stay NULL and are retried next time.
+    """
+    index = index or postcode_index()
+    cur = conn.cursor()
+    pending = storage.addresses_missing_coordinates(cur)
+
+    located = 0
+    for i in range(0, len(pending), GEOCODE_BATCH):
+        batch = pending[i:i + GEOCODE_BATCH]
+        lat, lon = index.coordinates([pc for _, pc in batch])
+        rows = [
+            (float(la), float(lo), address_id)
+            for (address_id, _), la, lo in zip(batch, lat, lon)
+            if not math.isnan(la)
+        ]
+        if rows:
+            storage.set_address_coordinates(cur, rows)
+            conn.commit()
+        located += len(rows)
+    return located, len(pending) - located
+
+
+def companies_near(storage: Storage, cur, index: PostcodeIndex, centre: str, km: float) -> Tuple[List[str], List[tuple]]:
+    """
+    (columns, rows) for companies whose geocoded registered office lies
+    within km of centre, nearest first, with a trailing distance_km column.
+    The database narrows to the bounding box on its lat/long index; the
+    exact circle is applied here.
+    """
+    point = index.locate(centre)
+    if point is None:
+        raise RuntimeError(f"Unknown postcode, district or area: {centre!r}")
+
+    storage.select_companies_in_box(cur, *bounding_box(point[0], point[1], km))
+    cols = [d[0] for d in cur.description]
+    rows = cur.fetchall()
+    if not rows:
+        return cols + ["distance_km"], []
+
+    lat_i, lon_i = cols.index("latitude"), cols.index("longitude")
+    dist = haversine_km(
+        point[0], point[1],
+        np.array([r[lat_i] for r in rows], dtype=float),
+        np.array([r[lon_i] for r in rows], dtype=float),
+    )
+    near = [(*rows[i], round(float(dist[i]), 3)) for i in np.argsort(dist) if dist[i] <= km]
+    return cols + ["distance_km"], near
+
+
+def main(argv: Optional[List[str]] = None) -> None:
+    """
+    Usage:
+        python -m src.ingest.postcode_geo geocode              # lat/long for addresses that lack it
+        python -m src.ingest.postcode_geo near LU1 10 [--out companies.csv]
+    """
+    parser = argparse.ArgumentParser(description="Postcode centroid geo-index")
+    sub = parser.add_subparsers(dest="command", required=True)
+    sub.add_parser("geocode", help="fill company_addresses latitude/longitude from POSTCODE_CENTROIDS")
+    near = sub.add_parser("near", help="companies within KM of a postcode, district or area")
+    near.add_argument("centre")
+    near.add_argument("km", type=float)
+    near.add_argument("--out", type=Path, help="write the companies to this CSV")
+    args = parser.parse_args(argv)
+
+    index = postcode_index()
+    print(f"Postcode index: {len(index)} centroids from {POSTCODE_CENTROIDS}")
+
+    storage = get_storage()
+    with storage.connection() as conn:
+        if args.command == "geocode":
+            located, unknown = geocode_addresses(storage, conn, index)
+            print(f"Geocoded addresses: {located} (postcode not in index: {unknown})")
+            return
+
+        cols, rows = companies_near(storage, conn.cursor(), index, args.centre, args.km)
+
+    print(f"Companies within {args.km:g} km of {args.centre.upper()}: {len(rows)}")
+    if args.out:
+        args.out.parent.mkdir(parents=True, exist_ok=True)
+        with args.out.open("w", newline="", encoding="utf-8") as f:
+            w = csv.writer(f)
+            w.writerow(cols)
+            w.writerows(rows)
+        print(f"CSV written to: {args.out}")
+    else:
+        for r in rows[:20]:
+            print("  " + " | ".join("" if v is None else str(v) for v in r))
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,143 @@
+from __future__ import annotations
+
+import os
+from dataclasses import dataclass
+from datetime import date, timedelta
+from typing import Any, Dict, Iterator, List, Optional, Tuple
+
+from src.ingest.ch_client import MAX_CONCURRENCY, fetch_pages
+
+# Advanced search will not page beyond this many results for one query
+RESULT_CAP = int(os.getenv("CH_RESULT_CAP", "10000"))
+
+
+@dataclass(frozen=True)
+class WorkUnit:
+    """One query window whose full result set fits under the result cap."""
+
+    location: Optional[str]  # None = no location filter (region mode)
+    incorporated_from: date
+    incorporated_to: date  # inclusive
+    hits: int
+
+    @property
+    def key(self) -> str:
+        return f"{self.location or '*'}|{self.incorporated_from}|{self.incorporated_to}"
+
+
+def _split(d_from: date, d_to: date) -> Tuple[Tuple[date, date], Tuple[date, date]]:
+    mid = d_from + timedelta(days=(d_to - d_from).days // 2)
+    return (d_from, mid), (mid + timedelta(days=1), d_to)
+
+
+def plan_work_units(
+    *,
+    locations: List[Optional[str]],
+    sic_codes: List[str],
+    incorporated_from: date,
+    incorporated_to: date,
+    company_status: str = "active",
+    cap: int = RESULT_CAP,
+    max_concurrency: int = MAX_CONCURRENCY,
+) -> List[WorkUnit]:
+    """
+    Split each location's incorporation window until every piece has at most
+    `cap` hits.
+
+    Each round probes all pending windows at once with size=1 requests and
+    bisects the date range of any window that is still over the cap. Windows
+    with no hits are dropped. A single day that is still over the cap is kept
+    as-is (and reported), since it cannot be split further by date.
+
+    Units are returned ordered by (location order, incorporated_from).
+    """
+    order = {loc: i for i, loc in enumerate(locations)}
+    pending = [(loc, incorporated_from, incorporated_to) for loc in locations]
+    units: List[WorkUnit] = []
+    probes = 0
+
+    while pending:
+        pages = fetch_pages(
+            [
+                {
+                    "location": loc,
+                    "sic_codes": sic_codes,
+                    "start_index": 0,
+                    "size": 1,
+                    "company_status": company_status,
+                    "incorporated_from": str(d_from),
+                    "incorporated_to": str(d_to),
+                }
+                for loc, d_from, d_to in pending
+            ],
+            max_concurrency,
+        )
+        probes += len(pending)
+
+        next_round = []
+        for (loc, d_from, d_to), page in zip(pending, pages):
+            hits = page.get("hits")
+            if not isinstance(hits, int):
+                hits = len(page.get("items") or [])
+
+            if hits == 0:
+                continue
+            if hits <= cap:
+                units.append(WorkUnit(loc, d_from, d_to, hits))
+            elif d_from >= d_to:
+                print(f"WARNING: {loc or 'all locations'} {d_from} has {hits} hits (> cap {cap}); results will be truncated")
+                units.append(WorkUnit(loc, d_from, d_to, hits))
+            else:
+                next_round.extend((loc, a, b) for a, b in _split(d_from, d_to))
+        pending = next_round
+
+    units.sort(key=lambda u: (order[u.location], u.incorporated_from))
+    print(f"Planned {len(units)} work units from {probes} probe requests")
+    return units
+
+
+def iter_work_unit_pages(
+    units: List[WorkUnit],
+    *,
+    sic_codes: List[str],
+    size: int,
+    company_status: str = "active",
+    cap: int = RESULT_CAP,
+    max_concurrency: int = MAX_CONCURRENCY,
+    first_start_index: int = 0,
+) -> Iterator[Tuple[WorkUnit, int, Dict[str, Any]]]:
+    """
+    Yield (unit, start_index, page) for every page of every work unit.
+
+    Since each unit's hit count is already known, all page requests are
+    independent; they are fetched in concurrent waves and yielded in
+    (unit order, start_index) order. Pages of the first unit below
+    first_start_index are skipped (used when resuming from a checkpoint).
+    """
+    tasks: List[Tuple[WorkUnit, int]] = [
+        (u, start)
+        for i, u in enumerate(units)
+        for start in range(first_start_index if i == 0 else 0, min(u.hits, cap), size)
+    ]
+
+    wave = max(1, max_concurrency) * 2
+    for i in range(0, len(tasks), wave):
+        batch = tasks[i:i + wave]
+        pages = fetch_pages(
+            [
+                {
+                    "location": u.location,
+                    "sic_codes": sic_codes,
+                    "start_index": start,
+                    "size": size,
+                    "company_status": company_status,
+                    "incorporated_from": str(u.incorporated_from),
+                    "incorporated_to": str(u.incorporated_to),
+                }
+                for u, start in batch
+            ],
+            max_concurrency,
+        )
+        for (u, start), page in zip(batch, pages):
+            yield u, start, page
+
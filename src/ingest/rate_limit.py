@@ -0,0 +1,140 @@
+from __future__ import annotations
+
+import threading
+import time
+from datetime import datetime, timezone
+from email.utils import parsedate_to_datetime
+from typing import Any, Dict, Mapping, Optional
+
+
+class TokenBucket:
+    """
+    Thread-safe token bucket shared by every Companies House call.
+
+    The bucket refills continuously at capacity / window_seconds tokens per
+    second. The server's own view of the budget (X-Ratelimit-* headers) is
+    folded back in after every response, and a 429 (or a response with no
+    budget left) pauses all callers until the server says the window has
+    reset.
+    """
+
+    def __init__(self, capacity: int, window_seconds: float) -> None:
+        if capacity <= 0 or window_seconds <= 0:
+            raise ValueError("capacity and window_seconds must be positive")
+        self.capacity = float(capacity)
+        self.window_seconds = float(window_seconds)
+        self._tokens = float(capacity)
+        self._updated = time.monotonic()
+        self._paused_until = 0.0
+        self._reset_at: Optional[float] = None  # epoch seconds, from headers
+        self._lock = threading.Lock()
+
+    @property
+    def rate(self) -> float:
+        return self.capacity / self.window_seconds
+
+    def _refill(self, now: float) -> None:
+        elapsed = now - self._updated
+        if elapsed > 0:
+            self._tokens = min(self.capacity, self._tokens + elapsed * self.rate)
+            self._updated = now
+
+    def acquire(self) -> None:
+        """Block until one request may be sent, then consume a token."""
+        while True:
+            with self._lock:
+                now = time.monotonic()
+                self._refill(now)
+                if now < self._paused_until:
+                    wait = self._paused_until - now
+                elif self._tokens >= 1.0:
+                    self._tokens -= 1.0
+                    return
+                else:
+                    wait = (1.0 - self._tokens) / self.rate
+            time.sleep(wait)
+
+    def pause(self, seconds: float) -> None:
+        """Stop every caller from sending for `seconds` and drain the bucket."""
+        with self._lock:
+            now = time.monotonic()
+            self._paused_until = max(self._paused_until, now + max(0.0, seconds))
+            self._tokens = 0.0
+            self._updated = now
+
+    def observe(self, headers: Mapping[str, str]) -> None:
+        """
+        Reconcile the bucket with the server's X-Ratelimit-* headers. With
+        nothing left (X-Ratelimit-Remain: 0) and a known reset time, every
+        caller is paused until the reset.
+        """
+        limit = _int_header(headers, "X-Ratelimit-Limit")
+        remain = _int_header(headers, "X-Ratelimit-Remain")
+        reset = _int_header(headers, "X-Ratelimit-Reset")
+
+        with self._lock:
+            self._refill(time.monotonic())
+            if limit:
+                self.capacity = float(limit)
+            if remain is not None:
+                # The server is the source of truth; never believe we have more
+                self._tokens = min(self._tokens, float(remain))
+            if reset:
+                self._reset_at = float(reset)
+
+        if remain == 0:
+            # Budget spent: refilling at the average rate would still send
+            # before the server's window resets, so hold everyone until then
+            wait = self.seconds_until_reset()
+            if wait is not None:
+                self.pause(wait)
+
+    def status(self) -> Dict[str, Any]:
+        """Budget snapshot: remaining tokens, capacity, and window reset time."""
+        with self._lock:
+            now = time.monotonic()
+            self._refill(now)
+            return {
+                "remaining": int(self._tokens),
+                "limit": int(self.capacity),
+                "paused_for_s": round(max(0.0, self._paused_until - now), 3),
+                "reset_at": (
+                    datetime.fromtimestamp(self._reset_at, tz=timezone.utc).isoformat()
+                    if self._reset_at
+                    else None
+                ),
+            }
+
+    def seconds_until_reset(self) -> Optional[float]:
+        with self._lock:
+            if not self._reset_at:
+                return None
+            return max(0.0, self._reset_at - time.time())
+
+
+def _int_header(headers: Mapping[str, str], name: str) -> Optional[int]:
+    raw = headers.get(name)
+    if raw is None:
+        return None
+    try:
+        return int(str(raw).strip())
+    except ValueError:
+        return None
+
+
+def parse_retry_after(raw: Optional[str]) -> Optional[float]:
+    """Retry-After is either delta-seconds or an HTTP date. Returns seconds."""
+    if not raw:
+        return None
+    raw = raw.strip()
+    try:
+        return max(0.0, float(raw))
+    except ValueError:
+        pass
+    try:
+        when = parsedate_to_datetime(raw)
+    except (TypeError, ValueError):
+        return None
+    if when.tzinfo is None:
+        when = when.replace(tzinfo=timezone.utc)
+    return max(0.0, (when - datetime.now(timezone.utc)).total_seconds())
@@ -0,0 +1,130 @@
+from __future__ import annotations
+
+import hashlib
+import json
+import sqlite3
+import threading
+import time
+import zlib
+from dataclasses import dataclass
+from pathlib import Path
+from typing import Any, Dict, Optional
+
+
+@dataclass
+class CacheEntry:
+    body: bytes
+    etag: Optional[str]
+    fetched_at: float
+    fresh: bool
+
+
+def normalize_params(params: Optional[Dict[str, Any]]) -> Dict[str, Any]:
+    """
+    Canonical form of query parameters, so equivalent queries share a key:
+    location is case/whitespace-folded, sic_codes are sorted and de-duplicated,
+    empty values are dropped.
+    """
+    out: Dict[str, Any] = {}
+    for k, v in (params or {}).items():
+        if v is None or v == "":
+            continue
+        if k == "location":
+            v = " ".join(str(v).split()).casefold()
+        elif k == "sic_codes":
+            codes = v.split(",") if isinstance(v, str) else list(v)
+            v = ",".join(sorted({c.strip() for c in codes if c.strip()}))
+        out[k] = v if isinstance(v, (int, float)) else str(v)
+    return out
+
+
+def cache_key(url: str, params: Optional[Dict[str, Any]]) -> str:
+    raw = json.dumps([url, normalize_params(params)], sort_keys=True, separators=(",", ":"))
+    return hashlib.sha256(raw.encode("utf-8")).hexdigest()
+
+
+class ResponseCache:
+    """
+    On-disk cache of API response bodies (SQLite file, zlib-compressed).
+
+    Entries younger than ttl_seconds are served as-is; older ones are handed
+    back as stale so the caller can revalidate them with If-None-Match.
+    When the stored bytes exceed max_bytes the least recently used entries
+    are evicted.
+    """
+
+    def __init__(self, path: Path, ttl_seconds: float, max_bytes: int) -> None:
+        self.path = Path(path)
+        self.ttl_seconds = ttl_seconds
+        self.max_bytes = max_bytes
+        self.path.parent.mkdir(parents=True, exist_ok=True)
+        self._lock = threading.Lock()
+        self._db = sqlite3.connect(str(self.path), check_same_thread=False, isolation_level=None)
+        self._db.execute("PRAGMA journal_mode=WAL;")
+        self._db.execute(
+            """
+            CREATE TABLE IF NOT EXISTS responses (
+                cache_key   TEXT PRIMARY KEY,
+                body        BLOB NOT NULL,
+                etag        TEXT,
+                fetched_at  REAL NOT NULL,
+                last_access REAL NOT NULL,
+                size        INTEGER NOT NULL
+            );
+            """
+        )
+        self._db.execute("CREATE INDEX IF NOT EXISTS ix_responses_lru ON responses (last_access);")
+
+    def get(self, key: str) -> Optional[CacheEntry]:
+        now = time.time()
+        with self._lock:
+            row = self._db.execute(
+                "SELECT body, etag, fetched_at FROM responses WHERE cache_key = ?;", (key,)
+            ).fetchone()
+            if row is None:
+                return None
+            self._db.execute("UPDATE responses SET last_access = ? WHERE cache_key = ?;", (now, key))
+
+        body, etag, fetched_at = row
+        return CacheEntry(
+            body=zlib.decompress(body),
+            etag=etag,
+            fetched_at=fetched_at,
+            fresh=(now - fetched_at) < self.ttl_seconds,
+        )
+
+    def put(self, key: str, body: bytes, etag: Optional[str]) -> None:
+        packed = zlib.compress(body, 6)
+        now = time.time()
+        with self._lock:
+            self._db.execute(
+                """
+                INSERT OR REPLACE INTO responses (cache_key, body, etag, fetched_at, last_access, size)
+                VALUES (?, ?, ?, ?, ?, ?);
+                """,
+                (key, packed, etag, now, now, len(packed)),
+            )
+            self._evict()
+
+    def touch(self, key: str) -> None:
+        """Mark an entry fresh again after a 304 Not Modified."""
+        now = time.time()
+        with self._lock:
+            self._db.execute(
+                "UPDATE responses SET fetched_at = ?, last_access = ? WHERE cache_key = ?;",
+                (now, now, key),
+            )
+
+    def _evict(self) -> None:
+        total = self._db.execute("SELECT COALESCE(SUM(size), 0) FROM responses;").fetchone()[0]
+        if total <= self.max_bytes:
+            return
+
+        excess = total - self.max_bytes
+        victims = []
+        for key, size in self._db.execute("SELECT cache_key, size FROM responses ORDER BY last_access;"):
+            victims.append((key,))
+            excess -= size
+            if excess <= 0:
+                break
+        self._db.executemany("DELETE FROM responses WHERE cache_key = ?;", victims)
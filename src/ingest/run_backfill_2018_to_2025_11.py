@@ -1,9 +1,24 @@
 from __future__ import annotations
 import os
+import argparse
 from datetime import date
-from typing import Optional
-from src.db.connection import get_conn
-from src.ingest.ch_client import advanced_search_companies
+from typing import List, Optional
+from src.db.storage import get_storage
+from src.ingest.backfill_shards import SeenSet, existing_shard_runs, month_shards, run_shards
+from src.ingest.checkpoint import (
+    companies_written_in_run,
+    load_checkpoint,
+    reopen_run,
+    resume_position,
+    save_checkpoint,
+)
+from src.ingest.company_writer import write_changed
+from src.ingest.fingerprints import SKIP_UNCHANGED, load_fingerprints
+from src.ingest.enrich_profiles import enrich_companies
+from src.ingest.pipeline import prefetch
+from src.ingest.postcode_filter import PostcodeFilter, corridor_from_env
+from src.ingest.query_planner import iter_work_unit_pages, plan_work_units
+from src.validation.page_validation import quarantine_invalid
 
 LOCATIONS = [
     "Luton",
@@ -24,183 +39,251 @@ PAGE_SIZE = int(os.getenv("PAGE_SIZE", "200"))
 MAX_RECORDS = int(os.getenv("MAX_RECORDS", "200000"))
 COMMIT_EVERY = int(os.getenv("COMMIT_EVERY", "200"))
 
+# Fetch company profiles for every company touched by the run
+ENRICH_PROFILES = os.getenv("ENRICH_PROFILES", "0") == "1"
+
 BACKFILL_FROM = date(2018, 1, 1)
 BACKFILL_TO = date(2025, 11, 30)  # inclusive
 
+# 0: one serial job; N > 0: month x location shards on N workers (see --workers)
+BACKFILL_WORKERS = int(os.getenv("BACKFILL_WORKERS", "0"))
 
-def start_run(cur, note: str) -> int:
-    cur.execute(
-        """
-        INSERT INTO dbo.ingestion_log (records_inserted, source, status)
-        OUTPUT INSERTED.run_id
-        VALUES (?, ?, ?);
-        """,
-        0,
-        note,
-        "running",
-    )
-    row = cur.fetchone()
-    if row is None or row[0] is None:
-        raise RuntimeError("start_run(): could not retrieve run_id from ingestion_log insert")
-    return int(row[0])
-
-
-def finish_run(cur, run_id: int, status: str, records_inserted: int) -> None:
-    cur.execute(
-        """
-        UPDATE dbo.ingestion_log
-        SET status = ?, records_inserted = ?
-        WHERE run_id = ?;
-        """,
-        status,
-        records_inserted,
-        run_id,
-    )
+# 'location' (default) or 'region'; see run_monthly_incremental.FETCH_STRATEGY
+FETCH_STRATEGY = os.getenv("FETCH_STRATEGY", "location").strip().lower()
 
 
-def upsert_company(cur, it: dict, run_id: int) -> None:
-    number = it.get("company_number")
-    name = it.get("company_name") or it.get("title")
-    status = it.get("company_status")
-    inc_date = it.get("date_of_creation")
-    ctype = it.get("company_type")
-
-    cur.execute(
-        """
-        MERGE dbo.companies AS tgt
-        USING (SELECT ? AS company_number) AS src
-        ON tgt.company_number = src.company_number
-        WHEN MATCHED THEN
-            UPDATE SET
-                company_name = ?,
-                company_status = ?,
-                incorporation_date = ?,
-                company_type = ?,
-                last_seen_run_id = ?,
-                last_seen_at = SYSUTCDATETIME()
-        WHEN NOT MATCHED THEN
-            INSERT (
-                company_number, company_name, company_status, incorporation_date, company_type,
-                first_seen_run_id, last_seen_run_id, last_seen_at
-            )
-            VALUES (?, ?, ?, ?, ?, ?, ?, SYSUTCDATETIME());
-        """,
-        number, name, status, inc_date, ctype, run_id,
-        number, name, status, inc_date, ctype, run_id, run_id,
+def parse_args(argv: Optional[List[str]] = None) -> argparse.Namespace:
+    parser = argparse.ArgumentParser(description="Companies House backfill")
+    parser.add_argument(
+        "--resume",
+        type=int,
+        metavar="RUN_ID",
+        help="continue an interrupted run from its last durable checkpoint",
     )
+    parser.add_argument(
+        "--workers",
+        type=int,
+        default=BACKFILL_WORKERS,
+        metavar="N",
+        help="split the range into month x location shards and run them on N workers "
+             "(with --resume, RUN_ID is the sharded parent run)",
+    )
+    return parser.parse_args(argv)
 
 
-def replace_address(cur, number: str, it: dict) -> None:
-    addr = it.get("registered_office_address") or {}
-
-    cur.execute("DELETE FROM dbo.company_addresses WHERE company_number = ?;", number)
-    cur.execute(
-        """
-        INSERT INTO dbo.company_addresses (company_number, locality, region, postal_code, country)
-        VALUES (?, ?, ?, ?, ?);
-        """,
-        number,
-        addr.get("locality"),
-        addr.get("region"),
-        addr.get("postal_code"),
-        addr.get("country"),
+def main_sharded(args: argparse.Namespace, corridor: Optional[PostcodeFilter]) -> None:
+    """
+    Month x location shards on a worker pool. Each shard is its own child
+    run (parent_run_id = this run) with its own checkpoint, and is retried
+    on its own when it fails. MAX_RECORDS does not apply here.
+    """
+    geography = f"postcodes={corridor.describe()}" if corridor else f"locations={len(LOCATIONS)}"
+    note = (
+        f"BACKFILL SHARDED {BACKFILL_FROM}..{BACKFILL_TO} "
+        f"{geography} sic={','.join(SIC_CODES)} workers={args.workers}"
     )
+    shards = month_shards(BACKFILL_FROM, BACKFILL_TO, [None] if corridor else LOCATIONS)
 
+    storage = get_storage()
+    with storage.connection() as conn:
+        cur = conn.cursor()
+        fingerprints = load_fingerprints(storage, cur) if SKIP_UNCHANGED else None
+
+        resume_runs = {}
+        seen = SeenSet()
+        if args.resume is not None:
+            parent_run_id = args.resume
+            reopen_run(storage, cur, parent_run_id)
+            resume_runs = existing_shard_runs(storage, cur, parent_run_id)
+            seen = SeenSet(
+                number
+                for child_run_id, _ in resume_runs.values()
+                for number in companies_written_in_run(storage, cur, child_run_id)
+            )
+            print(f"Resuming sharded run_id={parent_run_id} ({len(seen)} companies already committed)")
+        else:
+            parent_run_id = storage.start_run(cur, note=note)
+        conn.commit()
 
-def replace_sic(cur, number: str, sic_list: list[str], existing_sic: set[str]) -> None:
-    cur.execute("DELETE FROM dbo.company_sic WHERE company_number = ?;", number)
-    for sic in sorted(set(sic_list or [])):  # dedupe
-        if sic not in existing_sic:
-            continue
-        cur.execute(
-            "INSERT INTO dbo.company_sic (company_number, sic_code) VALUES (?, ?);",
-            number,
-            sic,
+    try:
+        results = run_shards(
+            storage,
+            shards,
+            workers=args.workers,
+            parent_run_id=parent_run_id,
+            resume_runs=resume_runs,
+            sic_codes=SIC_CODES,
+            page_size=PAGE_SIZE,
+            commit_every=COMMIT_EVERY,
+            seen=seen,
+            fingerprints=fingerprints,
+            corridor=corridor,
         )
+    except BaseException:
+        with storage.connection() as conn:
+            storage.finish_run(conn.cursor(), parent_run_id, "failure", 0)
+        raise
 
+    failed = [r for r in results if r.status != "success"]
+    with storage.connection() as conn:
+        cur = conn.cursor()
+        if ENRICH_PROFILES and not failed:
+            enrich_companies(storage, conn, seen.snapshot())
+
+        latest = {}
+        for _, source, _, records in storage.child_runs(cur, parent_run_id):
+            latest[source] = records
+        inserted_total = sum(latest.values())
+        storage.finish_run(cur, parent_run_id, "failure" if failed else "success", inserted_total)
+
+    print(
+        f"\nSHARDED BACKFILL {'FAILED' if failed else 'DONE'}. run_id={parent_run_id} "
+        f"inserted/updated={inserted_total} shards_run={len(results)} failed={len(failed)} "
+        f"unchanged={sum(r.unchanged for r in results)} "
+        f"cross_location_duplicates={sum(r.duplicates for r in results)} "
+        f"outside_corridor={sum(r.outside for r in results)} "
+        f"quarantined={sum(r.quarantined for r in results)}"
+    )
+    for r in failed:
+        print(f"  failed shard {r.shard.key} run_id={r.run_id} after {r.attempts} attempts: {r.error}")
+    if failed:
+        raise RuntimeError(
+            f"{len(failed)} shard(s) failed; rerun with --workers {args.workers} --resume {parent_run_id}"
+        )
 
-def main() -> None:
+
+def main(argv: Optional[List[str]] = None) -> None:
+    args = parse_args(argv)
+    corridor = corridor_from_env() if FETCH_STRATEGY == "region" else None
+    if args.workers > 0:
+        main_sharded(args, corridor)
+        return
+
+    geography = f"postcodes={corridor.describe()}" if corridor else f"locations={len(LOCATIONS)}"
     note = (
         f"BACKFILL {BACKFILL_FROM}..{BACKFILL_TO} "
-        f"locations={len(LOCATIONS)} sic={','.join(SIC_CODES)} cap={MAX_RECORDS}"
+        f"{geography} sic={','.join(SIC_CODES)} cap={MAX_RECORDS}"
     )
 
     inserted_total = 0
     scanned_total = 0
-
-    with get_conn() as conn:
+    duplicates_total = 0
+    unchanged_total = 0
+    outside_total = 0
+    quarantined_total = 0
+    # Company numbers already written this run; locations overlap heavily
+    seen: set[str] = set()
+
+    storage = get_storage()
+    with storage.connection() as conn:
         cur = conn.cursor()
-        cur.execute("SELECT sic_code FROM dbo.sic_codes;")
-        existing_sic = {row[0] for row in cur.fetchall()}
-
-        run_id = start_run(cur, note=note)
+        fingerprints = load_fingerprints(storage, cur) if SKIP_UNCHANGED else None
+
+        checkpoint = None
+        if args.resume is not None:
+            run_id = args.resume
+            reopen_run(storage, cur, run_id)
+            checkpoint = load_checkpoint(storage, cur, run_id)
+            seen = companies_written_in_run(storage, cur, run_id)
+            inserted_total = len(seen)
+            print(f"Resuming run_id={run_id} from {checkpoint} ({inserted_total} companies already committed)")
+        else:
+            run_id = storage.start_run(cur, note=note)
         conn.commit()
 
         try:
-            for loc in LOCATIONS:
-                if inserted_total >= MAX_RECORDS:
-                    break
-
-                print(f"\n=== Backfill location: {loc} ===")
-                start_index = 0
-
-                while inserted_total < MAX_RECORDS:
-                    data = advanced_search_companies(
-                        location=loc,
-                        sic_codes=SIC_CODES,
-                        start_index=start_index,
-                        size=PAGE_SIZE,
-                        company_status="active",
-                        incorporated_from=str(BACKFILL_FROM),
-                        incorporated_to=str(BACKFILL_TO),
-                    )
+            # Split each location's window until every piece fits under the
+            # advanced-search result cap, then page the pieces concurrently.
+            units = plan_work_units(
+                locations=[None] if corridor else LOCATIONS,
+                sic_codes=SIC_CODES,
+                incorporated_from=BACKFILL_FROM,
+                incorporated_to=BACKFILL_TO,
+                company_status="active",
+            )
+
+            first_unit, first_start_index = resume_position([u.key for u in units], checkpoint)
+            current_unit = None
+            uncommitted = 0
+
+            unit_pages = iter_work_unit_pages(
+                units[first_unit:],
+                sic_codes=SIC_CODES,
+                size=PAGE_SIZE,
+                company_status="active",
+                first_start_index=first_start_index,
+            )
+            # Pages are fetched on a background thread while this one writes;
+            # leaving the loop early (MAX_RECORDS) stops the fetcher.
+            with prefetch(unit_pages) as pages:
+                for unit, start_index, data in pages:
+                    if inserted_total >= MAX_RECORDS:
+                        break
+
+                    if unit != current_unit:
+                        print(
+                            f"\n=== Backfill location: {unit.location or 'all (postcode filtered)'} "
+                            f"{unit.incorporated_from}..{unit.incorporated_to} (hits={unit.hits}) ==="
+                        )
+                        current_unit = unit
 
                     items = data.get("items", []) or []
                     hits = data.get("hits")
                     print(f"Fetched page start_index={start_index} | items={len(items)} | hits={hits}")
 
-                    if not items:
-                        break
-
-                    last_page = len(items) < PAGE_SIZE
+                    if corridor is not None:
+                        kept = corridor.filter_items(items)
+                        outside_total += len(items) - len(kept)
+                        items = kept
 
+                    batch = []
                     for it in items:
                         scanned_total += 1
-                        if inserted_total >= MAX_RECORDS:
+                        if inserted_total + len(batch) >= MAX_RECORDS:
                             break
 
                         number = it.get("company_number")
                         if not number:
                             continue
+                        if number in seen:
+                            duplicates_total += 1
+                            continue
 
-                        if inserted_total == 0:
-                            print("Starting first insert...")
+                        seen.add(number)
+                        batch.append(it)
 
-                        upsert_company(cur, it, run_id=run_id)
-                        replace_address(cur, number, it)
-                        replace_sic(cur, number, it.get("sic_codes", []) or [], existing_sic)
+                    # Malformed items go to quarantined_items instead of the writer
+                    batch, quarantined = quarantine_invalid(storage, cur, batch, run_id)
+                    quarantined_total += quarantined
 
-                        inserted_total += 1
+                    # One set-based write per page
+                    written, unchanged = write_changed(storage, cur, batch, run_id, fingerprints)
+                    unchanged_total += unchanged
+                    inserted_total += written + unchanged
+                    uncommitted += written + unchanged
 
-                        if inserted_total % COMMIT_EVERY == 0:
-                            conn.commit()
-                            print(f"Committed {inserted_total} records so far")
+                    if uncommitted >= COMMIT_EVERY:
+                        save_checkpoint(storage, cur, run_id, unit.key, start_index + PAGE_SIZE, inserted_total)
+                        conn.commit()
+                        uncommitted = 0
+                        print(f"Committed {inserted_total} records so far")
 
-                    if last_page:
-                        break
-                    if isinstance(hits, int) and (start_index + len(items) >= hits):
-                        break
-
-                    start_index += PAGE_SIZE
+            if ENRICH_PROFILES:
+                conn.commit()
+                enrich_companies(storage, conn, seen)
 
-            finish_run(cur, run_id, status="success", records_inserted=inserted_total)
+            storage.finish_run(cur, run_id, status="success", records_inserted=inserted_total)
             conn.commit()
-            print(f"\nBACKFILL DONE. run_id={run_id} inserted/updated={inserted_total} scanned={scanned_total}")
+            print(
+                f"\nBACKFILL DONE. run_id={run_id} inserted/updated={inserted_total} "
+                f"unchanged={unchanged_total} scanned={scanned_total} cross_location_duplicates={duplicates_total} "
+                f"outside_corridor={outside_total} quarantined={quarantined_total}"
+            )
 
-        except Exception:
+        except BaseException:
             conn.rollback()
             cur = conn.cursor()
-            finish_run(cur, run_id, status="failure", records_inserted=inserted_total)
+            storage.finish_run(cur, run_id, status="failure", records_inserted=inserted_total)
             conn.commit()
             raise
 
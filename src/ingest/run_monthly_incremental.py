@@ -1,13 +1,32 @@
 from __future__ import annotations
 
 import os
-import csv
+import argparse
 from datetime import date
-from typing import Tuple, Optional
+from typing import Iterator, Tuple, Optional
 from pathlib import Path
 
-from src.db.connection import get_conn
-from src.ingest.ch_client import advanced_search_companies
+from src.analytics.csv_export import CsvExport, write_cursor_csv
+from src.db.storage import Storage, get_storage
+from src.ingest.ch_client import iter_location_pages
+from src.ingest.checkpoint import (
+    Checkpoint,
+    companies_written_in_run,
+    load_checkpoint,
+    reopen_run,
+    resume_position,
+    save_checkpoint,
+)
+from src.ingest.company_writer import write_changed
+from src.ingest.fingerprints import SKIP_UNCHANGED, load_fingerprints
+from src.ingest.enrich_profiles import enrich_companies
+from src.ingest.pipeline import prefetch
+from src.ingest.postcode_filter import corridor_from_env
+from src.ingest.postcode_geo import geocode_addresses
+from src.ingest.query_planner import iter_work_unit_pages, plan_work_units
+from src.ingest.sic_reference import expand_sic_filters
+from src.notifications.outbox import deliver_in_background, enqueue_email
+from src.validation.page_validation import quarantine_invalid
 
 # Geography (Luton -> MK corridor)
 LOCATIONS = [
@@ -22,12 +41,26 @@ LOCATIONS = [
     "Milton Keynes",
 ]
 
+# 'location': one free-text query per LOCATIONS entry (default)
+# 'region': nationwide queries by SIC/date window, filtered locally on
+#           CORRIDOR_POSTCODES (postcode areas/districts) or CORRIDOR_RADIUS
+FETCH_STRATEGY = os.getenv("FETCH_STRATEGY", "location").strip().lower()
+
 # Default SICs 
 DEFAULT_SIC_CODES = ["62020", "62012"]
 
 PAGE_SIZE = int(os.getenv("PAGE_SIZE", "200"))
 COMMIT_EVERY = int(os.getenv("COMMIT_EVERY", "200"))
 
+# Fetch company profiles for every company touched by the run
+ENRICH_PROFILES = os.getenv("ENRICH_PROFILES", "0") == "1"
+
+# Set lat/long on new addresses from the postcode centroid index (POSTCODE_CENTROIDS)
+GEOCODE_ADDRESSES = os.getenv("GEOCODE_ADDRESSES", "0") == "1"
+
+# Email the export (queued in email_outbox, see src/notifications/outbox.py)
+SEND_EMAIL = os.getenv("SEND_EMAIL", "0") == "1"
+
 # set TARGET_MONTH=YYYY-MM. If blank, defaults to previous month.
 TARGET_MONTH_ENV = os.getenv("TARGET_MONTH", "").strip()
 
@@ -64,230 +97,215 @@ def month_range(yyyy_mm: str) -> Tuple[date, date]:
     return start, end
 
 
-def parse_sic_codes() -> list[str]:
+def sic_filters() -> list[str]:
+    """SIC_CODES as written: codes, prefixes (62*) or sections (J)."""
     raw = os.getenv("SIC_CODES", "").strip()
     if not raw:
         return DEFAULT_SIC_CODES
     return [x.strip() for x in raw.split(",") if x.strip()]
 
 
-def start_run(cur, note: str) -> int:
-    cur.execute(
-        """
-        INSERT INTO dbo.ingestion_log (records_inserted, source, status)
-        OUTPUT INSERTED.run_id
-        VALUES (?, ?, ?);
-        """,
-        0,
-        note,
-        "running",
-    )
-    row = cur.fetchone()
-    if row is None or row[0] is None:
-        raise RuntimeError("Could not retrieve run_id from ingestion_log insert")
-    return int(row[0])
-
-
-def finish_run(cur, run_id: int, status: str, records_inserted: int) -> None:
-    cur.execute(
-        """
-        UPDATE dbo.ingestion_log
-        SET status = ?, records_inserted = ?
-        WHERE run_id = ?;
-        """,
-        status,
-        records_inserted,
-        run_id,
-    )
-
-
-def upsert_company(cur, it: dict, run_id: int) -> None:
-    cur.execute(
-        """
-        MERGE dbo.companies AS tgt
-        USING (SELECT ? AS company_number) AS src
-        ON tgt.company_number = src.company_number
-        WHEN MATCHED THEN
-            UPDATE SET
-                company_name = ?,
-                company_status = ?,
-                incorporation_date = ?,
-                company_type = ?,
-                last_seen_run_id = ?,
-                last_seen_at = SYSUTCDATETIME()
-        WHEN NOT MATCHED THEN
-            INSERT (
-                company_number, company_name, company_status,
-                incorporation_date, company_type,
-                first_seen_run_id, last_seen_run_id, last_seen_at
-            )
-            VALUES (?, ?, ?, ?, ?, ?, ?, SYSUTCDATETIME());
-        """,
-        it.get("company_number"),
-        it.get("company_name") or it.get("title"),
-        it.get("company_status"),
-        it.get("date_of_creation"),
-        it.get("company_type"),
-        run_id,
-        it.get("company_number"),
-        it.get("company_name") or it.get("title"),
-        it.get("company_status"),
-        it.get("date_of_creation"),
-        it.get("company_type"),
-        run_id,
-        run_id,
-    )
-
-
-def replace_address(cur, company_number: str, it: dict) -> None:
-    addr = it.get("registered_office_address") or {}
-    cur.execute("DELETE FROM dbo.company_addresses WHERE company_number = ?;", company_number)
-    cur.execute(
-        """
-        INSERT INTO dbo.company_addresses
-        (company_number, locality, region, postal_code, country)
-        VALUES (?, ?, ?, ?, ?);
-        """,
-        company_number,
-        addr.get("locality"),
-        addr.get("region"),
-        addr.get("postal_code"),
-        addr.get("country"),
-    )
-
-
-def replace_sic(cur, company_number: str, sic_list: list[str], existing_sic: set[str]) -> None:
-    cur.execute("DELETE FROM dbo.company_sic WHERE company_number = ?;", company_number)
-    for sic in sorted(set(sic_list or [])):
-        if sic in existing_sic:
-            cur.execute(
-                "INSERT INTO dbo.company_sic (company_number, sic_code) VALUES (?, ?);",
-                company_number,
-                sic,
-            )
+def parse_sic_codes() -> list[str]:
+    """SIC_CODES as concrete codes; entries may also be prefixes (62*) or sections (J)."""
+    return expand_sic_filters(sic_filters())
 
 
-def export_new_companies_csv(conn, run_id: int, out_path: str) -> int:
+def export_new_companies_csv(storage: Storage, conn, run_id: int, out_path: Path) -> CsvExport:
+    """Companies first seen in run_id, streamed to CSV (see csv_export.write_cursor_csv)."""
     cur = conn.cursor()
-    cur.execute(
-        """
-        SELECT
-            c.company_number,
-            c.company_name,
-            c.company_status,
-            c.incorporation_date,
-            a.locality,
-            a.region,
-            a.postal_code,
-            a.country
-        FROM dbo.companies c
-        LEFT JOIN dbo.company_addresses a
-            ON a.company_number = c.company_number
-        WHERE c.first_seen_run_id = ?
-        ORDER BY c.incorporation_date DESC;
-        """,
-        run_id,
+    storage.select_new_companies(cur, run_id)
+    return write_cursor_csv(cur, out_path)
+
+
+def iter_month_pages(
+    sic_codes: list[str],
+    start_date: date,
+    end_date: date,
+    checkpoint: Optional[Checkpoint] = None,
+) -> Iterator[Tuple[str, int, dict]]:
+    """
+    (cursor_key, start_index, page) for the month, fetched according to
+    FETCH_STRATEGY. With a checkpoint, pages before its cursor are skipped.
+    """
+    if FETCH_STRATEGY == "region":
+        units = plan_work_units(
+            locations=[None],
+            sic_codes=sic_codes,
+            incorporated_from=start_date,
+            incorporated_to=end_date,
+            company_status="active",
+        )
+        first, first_start_index = resume_position([u.key for u in units], checkpoint)
+        for unit, start_index, data in iter_work_unit_pages(
+            units[first:],
+            sic_codes=sic_codes,
+            size=PAGE_SIZE,
+            company_status="active",
+            first_start_index=first_start_index,
+        ):
+            yield unit.key, start_index, data
+        return
+
+    first, first_start_index = resume_position(LOCATIONS, checkpoint)
+    locations = LOCATIONS[first:]
+
+    # Pages for all locations are fetched concurrently and arrive in
+    # (location, start_index) order.
+    for loc, start_index, data in iter_location_pages(
+        locations=locations,
+        sic_codes=sic_codes,
+        size=PAGE_SIZE,
+        company_status="active",
+        incorporated_from=str(start_date),
+        incorporated_to=str(end_date),
+    ):
+        if loc == locations[0] and start_index < first_start_index:
+            continue
+        yield loc, start_index, data
+
+
+def parse_args(argv: Optional[list[str]] = None) -> argparse.Namespace:
+    parser = argparse.ArgumentParser(description="Monthly incremental Companies House ingest")
+    parser.add_argument(
+        "--resume",
+        type=int,
+        metavar="RUN_ID",
+        help="continue an interrupted run from its last durable checkpoint",
     )
+    return parser.parse_args(argv)
 
-    rows = cur.fetchall()
-    cols = [d[0] for d in cur.description]
 
-    out_dir = Path(out_path).parent
-    out_dir.mkdir(parents=True, exist_ok=True)
-
-    with open(out_path, "w", newline="", encoding="utf-8") as f:
-        w = csv.writer(f)
-        w.writerow(cols)
-        w.writerows(rows)
-
-    return len(rows)
-
-
-def main() -> None:
+def main(argv: Optional[list[str]] = None) -> int:
+    """Run the monthly ingest and return its run_id."""
+    args = parse_args(argv)
     sic_codes = parse_sic_codes()
     target_month = normalize_target_month(TARGET_MONTH_ENV)
     start_date, end_date = month_range(target_month)
 
-    note = f"INCREMENTAL {target_month} | locations={len(LOCATIONS)} | sic={','.join(sic_codes)}"
+    corridor = corridor_from_env() if FETCH_STRATEGY == "region" else None
+    geography = f"postcodes={corridor.describe()}" if corridor else f"locations={len(LOCATIONS)}"
+    # The filters as given, not their expansion: a section (J) is dozens of codes
+    note = f"INCREMENTAL {target_month} | {geography} | sic={','.join(sic_filters())}"
 
     inserted_total = 0
     scanned_total = 0
-
-    with get_conn() as conn:
+    duplicates_total = 0
+    unchanged_total = 0
+    outside_total = 0
+    quarantined_total = 0
+    queued = 0
+    # Company numbers already written this run; locations overlap heavily
+    seen: set[str] = set()
+
+    storage = get_storage()
+    with storage.connection() as conn:
         cur = conn.cursor()
-        cur.execute("SELECT sic_code FROM dbo.sic_codes;")
-        existing_sic = {r[0] for r in cur.fetchall()}
-
-        run_id = start_run(cur, note)
+        fingerprints = load_fingerprints(storage, cur) if SKIP_UNCHANGED else None
+
+        checkpoint = None
+        if args.resume is not None:
+            run_id = args.resume
+            source = reopen_run(storage, cur, run_id)
+            if not source.startswith(f"INCREMENTAL {target_month} "):
+                raise RuntimeError(
+                    f"Cannot resume run_id {run_id} ({source!r}) with TARGET_MONTH={target_month}"
+                )
+            checkpoint = load_checkpoint(storage, cur, run_id)
+            seen = companies_written_in_run(storage, cur, run_id)
+            inserted_total = len(seen)
+            print(f"Resuming run_id={run_id} from {checkpoint} ({inserted_total} companies already committed)")
+        else:
+            run_id = storage.start_run(cur, note)
         conn.commit()
 
         try:
-            for loc in LOCATIONS:
-                start_index = 0
-
-                while True:
-                    data = advanced_search_companies(
-                        location=loc,
-                        sic_codes=sic_codes,
-                        start_index=start_index,
-                        size=PAGE_SIZE,
-                        company_status="active",
-                        incorporated_from=str(start_date),
-                        incorporated_to=str(end_date),
-                    )
+            uncommitted = 0
 
+            # Pages are fetched on a background thread while this one writes
+            with prefetch(iter_month_pages(sic_codes, start_date, end_date, checkpoint)) as pages:
+                for cursor_key, start_index, data in pages:
                     items = data.get("items") or []
-                    if not items:
-                        break
+                    if corridor is not None:
+                        kept = corridor.filter_items(items)
+                        outside_total += len(items) - len(kept)
+                        items = kept
 
+                    batch = []
                     for it in items:
                         scanned_total += 1
                         if not it.get("company_number"):
                             continue
+                        if it["company_number"] in seen:
+                            duplicates_total += 1
+                            continue
 
-                        upsert_company(cur, it, run_id)
-                        replace_address(cur, it["company_number"], it)
-                        replace_sic(cur, it["company_number"], it.get("sic_codes", []), existing_sic)
+                        seen.add(it["company_number"])
+                        batch.append(it)
 
-                        inserted_total += 1
-                        if inserted_total % COMMIT_EVERY == 0:
-                            conn.commit()
+                    # Malformed items go to quarantined_items instead of the writer
+                    batch, quarantined = quarantine_invalid(storage, cur, batch, run_id)
+                    quarantined_total += quarantined
 
-                    if len(items) < PAGE_SIZE:
-                        break
+                    # One set-based write per page
+                    written, unchanged = write_changed(storage, cur, batch, run_id, fingerprints)
+                    unchanged_total += unchanged
+                    inserted_total += written + unchanged
+                    uncommitted += written + unchanged
 
-                    start_index += PAGE_SIZE
+                    if uncommitted >= COMMIT_EVERY:
+                        save_checkpoint(storage, cur, run_id, cursor_key, start_index + PAGE_SIZE, inserted_total)
+                        conn.commit()
+                        uncommitted = 0
 
-            out_path = str(REPO_ROOT / "data" / "exports" / f"new_companies_{target_month}_run_{run_id}.csv")
-            conn.commit()
-            new_count = export_new_companies_csv(conn, run_id, out_path)
+            if ENRICH_PROFILES:
+                conn.commit()
+                enrich_companies(storage, conn, seen)
 
-            finish_run(cur, run_id, "success", inserted_total)
-            conn.commit()
-
-            print(f"Run {run_id} complete | scanned={scanned_total} | inserted/updated={inserted_total} | rows_in_csv={new_count}")
+            if GEOCODE_ADDRESSES:
+                conn.commit()
+                located, unknown = geocode_addresses(storage, conn)
+                print(f"Geocoded addresses: {located} (postcode not in index: {unknown})")
 
-            # send email with attachment
-            if os.getenv("SEND_EMAIL", "0") == "1":
-                from src.notifications.send_email import send_csv_email
+            out_path = REPO_ROOT / "data" / "exports" / f"new_companies_{target_month}_run_{run_id}.csv"
+            conn.commit()
+            export = export_new_companies_csv(storage, conn, run_id, out_path)
 
-                send_csv_email(
-                    csv_path=out_path,
+            # Queued in the run's transaction; delivered once the connection is released
+            if SEND_EMAIL:
+                queued = enqueue_email(
+                    storage,
+                    cur,
                     subject=f"New UK Companies – Luton to Milton Keynes ({target_month})",
                     body=(
                         f"Attached is last month's newly incorporated companies list for the Luton–Milton Keynes area.\n\n"
                         f"Month: {target_month}\n"
-                        f"New companies in CSV: {new_count}\n"
+                        f"New companies in CSV: {export.rows}\n"
                     ),
+                    attachment_path=export.path,
+                    run_id=run_id,
                 )
-                print("Email sent.")
 
-        except Exception:
+            storage.finish_run(cur, run_id, "success", inserted_total)
+            conn.commit()
+
+            print(
+                f"Run {run_id} complete | scanned={scanned_total} | inserted/updated={inserted_total} "
+                f"(unchanged={unchanged_total}) "
+                f"| cross_location_duplicates={duplicates_total} | outside_corridor={outside_total} "
+                f"| quarantined={quarantined_total} | rows_in_csv={export.rows}"
+            )
+
+        except BaseException:
             conn.rollback()
-            finish_run(cur, run_id, "failure", inserted_total)
+            storage.finish_run(cur, run_id, "failure", inserted_total)
             conn.commit()
             raise
 
+    if queued:
+        print(f"Email queued for {queued} recipient(s); delivering in the background.")
+        deliver_in_background(storage)
+    return run_id
+
 
 if __name__ == "__main__":
     main()
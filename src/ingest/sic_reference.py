@@ -0,0 +1,247 @@
+from __future__ import annotations
+
+import os
+import re
+import sys
+import csv
+from dataclasses import dataclass
+from pathlib import Path
+from typing import Dict, Iterable, List, Optional, Tuple
+
+from src.db.storage import get_storage
+
+# SIC 2007 reference (the Companies House condensed list or any code/description
+# CSV, see parse_sic_file). Used to expand filters such as 62* or J.
+REPO_ROOT = Path(__file__).resolve().parents[2]
+SIC_REFERENCE = Path(os.getenv("SIC_REFERENCE", str(REPO_ROOT / "sic_codes.txt")))
+
+# SIC 2007 sections and the divisions they span
+SECTIONS: Dict[str, Tuple[int, int]] = {
+    "A": (1, 3), "B": (5, 9), "C": (10, 33), "D": (35, 35), "E": (36, 39),
+    "F": (41, 43), "G": (45, 47), "H": (49, 53), "I": (55, 56), "J": (58, 63),
+    "K": (64, 66), "L": (68, 68), "M": (69, 75), "N": (77, 82), "O": (84, 84),
+    "P": (85, 85), "Q": (86, 88), "R": (90, 93), "S": (94, 96), "T": (97, 98),
+    "U": (99, 99),
+}
+
+LEVELS = {1: "section", 2: "division", 3: "group", 4: "class", 5: "subclass"}
+
+_PUNCTUATION = re.compile(r"[^0-9A-Za-z]")
+
+
+def section_of(code: str) -> Optional[str]:
+    if code[:1].isalpha():
+        return code[:1].upper()
+    if len(code) < 2 or not code[:2].isdigit():
+        return None
+    division = int(code[:2])
+    for letter, (lo, hi) in SECTIONS.items():
+        if lo <= division <= hi:
+            return letter
+    return None
+
+
+def normalize_code(raw: str) -> str:
+    """'62.02' -> '6202', '62.01/1' -> '62011', ' j ' -> 'J'."""
+    return _PUNCTUATION.sub("", raw or "").upper()
+
+
+@dataclass(frozen=True)
+class SicEntry:
+    code: str
+    description: Optional[str]
+
+    @property
+    def level(self) -> str:
+        return LEVELS[len(self.code)]
+
+    @property
+    def parent(self) -> Optional[str]:
+        if len(self.code) == 1:
+            return None
+        if len(self.code) == 2:
+            return section_of(self.code)
+        return self.code[:-1]
+
+    @property
+    def section(self) -> Optional[str]:
+        return section_of(self.code)
+
+
+def _valid(code: str) -> bool:
+    if len(code) == 1:
+        return code in SECTIONS
+    return 2 <= len(code) <= 5 and code.isdigit() and section_of(code) is not None
+
+
+def parse_sic_file(path: Path) -> List[SicEntry]:
+    """
+    Read `code,description` rows (comma or tab separated, optional header).
+    Codes may be at any level -- section letter, 2-5 digits, with or
+    without ONS punctuation ('62.02/1'). Ancestors missing from the file
+    (e.g. divisions when only the five-digit condensed list is given) are
+    added without a description, so the hierarchy is always complete.
+    """
+    text = path.read_text(encoding="utf-8-sig")
+    delimiter = "\t" if "\t" in text.split("\n", 1)[0] else ","
+
+    entries: Dict[str, SicEntry] = {}
+    for row in csv.reader(text.splitlines(), delimiter=delimiter):
+        if not row or not row[0].strip():
+            continue
+        code = normalize_code(row[0])
+        if not _valid(code):
+            continue  # header or note line
+        description = row[1].strip() if len(row) > 1 and row[1].strip() else None
+        entries[code] = SicEntry(code, description)
+
+    for code in list(entries):
+        parent = entries[code].parent
+        while parent and parent not in entries:
+            entries[parent] = SicEntry(parent, None)
+            parent = entries[parent].parent
+
+    return sorted(entries.values(), key=lambda e: (len(e.code) > 1, e.code))
+
+
+class _Node:
+    __slots__ = ("children", "terminal")
+
+    def __init__(self) -> None:
+        self.children: Dict[str, _Node] = {}
+        self.terminal = False
+
+
+def filter_prefixes(patterns: Iterable[str]) -> List[str]:
+    """
+    Digit prefixes for filter patterns: '62*' or '62' -> ['62'],
+    '62020' -> ['62020'], section 'J' -> ['58', ..., '63'].
+    """
+    prefixes: set[str] = set()
+    for raw in patterns:
+        p = raw.strip().rstrip("*").strip()
+        if not p:
+            continue
+        p = normalize_code(p)
+        if len(p) == 1 and p in SECTIONS:
+            lo, hi = SECTIONS[p]
+            prefixes.update(f"{d:02d}" for d in range(lo, hi + 1))
+        elif p.isdigit() and len(p) <= 5:
+            prefixes.add(p)
+        else:
+            raise ValueError(f"Bad SIC filter {raw!r} (expected a code, a prefix like 62*, or a section letter)")
+    return sorted(prefixes)
+
+
+class SicPrefixIndex:
+    """
+    Character trie over SIC codes. Built from filter patterns it answers
+    "is this code watched?" in O(len(code)); built from the reference list
+    it expands a prefix into the concrete five-digit codes beneath it.
+    """
+
+    def __init__(self, codes: Iterable[str] = ()) -> None:
+        self._root = _Node()
+        for code in codes:
+            self.add(code)
+
+    @classmethod
+    def from_patterns(cls, patterns: Iterable[str]) -> "SicPrefixIndex":
+        return cls(filter_prefixes(patterns))
+
+    def add(self, code: str) -> None:
+        node = self._root
+        for ch in code:
+            node = node.children.setdefault(ch, _Node())
+        node.terminal = True
+
+    def matches(self, code: str) -> bool:
+        """True if some indexed code is a prefix of (or equal to) code."""
+        node = self._root
+        for ch in code:
+            node = node.children.get(ch)
+            if node is None:
+                return False
+            if node.terminal:
+                return True
+        return False
+
+    def under(self, prefix: str, length: int = 5) -> List[str]:
+        """Indexed codes of the given length that start with prefix."""
+        node = self._root
+        for ch in prefix:
+            node = node.children.get(ch)
+            if node is None:
+                return []
+        out: List[str] = []
+        stack = [(node, prefix)]
+        while stack:
+            node, code = stack.pop()
+            if node.terminal and len(code) == length:
+                out.append(code)
+            for ch, child in node.children.items():
+                if len(code) < length:
+                    stack.append((child, code + ch))
+        return sorted(out)
+
+
+_REFERENCE_INDEX: Optional[SicPrefixIndex] = None
+
+
+def reference_index(path: Path = SIC_REFERENCE) -> SicPrefixIndex:
+    global _REFERENCE_INDEX
+    if _REFERENCE_INDEX is None:
+        entries = parse_sic_file(path) if path.exists() else []
+        _REFERENCE_INDEX = SicPrefixIndex(e.code for e in entries if len(e.code) == 5)
+    return _REFERENCE_INDEX
+
+
+def expand_sic_filters(patterns: List[str]) -> List[str]:
+    """
+    Concrete five-digit codes for SIC_CODES-style filters. Exact codes pass
+    through as they are; prefixes and sections are expanded from the
+    SIC_REFERENCE file.
+    """
+    exact = [p.strip() for p in patterns if re.fullmatch(r"\d{5}", p.strip())]
+    wide = [p for p in patterns if p.strip() and not re.fullmatch(r"\d{5}", p.strip())]
+    if not wide:
+        return list(dict.fromkeys(exact))
+
+    index = reference_index()
+    codes = list(exact)
+    for pattern in wide:
+        found = [code for prefix in filter_prefixes([pattern]) for code in index.under(prefix)]
+        if not found:
+            raise RuntimeError(
+                f"SIC filter {pattern!r} matched nothing in {SIC_REFERENCE}; load the SIC 2007 list there first"
+            )
+        codes.extend(found)
+    return list(dict.fromkeys(codes))
+
+
+def main(argv: Optional[List[str]] = None) -> None:
+    """
+    Usage:
+        python -m src.ingest.sic_reference [PATH]    # default: SIC_REFERENCE
+    """
+    args = list(sys.argv[1:] if argv is None else argv)
+    path = Path(args[0]) if args else SIC_REFERENCE
+    entries = parse_sic_file(path)
+    if not entries:
+        raise SystemExit(f"No SIC codes found in {path}")
+
+    storage = get_storage()
+    with storage.connection() as conn:
+        storage.upsert_sic_codes(
+            conn.cursor(),
+            [(e.code, e.description, e.level, e.parent, e.section) for e in entries],
+        )
+
+    by_level: Dict[str, int] = {}
+    for e in entries:
+        by_level[e.level] = by_level.get(e.level, 0) + 1
+    print(f"Loaded {len(entries)} SIC codes from {path}: " + ", ".join(f"{k}={v}" for k, v in by_level.items()))
+
+
+if __name__ == "__main__":
+    main()
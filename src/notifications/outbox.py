@@ -0,0 +1,191 @@
+from __future__ import annotations
+
+import io
+import os
+import gzip
+import shutil
+import argparse
+import threading
+import time
+from datetime import datetime, timedelta, timezone
+from pathlib import Path
+from typing import List, Optional, Tuple
+
+from src.db.storage import Storage, get_storage
+from src.notifications.send_email import SmtpConfig, SmtpSession, build_message, smtp_config
+
+# Attempts per message before it is marked 'failed'
+EMAIL_MAX_ATTEMPTS = int(os.getenv("EMAIL_MAX_ATTEMPTS", "6"))
+
+# Retry after 1, 2, 4, ... times this, capped at EMAIL_RETRY_MAX_SECONDS
+EMAIL_RETRY_SECONDS = float(os.getenv("EMAIL_RETRY_SECONDS", "60"))
+EMAIL_RETRY_MAX_SECONDS = float(os.getenv("EMAIL_RETRY_MAX_SECONDS", "3600"))
+
+# A 'sending' claim older than this is treated as abandoned and retried
+EMAIL_LEASE_SECONDS = float(os.getenv("EMAIL_LEASE_SECONDS", "900"))
+
+# Uncompressed attachments larger than this are sent gzipped
+EMAIL_COMPRESS_BYTES = int(os.getenv("EMAIL_COMPRESS_BYTES", str(1 << 20)))
+
+_MAX_ERROR = 1000
+
+
+def _utc(dt: datetime) -> str:
+    return dt.strftime("%Y-%m-%d %H:%M:%S")
+
+
+def _now() -> datetime:
+    return datetime.now(timezone.utc)
+
+
+def retry_delay(attempts: int) -> float:
+    """Seconds to wait after the attempts-th failed attempt (1-based)."""
+    return min(EMAIL_RETRY_SECONDS * (2 ** max(attempts - 1, 0)), EMAIL_RETRY_MAX_SECONDS)
+
+
+def enqueue_email(
+    storage: Storage,
+    cur,
+    subject: str,
+    body: str,
+    attachment_path: Optional[Path] = None,
+    run_id: Optional[int] = None,
+    recipients: Optional[List[str]] = None,
+) -> int:
+    """
+    Queue one message per recipient (default EMAIL_TO) in the caller's
+    transaction, so it is sent only if that transaction commits. Returns
+    the number of rows queued.
+    """
+    if recipients is None:
+        raw = os.getenv("EMAIL_TO", "")
+        recipients = [a.strip() for a in raw.split(",") if a.strip()]
+    if not recipients:
+        raise RuntimeError("No recipients: set EMAIL_TO")
+
+    path = None if attachment_path is None else str(Path(attachment_path).resolve())
+    now = _utc(_now())
+    storage.enqueue_emails(cur, [(run_id, r, subject, body, path, now) for r in recipients])
+    return len(recipients)
+
+
+def load_attachment(path: Path, compress_over: int = EMAIL_COMPRESS_BYTES) -> Tuple[bytes, str]:
+    """
+    (bytes, filename) to attach. A plain file over compress_over bytes is
+    gzipped on the way in (x.csv -> x.csv.gz); .gz/.zip exports are sent as-is.
+    """
+    if path.suffix in (".gz", ".zip") or path.stat().st_size <= compress_over:
+        return path.read_bytes(), path.name
+
+    buf = io.BytesIO()
+    with path.open("rb") as src, gzip.GzipFile(filename=path.name, mode="wb", fileobj=buf, compresslevel=6) as gz:
+        shutil.copyfileobj(src, gz, 1 << 20)
+    return buf.getvalue(), path.name + ".gz"
+
+
+def deliver_pending(
+    storage: Storage,
+    conn,
+    config: Optional[SmtpConfig] = None,
+    session: Optional[SmtpSession] = None,
+) -> Tuple[int, int]:
+    """
+    Send every due outbox message over one SMTP session. Each message is
+    claimed before sending and its outcome committed straight after, so a
+    crash mid-batch re-sends at most the message in flight. Failures are
+    rescheduled with exponential backoff until EMAIL_MAX_ATTEMPTS.
+    Returns (sent, failed this pass).
+    """
+    cur = conn.cursor()
+    due = storage.due_emails(cur, _utc(_now()))
+    conn.commit()
+    if not due:
+        return 0, 0
+    config = config or smtp_config()
+
+    sent = failed = 0
+    attachments: dict = {}      # path -> (bytes, filename); segments often go to several recipients
+    own_session = session is None
+    smtp = session or SmtpSession(config)
+    try:
+        for message_id, recipient, subject, body, attachment_path, attempts in due:
+            now = _now()
+            if not storage.claim_email(cur, message_id, _utc(now), _utc(now + timedelta(seconds=EMAIL_LEASE_SECONDS))):
+                conn.commit()
+                continue
+            conn.commit()
+            attempts += 1
+
+            try:
+                data = filename = None
+                if attachment_path:
+                    if attachment_path not in attachments:
+                        attachments[attachment_path] = load_attachment(Path(attachment_path))
+                    data, filename = attachments[attachment_path]
+                smtp.send(build_message(config, recipient, subject, body, data, filename))
+            except Exception as e:
+                error = f"{type(e).__name__}: {e}"[:_MAX_ERROR]
+                if attempts >= EMAIL_MAX_ATTEMPTS:
+                    storage.finish_email(cur, message_id, "failed", _utc(_now()), error)
+                else:
+                    retry_at = _now() + timedelta(seconds=retry_delay(attempts))
+                    storage.finish_email(cur, message_id, "pending", _utc(retry_at), error)
+                conn.commit()
+                failed += 1
+                print(f"Email {message_id} to {recipient} failed (attempt {attempts}): {error}")
+                # The session may be unusable after an error; reconnect for the next message
+                smtp.close()
+                continue
+
+            storage.finish_email(cur, message_id, "sent", _utc(_now()))
+            conn.commit()
+            sent += 1
+    finally:
+        if own_session:
+            smtp.close()
+    return sent, failed
+
+
+def deliver_in_background(storage: Storage) -> threading.Thread:
+    """
+    Deliver the outbox on a separate thread with its own pooled connection,
+    so the caller is not held up by SMTP. The thread is not a daemon: the
+    process waits for the messages in hand before it exits. Errors are
+    printed; anything unsent stays queued for the next pass.
+    """
+
+    def run() -> None:
+        try:
+            with storage.connection() as conn:
+                sent, failed = deliver_pending(storage, conn)
+            print(f"Outbox: sent={sent} failed={failed}")
+        except Exception as e:
+            print(f"Outbox delivery did not run: {type(e).__name__}: {e}")
+
+    t = threading.Thread(target=run, name="email-outbox")
+    t.start()
+    return t
+
+
+def main(argv: Optional[List[str]] = None) -> None:
+    """
+    Usage:
+        python -m src.notifications.outbox                 # one pass over due messages
+        python -m src.notifications.outbox --loop 60       # keep polling every 60 s
+    """
+    parser = argparse.ArgumentParser(description="Deliver queued email from email_outbox")
+    parser.add_argument("--loop", type=float, metavar="SECONDS", help="poll the outbox at this interval")
+    args = parser.parse_args(argv)
+
+    storage = get_storage()
+    while True:
+        with storage.connection() as conn:
+            sent, failed = deliver_pending(storage, conn)
+        print(f"Outbox: sent={sent} failed={failed}")
+        if args.loop is None:
+            return
+        time.sleep(args.loop)
+
+
+if __name__ == "__main__":
+    main()
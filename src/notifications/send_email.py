@@ -2,7 +2,9 @@ from __future__ import annotations
 
 import os
 import smtplib
+from dataclasses import dataclass
 from email.message import EmailMessage
+from typing import Optional
 
 
 def _load_dotenv_if_present() -> None:
@@ -17,7 +19,29 @@ def _load_dotenv_if_present() -> None:
     load_dotenv(override=False)
 
 
-def send_csv_email(csv_path: str, subject: str, body: str) -> None:
+@dataclass(frozen=True)
+class SmtpConfig:
+    host: str
+    port: int
+    user: str
+    password: str
+    sender: str
+    recipients: tuple
+    # 'ssl' (implicit, port 465), 'starttls' or 'none' (plain; local relays and test servers)
+    security: str
+
+    def login_required(self) -> bool:
+        return bool(self.user)
+
+
+def smtp_config() -> SmtpConfig:
+    """
+    SMTP settings from the environment (.env):
+    SMTP_HOST, SMTP_PORT (default 587), SMTP_USER, SMTP_PASS, SMTP_FROM,
+    EMAIL_TO (comma-separated) and SMTP_SECURITY (default 'ssl' on port 465,
+    'starttls' otherwise). With SMTP_SECURITY=none, user and password may
+    be left empty, e.g. for a local relay or a test SMTP server.
+    """
     _load_dotenv_if_present()
 
     smtp_host = os.getenv("SMTP_HOST", "").strip()
@@ -36,32 +60,109 @@ def send_csv_email(csv_path: str, subject: str, body: str) -> None:
         except ValueError as e:
             raise RuntimeError(f"SMTP_PORT must be an integer, got: {smtp_port_raw!r}") from e
 
-    if not (smtp_host and smtp_user and smtp_pass and email_to):
+    security = os.getenv("SMTP_SECURITY", "").strip().lower() or ("ssl" if smtp_port == 465 else "starttls")
+    if security not in ("ssl", "starttls", "none"):
+        raise RuntimeError(f"SMTP_SECURITY must be ssl, starttls or none, got: {security!r}")
+
+    credentials_ok = security == "none" or (smtp_user and smtp_pass)
+    if not (smtp_host and email_to and email_from and credentials_ok):
         raise RuntimeError(
             "Missing SMTP config. Check .env: SMTP_HOST/SMTP_PORT/SMTP_USER/SMTP_PASS/EMAIL_TO"
         )
 
+    recipients = tuple(a.strip() for a in email_to.split(",") if a.strip())
+    return SmtpConfig(smtp_host, smtp_port, smtp_user, smtp_pass, email_from, recipients, security)
+
+
+class SmtpSession:
+    """
+    One SMTP connection for any number of messages. Connects on the first
+    send() and quits on close(); a dropped connection is reopened once.
+
+        with SmtpSession(config) as smtp:
+            smtp.send(msg1)
+            smtp.send(msg2)
+    """
+
+    def __init__(self, config: SmtpConfig, timeout: float = 60.0) -> None:
+        self.config = config
+        self.timeout = timeout
+        self._server: Optional[smtplib.SMTP] = None
+
+    def _open(self) -> smtplib.SMTP:
+        c = self.config
+        server: smtplib.SMTP
+        if c.security == "ssl":
+            # Implicit SSL
+            server = smtplib.SMTP_SSL(c.host, c.port, timeout=self.timeout)
+        else:
+            server = smtplib.SMTP(c.host, c.port, timeout=self.timeout)
+            if c.security == "starttls":
+                server.ehlo()
+                server.starttls()
+                server.ehlo()
+        if c.login_required():
+            server.login(c.user, c.password)
+        return server
+
+    def send(self, msg: EmailMessage) -> None:
+        if self._server is None:
+            self._server = self._open()
+        try:
+            self._server.send_message(msg)
+        except smtplib.SMTPServerDisconnected:
+            self._server = self._open()
+            self._server.send_message(msg)
+
+    def close(self) -> None:
+        if self._server is not None:
+            try:
+                self._server.quit()
+            except smtplib.SMTPException:
+                self._server.close()
+            self._server = None
+
+    def __enter__(self) -> "SmtpSession":
+        return self
+
+    def __exit__(self, *exc) -> None:
+        self.close()
+
+
+def attachment_type(filename: str) -> tuple:
+    """(maintype, subtype) for an export file."""
+    if filename.endswith(".gz"):
+        return "application", "gzip"
+    if filename.endswith(".zip"):
+        return "application", "zip"
+    return "text", "csv"
+
+
+def build_message(
+    config: SmtpConfig,
+    recipient: str,
+    subject: str,
+    body: str,
+    attachment: Optional[bytes] = None,
+    filename: Optional[str] = None,
+) -> EmailMessage:
     msg = EmailMessage()
     msg["Subject"] = subject
-    msg["From"] = email_from
-    msg["To"] = email_to
+    msg["From"] = config.sender
+    msg["To"] = recipient
     msg.set_content(body)
+    if attachment is not None and filename:
+        maintype, subtype = attachment_type(filename)
+        msg.add_attachment(attachment, maintype=maintype, subtype=subtype, filename=filename)
+    return msg
+
 
-    filename = os.path.basename(csv_path)
+def send_csv_email(csv_path: str, subject: str, body: str) -> None:
+    """Send one message with csv_path attached to EMAIL_TO, inline. The runs queue through outbox.py instead."""
+    config = smtp_config()
     with open(csv_path, "rb") as f:
-        msg.add_attachment(f.read(), maintype="text", subtype="csv", filename=filename)
-
-    # --- Connect ---
-    if smtp_port == 465:
-        # Implicit SSL
-        with smtplib.SMTP_SSL(smtp_host, smtp_port) as server:
-            server.login(smtp_user, smtp_pass)
-            server.send_message(msg)
-    else:
-        # STARTTLS (587 recommended)
-        with smtplib.SMTP(smtp_host, smtp_port) as server:
-            server.ehlo()
-            server.starttls()
-            server.ehlo()
-            server.login(smtp_user, smtp_pass)
-            server.send_message(msg)
+        data = f.read()
+    msg = build_message(config, ", ".join(config.recipients), subject, body, data, os.path.basename(csv_path))
+
+    with SmtpSession(config) as smtp:
+        smtp.send(msg)
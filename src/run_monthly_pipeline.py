@@ -1,13 +1,31 @@
 from __future__ import annotations
 
+import os
+
 from src.ingest.run_monthly_incremental import main as ingest_main
 from src.analytics.export_new_companies_csv import main as export_main
 
+# Refresh the partitioned Parquet dataset (src/analytics/parquet_export.py) after each run
+EXPORT_PARQUET = os.getenv("EXPORT_PARQUET", "0") == "1"
+
+# Segment spec (JSON) for the single-pass segmented export; blank to skip
+EXPORT_SEGMENTS = os.getenv("EXPORT_SEGMENTS", "").strip()
+
 
 def main() -> None:
-    ingest_main()
+    run_id = ingest_main()
     export_main()
 
+    if EXPORT_PARQUET:
+        from src.analytics.parquet_export import main as parquet_main
+
+        parquet_main(["--run", str(run_id)])
+
+    if EXPORT_SEGMENTS:
+        from src.analytics.export_segments import main as segments_main
+
+        segments_main([EXPORT_SEGMENTS])
+
 
 if __name__ == "__main__":
     main()
@@ -0,0 +1,142 @@
+from __future__ import annotations
+
+import os
+import json
+from typing import Dict, List, Optional, Tuple
+
+import pandas as pd
+
+from src.db.storage import Storage
+
+# Check every page before it is written; failing items go to quarantined_items
+VALIDATE_ITEMS = os.getenv("VALIDATE_ITEMS", "1") == "1"
+
+# Column widths in sql/schema.sql
+MAX_LENGTHS = {
+    "company_name": 255,
+    "company_status": 50,
+    "company_type": 50,
+    "locality": 100,
+    "region": 100,
+    "postal_code": 20,
+    "country": 50,
+}
+
+COMPANY_NUMBER_RE = r"[A-Z0-9]{8}"
+UK_POSTCODE_RE = r"[A-Z]{1,2}[0-9][0-9A-Z]? ?[0-9][A-Z]{2}"
+SIC_CODE_RE = r"[0-9]{4,5}"
+
+# Registered office countries whose postcodes must look like UK ones
+UK_COUNTRIES = {
+    "",
+    "UNITED KINGDOM",
+    "UK",
+    "ENGLAND",
+    "WALES",
+    "SCOTLAND",
+    "NORTHERN IRELAND",
+    "ENGLAND AND WALES",
+    "GREAT BRITAIN",
+}
+
+
+def _text(values: list) -> pd.Series:
+    """Strings (stripped) with None for missing or blank, whatever the JSON gave us."""
+    out = []
+    for v in values:
+        s = None if v is None else str(v).strip()
+        out.append(s or None)
+    return pd.Series(out, dtype=object)
+
+
+def _frame(items: List[dict]) -> pd.DataFrame:
+    addrs = [it.get("registered_office_address") or {} for it in items]
+    return pd.DataFrame({
+        "company_number": _text([it.get("company_number") for it in items]),
+        "company_name": _text([it.get("company_name") or it.get("title") for it in items]),
+        "company_status": _text([it.get("company_status") for it in items]),
+        "company_type": _text([it.get("company_type") for it in items]),
+        "date_of_creation": _text([it.get("date_of_creation") for it in items]),
+        "locality": _text([a.get("locality") for a in addrs]),
+        "region": _text([a.get("region") for a in addrs]),
+        "postal_code": _text([a.get("postal_code") for a in addrs]),
+        "country": _text([a.get("country") for a in addrs]),
+        "sic_codes": pd.Series([it.get("sic_codes") or [] for it in items], dtype=object),
+    })
+
+
+def _matches(values: pd.Series, pattern: str) -> pd.Series:
+    return values.fillna("").str.fullmatch(pattern).astype(bool)
+
+
+def check_page(items: List[dict]) -> pd.DataFrame:
+    """
+    One boolean column per rule, one row per item (True = rule failed),
+    computed column-wise over the whole page.
+    """
+    df = _frame(items)
+    checks: Dict[str, pd.Series] = {}
+
+    number = df["company_number"]
+    checks["missing_company_number"] = number.isna()
+    checks["bad_company_number"] = number.notna() & ~_matches(number, COMPANY_NUMBER_RE)
+
+    checks["missing_company_name"] = df["company_name"].isna()
+
+    created = df["date_of_creation"]
+    parsed = pd.to_datetime(created, format="%Y-%m-%d", errors="coerce")
+    checks["missing_date_of_creation"] = created.isna()
+    checks["bad_date_of_creation"] = created.notna() & parsed.isna()
+
+    for column, limit in MAX_LENGTHS.items():
+        checks[f"{column}_too_long"] = df[column].fillna("").str.len() > limit
+
+    postcode = df["postal_code"].str.upper()
+    uk = df["country"].fillna("").str.upper().isin(UK_COUNTRIES)
+    checks["bad_postal_code"] = postcode.notna() & uk & ~_matches(postcode, UK_POSTCODE_RE)
+
+    sics = df["sic_codes"].explode().dropna().astype(str)
+    bad_sic = ~_matches(sics, SIC_CODE_RE)
+    checks["bad_sic_code"] = bad_sic.groupby(level=0).any().reindex(df.index, fill_value=False)
+
+    return pd.DataFrame({name: mask.to_numpy(dtype=bool) for name, mask in checks.items()})
+
+
+def validate_page(items: List[dict]) -> Tuple[List[dict], List[Tuple[dict, str]]]:
+    """(clean items, [(rejected item, comma-separated reasons)]) for one page."""
+    if not items:
+        return [], []
+    checks = check_page(items)
+    failed = checks.any(axis=1).to_numpy()
+    if not failed.any():
+        return list(items), []
+
+    clean = [it for it, bad in zip(items, failed) if not bad]
+    rejected = [
+        (items[i], ",".join(checks.columns[checks.iloc[i].to_numpy()]))
+        for i in failed.nonzero()[0]
+    ]
+    return clean, rejected
+
+
+def quarantine_invalid(storage: Storage, cur, items: List[dict], run_id: Optional[int]) -> Tuple[List[dict], int]:
+    """
+    Validation stage in front of the writers: returns (clean items, number
+    quarantined). Rejected items are stored whole in quarantined_items with
+    their reasons, in the caller's transaction.
+    """
+    if not VALIDATE_ITEMS or not items:
+        return items, 0
+
+    clean, rejected = validate_page(items)
+    if rejected:
+        storage.insert_quarantine(cur, [
+            (
+                run_id,
+                str(it.get("company_number") or "")[:20] or None,
+                reasons,
+                json.dumps(it, default=str, ensure_ascii=False),
+            )
+            for it, reasons in rejected
+        ])
+    return clean, len(rejected)